@@ -0,0 +1,47 @@
+import { useCallback, useRef, useState } from 'react';
+import axiosInstance from './axios';
+
+const EMPTY_PAGE = { rows: [], next: null, previous: null, total: null };
+
+// One page of a keyset-paginated list endpoint, its next/previous cursor links
+// and the row count for the endpoints that return one
+export const fetchPage = async (url, resultsKey = 'results') => {
+  const response = await axiosInstance.get(url);
+  return {
+    rows: response.data[resultsKey] || [],
+    next: response.data.next,
+    previous: response.data.previous,
+    total: response.data.total ?? null,
+  };
+};
+
+// Every seat of one bus. The seat map needs the whole bus and the rows are
+// bounded by its capacity, so this is the one list read past its first page.
+export const fetchBusSeats = async (busId) => {
+  const seats = [];
+  let next = `/seats/?bus=${busId}&page_size=200`;
+  while (next) {
+    const page = await fetchPage(next);
+    seats.push(...page.rows);
+    next = page.next;
+  }
+  return seats;
+};
+
+// The page of a list endpoint on screen. load() with no url reloads the
+// current page, load(next) / load(previous) moves with the cursor links.
+export const useCursorPages = (url, resultsKey = 'results') => {
+  const [page, setPage] = useState(EMPTY_PAGE);
+  const current = useRef(url);
+
+  const load = useCallback(async (pageUrl = current.current) => {
+    const result = await fetchPage(pageUrl, resultsKey);
+    current.current = pageUrl;
+    setPage(result);
+    return result;
+  }, [resultsKey]);
+
+  const clear = useCallback(() => setPage(EMPTY_PAGE), []);
+
+  return { ...page, load, clear };
+};
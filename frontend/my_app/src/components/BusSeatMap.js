@@ -3,7 +3,7 @@ import { Card } from './ui/Card';
 import { Badge } from './ui/Badge';
 import { User, X, MapPin, DollarSign, GraduationCap, Mail, Phone } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
-import axiosInstance from '../api/axios';
+import { fetchBusSeats } from '../api/pagination';
 
 const BusSeatMap = ({ busId, isAdmin = false, userRole = 'DRIVER' }) => {
   const [seats, setSeats] = useState([]);
@@ -16,11 +16,11 @@ const BusSeatMap = ({ busId, isAdmin = false, userRole = 'DRIVER' }) => {
 
   const fetchSeats = async () => {
     try {
-      const response = await axiosInstance.get(`/seats/?bus=${busId}`);
-      console.log('Raw API response:', response.data);
+      const seatRows = await fetchBusSeats(busId);
+      console.log('Raw API response:', seatRows);
       
       // Sort seats by seat_number and ensure unique seats
-      const sortedSeats = response.data
+      const sortedSeats = seatRows
         .sort((a, b) => a.seat_number - b.seat_number)
         .filter((seat, index, self) => 
           index === self.findIndex((s) => s.seat_number === seat.seat_number)
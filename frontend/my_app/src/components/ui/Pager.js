@@ -0,0 +1,32 @@
+import React from 'react';
+import { ChevronLeft, ChevronRight } from 'lucide-react';
+import { Button } from './Button';
+
+export function Pager({ previous, next, onPage, className = '' }) {
+  if (!previous && !next) {
+    return null;
+  }
+
+  return (
+    <div className={`flex items-center justify-end gap-2 ${className}`}>
+      <Button
+        variant="outline"
+        size="sm"
+        leftIcon={<ChevronLeft className="h-4 w-4" />}
+        disabled={!previous}
+        onClick={() => onPage(previous)}
+      >
+        Previous
+      </Button>
+      <Button
+        variant="outline"
+        size="sm"
+        rightIcon={<ChevronRight className="h-4 w-4" />}
+        disabled={!next}
+        onClick={() => onPage(next)}
+      >
+        Next
+      </Button>
+    </div>
+  );
+}
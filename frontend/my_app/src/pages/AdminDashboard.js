@@ -1,18 +1,29 @@
 import React, { useState, useEffect } from 'react';
 import axiosInstance from '../api/axios';
+import { fetchBusSeats, fetchPage, useCursorPages } from '../api/pagination';
 import { Card } from '../components/ui/Card';
 import { Button } from '../components/ui/Button';
 import { Input } from '../components/ui/Input';
 import { Badge } from '../components/ui/Badge';
+import { Pager } from '../components/ui/Pager';
 import { Bus, Users, UserCheck, AlertTriangle, Plus, X, ArrowLeft, Zap, UserPlus, User, GraduationCap, MapPin, Phone, Mail, Calendar, MessageSquare, Bell } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
 import RealisticBusMap from '../components/RealisticBusMap';
 
+const BUSES_URL = '/buses/';
+const STUDENTS_URL = '/admin/students/';
+const ALERTS_URL = '/emergency-alerts/';
+const ACTIVE_ALERTS_URL = '/emergency-alerts/?status=ACTIVE&page_size=200';
+const LEAVES_URL = '/driver-leaves/';
+const QUERIES_URL = '/student-queries/';
+
 const AdminDashboard = () => {
   const [stats, setStats] = useState(null);
-  const [buses, setBuses] = useState([]);
+  const busPages = useCursorPages(BUSES_URL);
+  const buses = busPages.rows;
   const [drivers, setDrivers] = useState([]);
-  const [students, setStudents] = useState([]);
+  const studentPages = useCursorPages(STUDENTS_URL, 'students');
+  const students = studentPages.rows;
   const [selectedBus, setSelectedBus] = useState(null);
   const [selectedDriver, setSelectedDriver] = useState(null);
   const [selectedStudent, setSelectedStudent] = useState(null);
@@ -32,13 +43,17 @@ const AdminDashboard = () => {
   const [currentView, setCurrentView] = useState('buses'); // 'buses', 'drivers', 'students', 'alerts', 'leaves', 'queries'
   const [feeFilter, setFeeFilter] = useState('all'); // 'all', 'paid', 'unpaid'
   const [selectedCollege, setSelectedCollege] = useState(null);
-  const [alerts, setAlerts] = useState([]);
-  const [leaveRequests, setLeaveRequests] = useState([]);
+  const alertPages = useCursorPages(ALERTS_URL);
+  const alerts = alertPages.rows;
+  const leavePages = useCursorPages(LEAVES_URL);
+  const leaveRequests = leavePages.rows;
   const [selectedAlert, setSelectedAlert] = useState(null);
   const [selectedLeave, setSelectedLeave] = useState(null);
-  const [studentQueries, setStudentQueries] = useState([]);
+  const queryPages = useCursorPages(QUERIES_URL);
+  const studentQueries = queryPages.rows;
   const [selectedQuery, setSelectedQuery] = useState(null);
   const [activeAlertsCount, setActiveAlertsCount] = useState(0);
+  const [moreActiveAlerts, setMoreActiveAlerts] = useState(false);
   const [selectedLeaveForApproval, setSelectedLeaveForApproval] = useState(null);
   const [substituteDriverId, setSubstituteDriverId] = useState('');
   const [busForm, setBusForm] = useState({
@@ -52,7 +67,7 @@ const AdminDashboard = () => {
     loadDashboard();
     loadBuses();
     loadDrivers();
-    loadAlerts(); // Load alerts on mount to get count
+    loadActiveAlertsCount();
   }, []);
 
   useEffect(() => {
@@ -67,37 +82,44 @@ const AdminDashboard = () => {
     }
   }, [currentView]);
 
-  const loadAlerts = async () => {
+  const loadAlerts = async (pageUrl) => {
     try {
-      const response = await axiosInstance.get('/emergency-alerts/');
-      setAlerts(response.data);
-      // Count active alerts
-      const activeCount = response.data.filter(a => a.status === 'ACTIVE').length;
-      setActiveAlertsCount(activeCount);
+      await alertPages.load(pageUrl);
     } catch (error) {
       console.error('Error loading alerts:', error);
-      setAlerts([]);
+      alertPages.clear();
+    }
+    loadActiveAlertsCount();
+  };
+
+  // Only the badge count, from one page of the active alerts
+  const loadActiveAlertsCount = async () => {
+    try {
+      const page = await fetchPage(ACTIVE_ALERTS_URL);
+      setActiveAlertsCount(page.rows.length);
+      setMoreActiveAlerts(Boolean(page.next));
+    } catch (error) {
+      console.error('Error loading active alerts:', error);
       setActiveAlertsCount(0);
+      setMoreActiveAlerts(false);
     }
   };
 
-  const loadLeaveRequests = async () => {
+  const loadLeaveRequests = async (pageUrl) => {
     try {
-      const response = await axiosInstance.get('/driver-leaves/');
-      setLeaveRequests(response.data);
+      await leavePages.load(pageUrl);
     } catch (error) {
       console.error('Error loading leave requests:', error);
-      setLeaveRequests([]);
+      leavePages.clear();
     }
   };
 
-  const loadStudentQueries = async () => {
+  const loadStudentQueries = async (pageUrl) => {
     try {
-      const response = await axiosInstance.get('/student-queries/');
-      setStudentQueries(response.data);
+      await queryPages.load(pageUrl);
     } catch (error) {
       console.error('Error loading student queries:', error);
-      setStudentQueries([]);
+      queryPages.clear();
     }
   };
 
@@ -110,10 +132,9 @@ const AdminDashboard = () => {
     }
   };
 
-  const loadBuses = async () => {
+  const loadBuses = async (pageUrl) => {
     try {
-      const response = await axiosInstance.get('/buses/');
-      setBuses(response.data);
+      await busPages.load(pageUrl);
     } catch (error) {
       console.error('Error loading buses:', error);
     }
@@ -141,25 +162,15 @@ const AdminDashboard = () => {
     }
   };
 
-  const loadStudents = async () => {
+  const loadStudents = async (pageUrl) => {
     try {
       console.log('Loading students...');
-      const response = await axiosInstance.get('/admin/students/');
-      console.log('Students response:', response);
-      console.log('Students data:', response.data);
-      
-      if (response.data && response.data.students) {
-        const studentsList = response.data.students;
-        console.log('Students list:', studentsList);
-        setStudents(studentsList);
-      } else {
-        console.error('No students in response');
-        setStudents([]);
-      }
+      const page = await studentPages.load(pageUrl);
+      console.log('Students list:', page.rows);
     } catch (error) {
       console.error('Error loading students:', error);
       console.error('Error response:', error.response);
-      setStudents([]);
+      studentPages.clear();
     }
   };
 
@@ -194,8 +205,7 @@ const AdminDashboard = () => {
   const loadBusSeats = async (bus) => {
     setSelectedBus(bus);
     try {
-      const response = await axiosInstance.get(`/seats/?bus=${bus.id}`);
-      setBusSeats(response.data);
+      setBusSeats(await fetchBusSeats(bus.id));
     } catch (error) {
       console.error('Error loading seats:', error);
     }
@@ -420,7 +430,7 @@ const AdminDashboard = () => {
               Emergency Alerts
               {activeAlertsCount > 0 && (
                 <span className="absolute -top-1 -right-1 h-5 w-5 bg-red-500 text-white text-xs rounded-full flex items-center justify-center animate-pulse">
-                  {activeAlertsCount}
+                  {activeAlertsCount}{moreActiveAlerts ? '+' : ''}
                 </span>
               )}
             </Button>
@@ -585,6 +595,7 @@ const AdminDashboard = () => {
                     <p className="text-gray-400">No buses yet. Create your first bus!</p>
                   </div>
                 )}
+                <Pager className="mt-6" previous={busPages.previous} next={busPages.next} onPage={loadBuses} />
               </Card>
             </motion.div>
           ) : currentView === 'buses' && selectedBus ? (
@@ -1130,6 +1141,7 @@ const AdminDashboard = () => {
                     ))}
                   </div>
                 )}
+                <Pager className="mt-6" previous={alertPages.previous} next={alertPages.next} onPage={loadAlerts} />
               </Card>
             </motion.div>
           ) : currentView === 'leaves' ? (
@@ -1267,6 +1279,7 @@ const AdminDashboard = () => {
                     ))}
                   </div>
                 )}
+                <Pager className="mt-6" previous={leavePages.previous} next={leavePages.next} onPage={loadLeaveRequests} />
               </Card>
             </motion.div>
           ) : currentView === 'queries' ? (
@@ -1411,6 +1424,7 @@ const AdminDashboard = () => {
                     ))}
                   </div>
                 )}
+                <Pager className="mt-6" previous={queryPages.previous} next={queryPages.next} onPage={loadStudentQueries} />
               </Card>
             </motion.div>
           ) : currentView === 'students' ? (
@@ -1448,7 +1462,7 @@ const AdminDashboard = () => {
                     }}
                     size="sm"
                   >
-                    All Students ({students.length})
+                    All Students ({studentPages.total ?? students.length})
                   </Button>
                   <Button
                     variant={feeFilter === 'paid' ? 'success' : 'outline'}
@@ -1476,12 +1490,12 @@ const AdminDashboard = () => {
                     <Button
                       variant="warning"
                       onClick={async () => {
-                        if (window.confirm(`Send fee reminder to all ${students.filter(s => s.has_unpaid_fees).length} students with unpaid fees?`)) {
+                        if (window.confirm('Send fee reminder to every student with unpaid fees?')) {
                           try {
                             const response = await axiosInstance.post('/admin/send-bulk-fee-reminder/', {
                               filter: 'all_unpaid'
                             });
-                            alert(`✅ ${response.data.message}\n\nReminders sent: ${response.data.reminders_sent}`);
+                            alert(`✅ ${response.data.message}\n\nReminders sent so far: ${response.data.sent_count}`);
                           } catch (error) {
                             console.error('Error sending bulk reminder:', error);
                             alert(error.response?.data?.error || '❌ Error sending reminders');
@@ -1595,6 +1609,15 @@ const AdminDashboard = () => {
                     </div>
                   </div>
                 )}
+                <Pager
+                  className="mt-6"
+                  previous={studentPages.previous}
+                  next={studentPages.next}
+                  onPage={(pageUrl) => {
+                    setSelectedCollege(null);
+                    loadStudents(pageUrl);
+                  }}
+                />
               </Card>
             </motion.div>
           ) : null}
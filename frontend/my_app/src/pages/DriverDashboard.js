@@ -1,13 +1,17 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axiosInstance from '../api/axios';
+import { useCursorPages } from '../api/pagination';
 import { Card } from '../components/ui/Card';
 import { Button } from '../components/ui/Button';
 import { Badge } from '../components/ui/Badge';
+import { Pager } from '../components/ui/Pager';
 import BusSeatMap from '../components/BusSeatMap';
 import { Bus, DollarSign, CheckCircle, MapPin, AlertCircle, Users, ClipboardCheck, XCircle } from 'lucide-react';
 import { motion } from 'framer-motion';
 
+const LEAVES_URL = '/driver-leaves/';
+
 const DriverDashboard = () => {
   const navigate = useNavigate();
   const [dashboard, setDashboard] = useState(null);
@@ -17,7 +21,8 @@ const DriverDashboard = () => {
   const [user, setUser] = useState(null);
   const [leaveForm, setLeaveForm] = useState({ start_date: '', end_date: '', reason: '' });
   const [applyingLeave, setApplyingLeave] = useState(false);
-  const [pendingLeaves, setPendingLeaves] = useState([]);
+  const leavePages = useCursorPages(LEAVES_URL);
+  const pendingLeaves = leavePages.rows;
 
   // Tracking State
   const [isTracking, setIsTracking] = useState(false);
@@ -64,10 +69,9 @@ const DriverDashboard = () => {
     }
   };
 
-  const loadPendingLeaves = async () => {
+  const loadPendingLeaves = async (pageUrl) => {
     try {
-      const response = await axiosInstance.get('/driver-leaves/');
-      setPendingLeaves(response.data);
+      await leavePages.load(pageUrl);
     } catch (error) {
       console.error('Error loading leaves:', error);
     }
@@ -170,7 +174,7 @@ const DriverDashboard = () => {
       // Clear the form inputs
       document.querySelectorAll('input[type="date"]').forEach(input => input.value = '');
       document.querySelector('textarea').value = '';
-      loadPendingLeaves(); // Reload leaves to show the new request
+      loadPendingLeaves(LEAVES_URL); // Reload the first page to show the new request
     } catch (error) {
       console.error('Error applying for leave:', error);
       window.alert(error.response?.data?.error || '❌ Error submitting leave request');
@@ -539,6 +543,12 @@ const DriverDashboard = () => {
                             </div>
                           ))}
                         </div>
+                        <Pager
+                          className="mt-3"
+                          previous={leavePages.previous}
+                          next={leavePages.next}
+                          onPage={loadPendingLeaves}
+                        />
                       </div>
                     )}
                   </div>
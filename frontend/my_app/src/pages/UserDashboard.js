@@ -1,16 +1,23 @@
 import React, { useState, useEffect } from 'react';
 import axiosInstance from '../api/axios';
+import { useCursorPages } from '../api/pagination';
 import { Card } from '../components/ui/Card';
 import { Button } from '../components/ui/Button';
 import { Input } from '../components/ui/Input';
 import { Badge } from '../components/ui/Badge';
+import { Pager } from '../components/ui/Pager';
 import { Bus, Bell, MessageSquare, MapPin, X, Send } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
 
+const NOTIFICATIONS_URL = '/notifications/';
+const QUERIES_URL = '/student-queries/';
+
 const UserDashboard = () => {
   const [dashboard, setDashboard] = useState(null);
-  const [notifications, setNotifications] = useState([]);
-  const [queries, setQueries] = useState([]);
+  const notificationPages = useCursorPages(NOTIFICATIONS_URL);
+  const queryPages = useCursorPages(QUERIES_URL);
+  const notifications = notificationPages.rows;
+  const queries = queryPages.rows;
   const [showQueryForm, setShowQueryForm] = useState(false);
   const [queryForm, setQueryForm] = useState({
     subject: '',
@@ -33,19 +40,17 @@ const UserDashboard = () => {
     }
   };
 
-  const loadNotifications = async () => {
+  const loadNotifications = async (pageUrl) => {
     try {
-      const response = await axiosInstance.get('/notifications/');
-      setNotifications(response.data);
+      await notificationPages.load(pageUrl);
     } catch (error) {
       console.error('Error loading notifications:', error);
     }
   };
 
-  const loadQueries = async () => {
+  const loadQueries = async (pageUrl) => {
     try {
-      const response = await axiosInstance.get('/student-queries/');
-      setQueries(response.data);
+      await queryPages.load(pageUrl);
     } catch (error) {
       console.error('Error loading queries:', error);
     }
@@ -67,7 +72,8 @@ const UserDashboard = () => {
       await axiosInstance.post('/student-queries/submit/', queryForm);
       setShowQueryForm(false);
       setQueryForm({ subject: '', message: '', anonymous: false });
-      loadQueries();
+      // The new query is the newest, on the first page
+      loadQueries(QUERIES_URL);
       loadDashboard();
       alert('Query submitted successfully');
     } catch (error) {
@@ -240,6 +246,12 @@ const UserDashboard = () => {
                 </div>
               )}
             </div>
+            <Pager
+              className="mt-4"
+              previous={notificationPages.previous}
+              next={notificationPages.next}
+              onPage={loadNotifications}
+            />
           </Card>
 
           {/* Queries */}
@@ -382,6 +394,12 @@ const UserDashboard = () => {
                 </div>
               )}
             </div>
+            <Pager
+              className="mt-4"
+              previous={queryPages.previous}
+              next={queryPages.next}
+              onPage={loadQueries}
+            />
           </Card>
         </div>
       </div>
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Bus, Seat, Attendance, Notification, Query, Fee, EmergencyAlert, DriverLeave
+from .models import User, Bus, Seat, Attendance, Notification, NotificationOutbox, Query, Fee, FeePayment, EmergencyAlert, DriverLeave
 
 
 @admin.register(User)
@@ -49,6 +49,14 @@ class NotificationAdmin(admin.ModelAdmin):
     raw_id_fields = ['user', 'created_by']
 
 
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ['audience', 'target', 'status', 'recipients', 'attempts', 'created_at', 'dispatched_at']
+    list_filter = ['status', 'audience']
+    search_fields = ['message']
+    raw_id_fields = ['created_by']
+
+
 @admin.register(Query)
 class QueryAdmin(admin.ModelAdmin):
     list_display = ['user', 'driver', 'subject', 'status', 'created_at']
@@ -66,6 +74,15 @@ class FeeAdmin(admin.ModelAdmin):
     date_hierarchy = 'due_date'
 
 
+@admin.register(FeePayment)
+class FeePaymentAdmin(admin.ModelAdmin):
+    list_display = ['transaction_id', 'fee', 'amount', 'payment_method', 'paid_date', 'source', 'recorded_by']
+    list_filter = ['source', 'payment_method', 'paid_date']
+    search_fields = ['transaction_id', 'fee__user__username']
+    raw_id_fields = ['fee', 'recorded_by']
+    date_hierarchy = 'paid_date'
+
+
 
 @admin.register(EmergencyAlert)
 class EmergencyAlertAdmin(admin.ModelAdmin):
@@ -0,0 +1,380 @@
+from collections import defaultdict
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .distance import coordinate_array, distance_matrix, distances_to_university
+from .fee_balances import refresh_fee_balances
+from .fee_generation import insert_unbilled_fees
+from .fees import (
+    DEFAULT_FEE_DISTANCE_KM, calculate_bus_fee_from_distance, calculate_driver_salary_from_distance,
+    current_fee_period, fee_assigned_message
+)
+from .models import Bus, Seat, User, Fee, Notification
+from .notifications import notifications_created
+from .spatial import bus_index
+
+
+WRITE_BATCH_SIZE = 1000
+
+
+class _TransportationSolver:
+    """
+    Min-cost flow from students to buses by successive shortest paths.
+
+    Students are added one at a time. Each one follows the cheapest path
+    through the residual graph of buses, where an edge a -> b moves the
+    student of bus a that is cheapest to move over to bus b, ending at the
+    first bus with a free seat. Node potentials keep the reduced edge costs
+    non-negative so every path is found with Dijkstra on the small bus graph,
+    and only the rows of buses along the path need recomputing afterwards.
+    """
+
+    def __init__(self, costs, capacities):
+        self.costs = costs
+        self.capacities = capacities
+        n_buses = len(capacities)
+        self.members = [[] for _ in range(n_buses)]
+        self.potentials = np.zeros(n_buses)
+        # edge_costs[a, b]: cheapest cost change of moving one student from a to b
+        self.edge_costs = np.full((n_buses, n_buses), np.inf)
+        self.edge_students = np.zeros((n_buses, n_buses), dtype=int)
+        self.assigned = [-1] * len(costs)
+
+    def _refresh_edges(self, bus):
+        members = self.members[bus]
+        if not members:
+            self.edge_costs[bus] = np.inf
+            return
+        rows = self.costs[members]
+        deltas = rows - rows[:, bus][:, np.newaxis]
+        best = deltas.argmin(axis=0)
+        self.edge_costs[bus] = deltas[best, np.arange(len(self.capacities))]
+        self.edge_costs[bus, bus] = np.inf
+        self.edge_students[bus] = np.asarray(members)[best]
+
+    def add(self, student):
+        potentials = self.potentials
+        distances = self.costs[student] - potentials
+        previous = np.full(len(self.capacities), -1)
+        done = np.zeros(len(self.capacities), dtype=bool)
+        target = None
+        while True:
+            bus = int(np.where(done, np.inf, distances).argmin())
+            if done[bus] or not np.isfinite(distances[bus]):
+                break
+            if len(self.members[bus]) < self.capacities[bus]:
+                target = bus
+                break
+            done[bus] = True
+            relaxed = distances[bus] + self.edge_costs[bus] + potentials[bus] - potentials
+            improved = (relaxed < distances) & ~done
+            distances[improved] = relaxed[improved]
+            previous[improved] = bus
+        if target is None:
+            return
+
+        self.potentials = potentials + np.minimum(distances, distances[target])
+
+        # Shift students back along the path, then seat the new one
+        bus = target
+        changed = [bus]
+        while previous[bus] >= 0:
+            source = int(previous[bus])
+            moved = int(self.edge_students[source, bus])
+            self.members[source].remove(moved)
+            self.members[bus].append(moved)
+            self.assigned[moved] = bus
+            bus = source
+            changed.append(bus)
+        self.members[bus].append(student)
+        self.assigned[student] = bus
+        for bus in changed:
+            self._refresh_edges(bus)
+
+
+def solve_capacitated_assignment(costs, capacities):
+    """
+    Assign rows (students) to columns (buses) minimising total cost, with at
+    most capacities[j] rows per column. NaN costs mark forbidden pairs.
+
+    Seating as many students as possible comes first, then total cost: an
+    "unseated" column with unlimited room costs more than any chain of moves
+    that could make space on a real bus.
+
+    Returns a list with the assigned column index for every row, -1 if unseated.
+    """
+    n_students, n_buses = costs.shape
+    if not n_students or not n_buses:
+        return [-1] * n_students
+
+    costs = np.where(np.isnan(costs), np.inf, costs)
+    reachable = np.isfinite(costs)
+    if not reachable.any():
+        return [-1] * n_students
+    unseated_cost = (float(costs[reachable].max()) + 1) * (n_buses + 1)
+
+    costs = np.hstack([costs, np.full((n_students, 1), unseated_cost)])
+    capacities = [min(max(int(c), 0), n_students) for c in capacities] + [n_students]
+
+    solver = _TransportationSolver(costs, capacities)
+    for student in np.argsort(costs.min(axis=1), kind='stable'):
+        solver.add(int(student))
+
+    return [bus if bus < n_buses else -1 for bus in solver.assigned]
+
+
+class BulkAssignmentService:
+    @staticmethod
+    @transaction.atomic
+    def assign_unassigned_students(created_by=None):
+        """
+        Seat every unassigned student with home coordinates on a working bus,
+        minimising the total home-to-bus-source distance across all students.
+        Seats, fees, driver assignments and notifications are written in bulk.
+
+        The free seats are locked before the students are read, so a
+        concurrent run waits and then only plans the students this one left
+        unseated.
+        """
+        unassigned = User.objects.filter(
+            role='STUDENT',
+            home_latitude__isnull=False,
+            home_longitude__isnull=False,
+            assigned_seat__isnull=True
+        )
+        nothing_to_do = {'assigned': 0, 'failed': 0, 'assignments': [], 'total_distance_km': 0}
+        if not unassigned.exists():
+            return nothing_to_do
+
+        # Lock the free passenger seats so concurrent assignments cannot take them
+        free_seats = defaultdict(list)
+        for seat in Seat.objects.select_for_update(of=('self',)).filter(
+            bus__status='WORKING',
+            bus__source_latitude__isnull=False,
+            bus__source_longitude__isnull=False,
+            is_available=True
+        ).exclude(seat_number=1).only('id', 'bus_id', 'seat_number').order_by('bus_id', 'seat_number'):
+            free_seats[seat.bus_id].append(seat)
+        students = list(unassigned.only('id', 'first_name', 'last_name', 'home_latitude', 'home_longitude'))
+        if not students:
+            return nothing_to_do
+
+        buses = list(Bus.objects.filter(id__in=list(free_seats)).order_by('id'))
+        student_coords = coordinate_array((s.home_latitude, s.home_longitude) for s in students)
+        bus_coords = coordinate_array((b.source_latitude, b.source_longitude) for b in buses)
+
+        costs = distance_matrix(student_coords, bus_coords)
+        result = solve_capacitated_assignment(costs, [len(free_seats[b.id]) for b in buses])
+
+        # Closest students get the front seats of each bus
+        seated = defaultdict(list)
+        for student_index, bus_position in enumerate(result):
+            if bus_position >= 0:
+                seated[bus_position].append(student_index)
+
+        now = timezone.now()
+        updated_seats = []
+        placements = []  # (student, bus, seat, distance_to_bus)
+        for bus_position, student_indexes in seated.items():
+            bus = buses[bus_position]
+            student_indexes.sort(key=lambda i: costs[i, bus_position])
+            for student_index, seat in zip(student_indexes, free_seats[bus.id]):
+                seat.assigned_user = students[student_index]
+                seat.is_available = False
+                seat.updated_at = now
+                updated_seats.append(seat)
+                placements.append((students[student_index], bus, seat, float(costs[student_index, bus_position])))
+
+        Seat.objects.bulk_update(updated_seats, ['assigned_user', 'is_available', 'updated_at'], batch_size=WRITE_BATCH_SIZE)
+
+        positions = {student.id: index for index, student in enumerate(students)}
+        distances = distances_to_university(student_coords[[positions[p[0].id] for p in placements]])
+        notifications = BulkAssignmentService._create_fees(
+            [(p[0], distance_km) for p, distance_km in zip(placements, distances.tolist())]
+        )
+        notifications += BulkAssignmentService._assign_drivers(
+            [buses[position] for position in seated], created_by
+        )
+
+        for student, bus, seat, _ in placements:
+            notifications.append(Notification(
+                user=student,
+                message=f"✅ You have been assigned to Bus {bus.bus_number}, Seat {seat.seat_number}. Route: {bus.source} → {bus.destination}",
+                created_by=created_by
+            ))
+        notifications_created(Notification.objects.bulk_create(notifications, batch_size=WRITE_BATCH_SIZE))
+
+        touched_buses = [bus.id for bus in buses]
+        transaction.on_commit(lambda: bus_index.refresh(touched_buses))
+
+        return {
+            'assigned': len(placements),
+            'failed': len(students) - len(placements),
+            'assignments': [
+                {
+                    'student': f"{student.first_name} {student.last_name}",
+                    'bus': bus.bus_number,
+                    'seat': seat.seat_number,
+                    'distance_to_bus': round(distance, 2)
+                }
+                for student, bus, seat, distance in placements
+            ],
+            'total_distance_km': round(sum(p[3] for p in placements), 2)
+        }
+
+    @staticmethod
+    @transaction.atomic
+    def assign_students_to_bus(bus_id, default_distance_km=DEFAULT_FEE_DISTANCE_KM):
+        """
+        Fill the free passenger seats of one bus: female students in the front
+        half, male students in the back half, everyone else in what is left.
+        Students whose home location matches the bus source go first.
+
+        The bus row and its free seats are locked for the whole plan, so two
+        concurrent runs on the same bus are serialised and the second one only
+        sees the seats the first left free. All writes are done in bulk.
+        """
+        bus = Bus.objects.select_for_update().get(id=bus_id)
+        free_seats = list(Seat.objects.select_for_update().filter(
+            bus=bus, is_available=True
+        ).exclude(seat_number=1).order_by('seat_number'))
+        if not free_seats:
+            raise ValueError('No available seats on this bus')
+
+        unassigned_students = list(User.objects.filter(
+            role='STUDENT', assigned_seat__isnull=True
+        ).order_by('id'))
+        bus_source = bus.source.lower()
+        matching_students = [
+            s for s in unassigned_students
+            if s.home_location and (bus_source in s.home_location.lower() or s.home_location.lower() in bus_source)
+        ] or unassigned_students
+
+        half_point = len(free_seats) // 2
+        front_seats = free_seats[:half_point]
+        back_seats = free_seats[half_point:]
+        female_students = [s for s in matching_students if s.gender == 'FEMALE']
+        male_students = [s for s in matching_students if s.gender == 'MALE']
+        other_students = [s for s in matching_students if s.gender not in ['MALE', 'FEMALE']]
+
+        plan = list(zip(female_students, front_seats, ['Front (Girls)'] * len(front_seats)))
+        plan += zip(male_students, back_seats, ['Back (Boys)'] * len(back_seats))
+        remaining_seats = front_seats[len(female_students):] + back_seats[len(male_students):]
+        plan += zip(other_students, remaining_seats, ['Mixed'] * len(remaining_seats))
+
+        now = timezone.now()
+        for student, seat, _ in plan:
+            seat.assigned_user = student
+            seat.is_available = False
+            seat.updated_at = now
+        Seat.objects.bulk_update(
+            [seat for _, seat, _ in plan], ['assigned_user', 'is_available', 'updated_at'],
+            batch_size=WRITE_BATCH_SIZE
+        )
+
+        notifications = BulkAssignmentService._create_fees(
+            [(student, default_distance_km) for student, _, _ in plan]
+        )
+        notifications_created(Notification.objects.bulk_create(notifications, batch_size=WRITE_BATCH_SIZE))
+
+        transaction.on_commit(lambda: bus_index.refresh([bus.id]))
+
+        assignments = []
+        for student, seat, section in plan:
+            assignments.append({
+                'student': f"{student.first_name} {student.last_name}",
+                'seat': seat.seat_number,
+                'section': section,
+                'home_location': student.home_location or 'N/A',
+                'location_matched': bool(student.home_location) and bus_source in student.home_location.lower()
+            })
+        return bus, assignments
+
+    @staticmethod
+    def _create_fees(billed):
+        """
+        Create this month's fee for every (student, distance_km) pair that has
+        none yet, returns pending notifications
+        """
+        month_name, year, due_date = current_fee_period()
+        fees = []
+        distances = {}
+        for student, distance_km in billed:
+            fee_amount = calculate_bus_fee_from_distance(distance_km)
+            fees.append(Fee(
+                user=student,
+                amount=Decimal(fee_amount),
+                pending_amount=Decimal(fee_amount),
+                month=month_name,
+                year=year,
+                due_date=due_date,
+                payment_status='PENDING',
+                distance_km=Decimal(str(round(distance_km, 2)))
+            ))
+            distances[student.id] = distance_km
+
+        # Students billed meanwhile, by a concurrent request too, are skipped and not notified
+        fees = insert_unbilled_fees(fees, batch_size=WRITE_BATCH_SIZE)
+        refresh_fee_balances(fee.user_id for fee in fees)
+        return [
+            Notification(
+                user_id=fee.user_id,
+                message=fee_assigned_message(int(fee.amount), month_name, year, due_date, distances[fee.user_id]),
+                created_by=None
+            )
+            for fee in fees
+        ]
+
+    @staticmethod
+    def _assign_drivers(buses, created_by):
+        """Give each bus without a driver the nearest available driver, returns pending notifications"""
+        driverless = [bus for bus in buses if bus.driver_id is None]
+        if not driverless:
+            return []
+
+        drivers = list(User.objects.select_for_update().filter(
+            role='DRIVER',
+            driver_status='AVAILABLE',
+            home_latitude__isnull=False,
+            home_longitude__isnull=False
+        ).exclude(assigned_bus__isnull=False))
+        if not drivers:
+            return []
+
+        distances = distance_matrix(
+            [(d.home_latitude, d.home_longitude) for d in drivers],
+            [(b.source_latitude, b.source_longitude) for b in driverless]
+        )
+        distances = np.where(np.isnan(distances), np.inf, distances)
+
+        now = timezone.now()
+        updated_buses = []
+        updated_drivers = []
+        notifications = []
+        for bus_position, bus in enumerate(driverless):
+            driver_position = int(np.argmin(distances[:, bus_position]))
+            if not np.isfinite(distances[driver_position, bus_position]):
+                continue
+            distances[driver_position, :] = np.inf
+            driver = drivers[driver_position]
+
+            bus.driver = driver
+            bus.updated_at = now
+            driver.driver_status = 'UNAVAILABLE'
+            driver.updated_at = now
+            if bus.distance_km:
+                driver.salary = calculate_driver_salary_from_distance(float(bus.distance_km))
+            updated_buses.append(bus)
+            updated_drivers.append(driver)
+            notifications.append(Notification(
+                user=driver,
+                message=f"🚌 You have been assigned to Bus {bus.bus_number} ({bus.source} → {bus.destination})",
+                created_by=created_by
+            ))
+
+        Bus.objects.bulk_update(updated_buses, ['driver', 'updated_at'])
+        User.objects.bulk_update(updated_drivers, ['driver_status', 'salary', 'updated_at'])
+        return notifications
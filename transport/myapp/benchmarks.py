@@ -0,0 +1,274 @@
+import json
+import os
+import statistics
+import subprocess
+import time
+from contextlib import nullcontext
+
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .fee_reminders import fee_reminders
+from .location_buffer import location_buffer
+from .models import Attendance, Bus, Fee, Seat, User
+from .routing import websocket_urlpatterns
+from .synthetic import SYNTHETIC_PREFIX
+
+
+# Where run_benchmarks appends one JSON line per run
+BENCHMARK_RESULTS_FILE = 'benchmark_results.jsonl'
+
+# A benchmark regressed when its median is this much slower than the baseline...
+REGRESSION_THRESHOLD = 0.25
+
+# ...and slower by at least this many ms, so fast endpoints do not flap on noise
+REGRESSION_MIN_MS = 5
+
+# Location updates sent per consumer benchmark iteration
+SOCKET_MESSAGES = 200
+
+
+class Benchmark:
+    """
+    One timed operation. run(context) does it once; a benchmark that writes
+    (mutates=True) runs in a transaction that is rolled back, so every
+    iteration and every run sees the same data.
+    """
+
+    def __init__(self, name, run, description, mutates=False, iterations=5, messages=None):
+        self.name = name
+        self.run = run
+        self.description = description
+        self.mutates = mutates
+        self.iterations = iterations
+        self.messages = messages
+
+    def measure(self, context, iterations=None):
+        """Time the benchmark after one untimed warm-up run, returns its result record"""
+        timings, queries = [], []
+        for iteration in range((iterations or self.iterations) + 1):
+            # Only writers get a transaction: the socket benchmarks' database_sync_to_async
+            # calls would close a connection left inside one
+            with CaptureQueriesContext(connection) as captured, (transaction.atomic() if self.mutates else nullcontext()):
+                started = time.perf_counter()
+                self.run(context)
+                elapsed = (time.perf_counter() - started) * 1000
+                if self.mutates:
+                    transaction.set_rollback(True)
+            if iteration:
+                timings.append(elapsed)
+                queries.append(len(captured))
+
+        timings.sort()
+        result = {
+            'iterations': len(timings),
+            'median_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+            'min_ms': round(timings[0], 2),
+            'max_ms': round(timings[-1], 2),
+            'queries': int(statistics.median(queries)),
+        }
+        if self.messages:
+            result['messages_per_second'] = round(self.messages / (result['median_ms'] / 1000), 1)
+        return result
+
+
+class BenchmarkContext:
+    """The users the benchmarks act as, picked from the synthetic data when there is some"""
+
+    def __init__(self):
+        admins = User.objects.filter(role='ADMIN')
+        self.admin = admins.filter(username=f'{SYNTHETIC_PREFIX}admin').first() or admins.first()
+        self.bus = Bus.objects.filter(driver__isnull=False).order_by('-bus_number').first()
+        self.driver = self.bus.driver if self.bus else None
+        seat = Seat.objects.filter(assigned_user__role='STUDENT').select_related('assigned_user').order_by('-id').first()
+        self.student = seat.assigned_user if seat else None
+
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def missing(self):
+        return [name for name in ['admin', 'driver', 'student'] if getattr(self, name) is None]
+
+
+def _get(path, role):
+    def run(context):
+        response = context.client(getattr(context, role)).get(path)
+        assert response.status_code == 200, f'{path} returned {response.status_code}'
+    return run
+
+
+def _bulk_auto_assign(context):
+    response = context.client(context.admin).post('/api/admin/bulk-auto-assign/', {}, format='json')
+    assert response.status_code == 200, f'bulk-auto-assign returned {response.status_code}'
+
+
+def _bulk_fee_reminder(context):
+    # The job would start after commit; run it here, inside the rolled back transaction
+    response = context.client(context.admin).post('/api/admin/send-bulk-fee-reminder/', {}, format='json')
+    assert response.status_code == 202, f'send-bulk-fee-reminder returned {response.status_code}'
+    fee_reminders.run_job(response.data['job_id'])
+
+
+def _socket_round_trips(path, message):
+    """Connect a sender and a listener, send SOCKET_MESSAGES updates and wait until the listener has them all"""
+    async def exchange():
+        application = URLRouter(websocket_urlpatterns)
+        listener = WebsocketCommunicator(application, path)
+        sender = WebsocketCommunicator(application, path)
+        await listener.connect()
+        await sender.connect()
+        try:
+            for index in range(SOCKET_MESSAGES):
+                await sender.send_to(text_data=json.dumps(message(index)))
+                await listener.receive_from(timeout=5)
+        finally:
+            await sender.disconnect()
+            await listener.disconnect()
+            task, location_buffer._flush_task = location_buffer._flush_task, None
+            if task is not None:
+                task.cancel()
+
+    def run(context):
+        async_to_sync(exchange)()
+        # The buffered positions, written as the periodic flush would
+        location_buffer.flush()
+    return run
+
+
+def _bus_socket(context):
+    return _socket_round_trips(f'/ws/bus/{context.bus.id}/', lambda index: {
+        'type': 'location_update',
+        'location': {'latitude': 11.30 + index * 0.0005, 'longitude': 77.90 + index * 0.0005},
+    })(context)
+
+
+def _driver_socket(context):
+    return _socket_round_trips('/ws/drivers/location/', lambda index: {
+        'type': 'update_location',
+        'driver_id': context.driver.id,
+        'latitude': 11.30 + index * 0.0005,
+        'longitude': 77.90 + index * 0.0005,
+    })(context)
+
+
+BENCHMARKS = {benchmark.name: benchmark for benchmark in [
+    Benchmark('get_all_students', _get('/api/admin/students/', 'admin'), 'GET /api/admin/students/ (first page)'),
+    Benchmark('admin_dashboard', _get('/api/dashboard/admin/', 'admin'), 'GET /api/dashboard/admin/'),
+    Benchmark('driver_dashboard', _get('/api/dashboard/driver/', 'driver'), 'GET /api/dashboard/driver/'),
+    Benchmark('user_dashboard', _get('/api/dashboard/user/', 'student'), 'GET /api/dashboard/user/'),
+    Benchmark('driver_students', _get('/api/driver/my-bus-students-enhanced/', 'driver'), 'GET /api/driver/my-bus-students-enhanced/'),
+    Benchmark(
+        'bulk_auto_assign_students', _bulk_auto_assign,
+        'POST /api/admin/bulk-auto-assign/ for every unseated student', mutates=True, iterations=3
+    ),
+    Benchmark(
+        'send_bulk_fee_reminder', _bulk_fee_reminder,
+        'POST /api/admin/send-bulk-fee-reminder/ to every owing student, job run to completion', mutates=True, iterations=3
+    ),
+    Benchmark(
+        'bus_location_consumer', _bus_socket,
+        f'{SOCKET_MESSAGES} bus location updates through BusConsumer to a listener', messages=SOCKET_MESSAGES
+    ),
+    Benchmark(
+        'driver_location_consumer', _driver_socket,
+        f'{SOCKET_MESSAGES} driver positions through DriverLocationConsumer to a listener', messages=SOCKET_MESSAGES
+    ),
+]}
+
+
+def dataset_size():
+    return {
+        'buses': Bus.objects.count(),
+        'seats': Seat.objects.count(),
+        'students': User.objects.filter(role='STUDENT').count(),
+        'seated_students': Seat.objects.filter(assigned_user__isnull=False).count(),
+        'attendance': Attendance.objects.count(),
+        'fees': Fee.objects.count(),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(names=None, iterations=None, label=None, on_result=None):
+    """Run the named benchmarks (default all) and return the run record"""
+    context = BenchmarkContext()
+    record = {
+        'run_at': timezone.now().isoformat(),
+        'label': label,
+        'git_revision': git_revision(),
+        'database': connection.vendor,
+        'dataset': dataset_size(),
+        'results': {},
+        'skipped': {},
+    }
+    missing = context.missing()
+    # Test clients send Host: testserver
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for name in names or BENCHMARKS:
+            benchmark = BENCHMARKS[name]
+            if missing:
+                record['skipped'][name] = f"No {', '.join(missing)} to run as, generate data first"
+                continue
+            try:
+                result = benchmark.measure(context, iterations)
+            except Exception as e:
+                record['skipped'][name] = str(e)
+                continue
+            record['results'][name] = result
+            if on_result:
+                on_result(name, result)
+    return record
+
+
+def save_run(record, path=BENCHMARK_RESULTS_FILE):
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def load_runs(path=BENCHMARK_RESULTS_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_baseline(runs, label=None):
+    """The latest earlier run, or the latest one with that label"""
+    for run in reversed(runs):
+        if label is None or run.get('label') == label:
+            return run
+    return None
+
+
+def compare(record, baseline, threshold=REGRESSION_THRESHOLD):
+    """Per benchmark, the baseline and current medians and whether it regressed"""
+    rows = []
+    for name, result in record['results'].items():
+        before = baseline['results'].get(name) if baseline else None
+        row = {'name': name, 'median_ms': result['median_ms'], 'baseline_ms': None, 'change': None, 'regressed': False}
+        if before:
+            row['baseline_ms'] = before['median_ms']
+            row['change'] = (result['median_ms'] - before['median_ms']) / before['median_ms'] if before['median_ms'] else None
+            row['regressed'] = (
+                result['median_ms'] > before['median_ms'] * (1 + threshold)
+                and result['median_ms'] - before['median_ms'] >= REGRESSION_MIN_MS
+            )
+        rows.append(row)
+    return rows
@@ -1,9 +1,86 @@
+import asyncio
 import json
-from channels.generic.websocket import AsyncWebsocketConsumer
+import time
+from urllib.parse import parse_qs
 from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from .geofence import geofences
+from .location_buffer import location_buffer
 from .models import Bus, User
+from .notifications import mark_notifications_seen, notification_group, unread_notification_count
+from .spatial import live_map_cell, live_map_cells
+from .location_history import parse_point
+from .protocol import (
+    FORMAT_BINARY, FORMAT_JSON, KIND_BUS, KIND_DRIVER, FrameEncoder, json_batch, negotiate
+)
+
+# Batched formats send at most one frame per connection per tick
+STREAM_TICK_SECONDS = 0.5
+
+# How long a driver socket trusts its driver -> bus lookup, so a driver
+# moved to another bus publishes to the new bus's group soon after
+DRIVER_BUS_TTL_SECONDS = 30
+
+
+class LocationStreamMixin:
+    """
+    Delivery side of the location sockets. With the default JSON format every
+    update is sent as it arrives; batched formats coalesce updates per id and
+    send them once per tick (see myapp/protocol.py).
+    """
+    stream_kind = None
+
+    async def accept_stream(self):
+        self.stream_format, subprotocol = negotiate(self.scope)
+        self._encoder = FrameEncoder(self.stream_kind)
+        self._pending_updates = {}
+        self._tick_task = None
+        location_buffer.socket_opened()
+        await self.accept(subprotocol=subprotocol)
+
+    async def close_stream(self):
+        if not hasattr(self, '_tick_task'):
+            # Closed before the stream was accepted
+            return
+        if self._tick_task is not None:
+            self._tick_task.cancel()
+            self._tick_task = None
+        await location_buffer.socket_closed()
+
+    def queue_update(self, object_id, point, payload):
+        """Hold an update until the end of the tick, newer ones for the same id replace it"""
+        if not isinstance(object_id, int) or not 0 <= object_id <= 0xFFFFFFFF:
+            # Does not fit a binary record
+            point = None
+        self._pending_updates[object_id] = (point, payload)
+        if self._tick_task is None:
+            self._tick_task = asyncio.ensure_future(self._send_after_tick())
+
+    def drop_update(self, object_id):
+        self._pending_updates.pop(object_id, None)
+
+    async def _send_after_tick(self):
+        await asyncio.sleep(STREAM_TICK_SECONDS)
+        self._tick_task = None
+        pending, self._pending_updates = self._pending_updates, {}
+        if self.stream_format == FORMAT_BINARY:
+            packed = [(object_id, *point) for object_id, (point, _) in pending.items() if point is not None]
+            for frame in self._encoder.encode(packed):
+                await self.send(bytes_data=frame)
+            # Updates without usable coordinates still go out as JSON
+            unpacked = [payload for point, payload in pending.values() if point is None]
+            if unpacked:
+                await self.send(text_data=json_batch(unpacked))
+        else:
+            await self.send(text_data=json_batch([payload for _, payload in pending.values()]))
+
+
+class BusConsumer(LocationStreamMixin, AsyncWebsocketConsumer):
+    stream_kind = KIND_BUS
 
-class BusConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.bus_id = self.scope['url_route']['kwargs']['bus_id']
         self.room_group_name = f'bus_{self.bus_id}'
@@ -14,9 +91,10 @@ class BusConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        await self.accept()
+        await self.accept_stream()
 
     async def disconnect(self, close_code):
+        await self.close_stream()
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -24,14 +102,16 @@ class BusConsumer(AsyncWebsocketConsumer):
         )
 
     # Receive message from WebSocket
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
+        if text_data is None:
+            return
         text_data_json = json.loads(text_data)
         message_type = text_data_json.get('type')
         
         if message_type == 'location_update':
             location = text_data_json.get('location')
-            # Update bus location in DB
-            await self.update_bus_location(self.bus_id, location)
+            # Buffer for the periodic DB write, broadcast right away
+            location_buffer.put_bus(self.bus_id, location)
             
             # Broadcast location to room group
             await self.channel_layer.group_send(
@@ -42,33 +122,57 @@ class BusConsumer(AsyncWebsocketConsumer):
                 }
             )
 
+            point = parse_point(location)
+            if point is not None and str(self.bus_id).isdigit():
+                await detect_geofence_events(self.channel_layer, int(self.bus_id), *point)
+
     # Receive message from room group
     async def bus_location_update(self, event):
         location = event['location']
 
+        if self.stream_format != FORMAT_JSON:
+            try:
+                bus_id = int(self.bus_id)
+            except ValueError:
+                bus_id = None
+            point = parse_point(location) if bus_id is not None else None
+            self.queue_update(bus_id, point, {'bus_id': self.bus_id, 'location': location})
+            return
+
         # Send message to WebSocket
         await self.send(text_data=json.dumps({
             'type': 'location_update',
             'location': location
         }))
 
-    @database_sync_to_async
-    def update_bus_location(self, bus_id, location):
-        try:
-            bus = Bus.objects.get(id=bus_id)
-            bus.current_location = str(location) # JSON string or lat,long
-            # if location is object with lat/lng
-            if isinstance(location, dict):
-                 # Try to update specific fields if they exist in future
-                 pass
-            bus.save()
-        except Bus.DoesNotExist:
-            pass
-
-
-class DriverLocationConsumer(AsyncWebsocketConsumer):
+    async def geofence_event(self, event):
+        # Rare and small, always sent as JSON whatever the stream format
+        await self.send(text_data=json.dumps(event))
+
+
+class DriverLocationConsumer(LocationStreamMixin, AsyncWebsocketConsumer):
+    """
+    Drivers send their position here and admin maps listen.
+
+    A listener gets every driver until it sends a subscribe message:
+        {"type": "subscribe", "bbox": [south, west, north, east]}
+        {"type": "subscribe", "bus_ids": [1, 2, 3]}
+        {"type": "unsubscribe"}
+    A viewport joins the channel group of every live-map grid cell it covers
+    and a bus list joins one group per bus, so a socket only receives the
+    updates on its screen. When a driver crosses into another cell the old
+    cell gets a driver_location_left event so maps can drop the marker.
+    """
+    stream_kind = KIND_DRIVER
+
     async def connect(self):
         self.room_group_name = 'driver_locations'
+        self.subscription_groups = {self.room_group_name}
+        self.bbox = None
+        self.bus_ids = None
+        # Sender side: last grid cell and (bus, looked up at) of every driver seen on this socket
+        self._driver_cells = {}
+        self._driver_buses = {}
         
         # Check permissions - only admin should listen? 
         # For now allow authenticated users or just connect
@@ -77,43 +181,246 @@ class DriverLocationConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
-        await self.accept()
+        await self.accept_stream()
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        await self.close_stream()
+        for group in self.subscription_groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
         
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
+        if text_data is None:
+            return
         data = json.loads(text_data)
         if data.get('type') == 'update_location':
             driver_id = data.get('driver_id')
             lat = data.get('latitude')
             lng = data.get('longitude')
             
-            await self.update_driver_location(driver_id, lat, lng)
-            
-            # Broadcast to admins
+            # Buffer for the periodic DB write, broadcast right away
+            location_buffer.put_driver(driver_id, lat, lng)
+            await self.broadcast_driver_location(driver_id, lat, lng)
+        elif data.get('type') == 'subscribe':
+            await self.subscribe(data.get('bbox'), data.get('bus_ids'))
+        elif data.get('type') == 'unsubscribe':
+            await self.subscribe(None, None)
+
+    async def broadcast_driver_location(self, driver_id, lat, lng):
+        event = {
+            'type': 'driver_location_broadcast',
+            'driver_id': driver_id,
+            'latitude': lat,
+            'longitude': lng
+        }
+        # Broadcast to admins watching the whole fleet
+        await self.channel_layer.group_send(self.room_group_name, event)
+
+        point = parse_point((lat, lng))
+        if point is None:
+            return
+        cell = live_map_cell(*point)
+        previous_cell = self._driver_cells.get(driver_id)
+        self._driver_cells[driver_id] = cell
+        if previous_cell is not None and previous_cell != cell:
             await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'driver_location_broadcast',
-                    'driver_id': driver_id,
-                    'latitude': lat,
-                    'longitude': lng
-                }
+                _cell_group(previous_cell),
+                {'type': 'driver_location_left', 'driver_id': driver_id, 'latitude': lat, 'longitude': lng}
             )
+        await self.channel_layer.group_send(_cell_group(cell), event)
+
+        bus_id, looked_up_at = self._driver_buses.get(driver_id, (None, None))
+        now = time.monotonic()
+        if looked_up_at is None or now - looked_up_at > DRIVER_BUS_TTL_SECONDS:
+            bus_id = await _bus_of_driver(driver_id)
+            self._driver_buses[driver_id] = (bus_id, now)
+        if bus_id is not None:
+            await self.channel_layer.group_send(f'driver_bus_{bus_id}', event)
+            await detect_geofence_events(self.channel_layer, bus_id, *point)
+
+    async def subscribe(self, bbox, bus_ids):
+        groups = {self.room_group_name}
+        try:
+            if bus_ids:
+                bus_ids, bbox = {int(bus_id) for bus_id in bus_ids}, None
+                groups = {f'driver_bus_{bus_id}' for bus_id in bus_ids}
+            elif bbox:
+                bus_ids = None
+                south, west, north, east = (float(v) for v in bbox)
+                if south > north or west > east:
+                    raise ValueError
+                bbox = (south, west, north, east)
+                cells = live_map_cells(*bbox)
+                if cells is not None:
+                    groups = {_cell_group(cell) for cell in cells}
+            else:
+                bus_ids = bbox = None
+        except (TypeError, ValueError):
+            await self.send(text_data=json.dumps({'type': 'error', 'error': 'Invalid subscription'}))
+            return
+
+        self.bbox, self.bus_ids = bbox, bus_ids
+        for group in self.subscription_groups - groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        for group in groups - self.subscription_groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+        self.subscription_groups = groups
+
+        # Start the map off with the last known positions on screen
+        for driver_id, lat, lng in await _current_positions(self.bbox, self.bus_ids):
+            await self.deliver(driver_id, lat, lng, {
+                'type': 'driver_location_broadcast',
+                'driver_id': driver_id,
+                'latitude': lat,
+                'longitude': lng
+            })
 
     async def driver_location_broadcast(self, event):
+        if self.bbox is not None:
+            point = parse_point((event['latitude'], event['longitude']))
+            if point is None or not _in_bbox(point, self.bbox):
+                return
+        await self.deliver(event['driver_id'], event['latitude'], event['longitude'], event)
+
+    async def driver_location_left(self, event):
+        point = parse_point((event['latitude'], event['longitude']))
+        if self.bbox is None or (point is not None and _in_bbox(point, self.bbox)):
+            # Still on screen, the position update itself moves the marker
+            return
+        if self.stream_format == FORMAT_JSON:
+            await self.send(text_data=json.dumps({'type': 'driver_location_left', 'driver_id': event['driver_id']}))
+        else:
+            try:
+                self.drop_update(int(event['driver_id']))
+            except (TypeError, ValueError):
+                pass
+            self.queue_update(('left', event['driver_id']), None, {'driver_id': event['driver_id'], 'left': True})
+
+    async def deliver(self, driver_id, lat, lng, event):
+        if self.stream_format != FORMAT_JSON:
+            update = {'driver_id': driver_id, 'latitude': lat, 'longitude': lng}
+            try:
+                point = parse_point((lat, lng))
+                driver_id = int(driver_id)
+            except (TypeError, ValueError):
+                point = None
+            self.drop_update(('left', update['driver_id']))
+            self.queue_update(driver_id, point, update)
+            return
+
         await self.send(text_data=json.dumps(event))
 
-    @database_sync_to_async
-    def update_driver_location(self, driver_id, lat, lng):
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes a user's new notifications and unread count as they change.
+
+    Authenticates with the session, or with a JWT access token passed as
+    ?token= since browsers cannot set headers on WebSocket requests. Sends
+    {"type": "unread_count"} on connect and after every change, and
+    {"type": "notification"} for each new notification. Clients may send
+    {"type": "mark_seen", "ids": [...]} or {"type": "mark_all_seen"}.
+    """
+
+    async def connect(self):
+        self.user_id = await _authenticated_user_id(self.scope)
+        if self.user_id is None:
+            await self.close(code=4401)
+            return
+        self.group_name = notification_group(self.user_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.unread_count({'unread': await database_sync_to_async(unread_notification_count)(self.user_id)})
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'user_id', None) is not None:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if text_data is None:
+            return
         try:
-            driver = User.objects.get(id=driver_id)
-            driver.current_latitude = lat
-            driver.current_longitude = lng
-            driver.save()
-        except User.DoesNotExist:
-            pass
+            data = json.loads(text_data)
+        except ValueError:
+            return
+        if data.get('type') == 'mark_all_seen':
+            await database_sync_to_async(mark_notifications_seen)(self.user_id)
+        elif data.get('type') == 'mark_seen' and isinstance(data.get('ids'), list):
+            ids = [i for i in data['ids'] if isinstance(i, int)]
+            if ids:
+                await database_sync_to_async(mark_notifications_seen)(self.user_id, ids)
+
+    async def notification_created(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'notification',
+            'notification': event['notification'],
+            'unread': event['unread'],
+        }))
+
+    async def unread_count(self, event):
+        await self.send(text_data=json.dumps({'type': 'unread_count', 'unread': event['unread']}))
+
+
+async def detect_geofence_events(channel_layer, bus_id, lat, lng):
+    """Run a bus position through the geofences, fan out and store what it triggers"""
+    if geofences.claim_rebuild():
+        # Positions arriving meanwhile use the current fences instead of queueing rebuilds of their own
+        await database_sync_to_async(geofences.rebuild)()
+    events = geofences.process(bus_id, lat, lng)
+    if not events:
+        return
+    for event in events:
+        await channel_layer.group_send(f'bus_{bus_id}', {'type': 'geofence_event', **event})
+    await database_sync_to_async(geofences.notify)(events)
+
+
+@database_sync_to_async
+def _authenticated_user_id(scope):
+    user = scope.get('user')
+    if user is not None and user.is_authenticated:
+        return user.id
+    token = (parse_qs(scope.get('query_string', b'').decode('latin-1')).get('token') or [None])[0]
+    if not token:
+        return None
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(token)).id
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def _cell_group(cell):
+    return f'driver_cell_{cell[0]}_{cell[1]}'
+
+
+def _in_bbox(point, bbox):
+    south, west, north, east = bbox
+    return south <= point[0] <= north and west <= point[1] <= east
+
+
+@database_sync_to_async
+def _bus_of_driver(driver_id):
+    try:
+        return Bus.objects.filter(driver_id=int(driver_id)).values_list('id', flat=True).first()
+    except (TypeError, ValueError):
+        return None
+
+
+@database_sync_to_async
+def _current_positions(bbox, bus_ids):
+    """Last stored positions of the drivers a subscription covers"""
+    if bbox is None and bus_ids is None:
+        return []
+    drivers = User.objects.filter(
+        role='DRIVER', current_latitude__isnull=False, current_longitude__isnull=False
+    )
+    if bus_ids is not None:
+        drivers = drivers.filter(assigned_bus__id__in=bus_ids)
+    else:
+        south, west, north, east = bbox
+        drivers = drivers.filter(
+            current_latitude__range=(south, north), current_longitude__range=(west, east)
+        )
+    return [
+        (driver_id, float(lat), float(lng))
+        for driver_id, lat, lng in drivers.values_list('id', 'current_latitude', 'current_longitude').distinct()
+    ]
@@ -0,0 +1,223 @@
+import threading
+from contextlib import contextmanager
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Bus, DashboardSnapshot, DriverAttendance, User
+
+
+# The snapshot is a single row
+SNAPSHOT_ID = 1
+
+# A snapshot not recomputed for this long is recomputed on read, in case refresh_dashboard is not scheduled
+DASHBOARD_MAX_AGE_SECONDS = 3600
+
+# Snapshot counter per user role; other roles are not counted
+ROLE_COUNTERS = {
+    'DRIVER': 'total_drivers',
+    'STUDENT': 'total_students',
+    'TEACHER': 'total_teachers',
+}
+
+COUNTER_FIELDS = [
+    'total_buses', 'total_drivers', 'total_students', 'total_teachers', 'breakdown_buses', 'drivers_marked_today'
+]
+
+# The field a save is compared against to see which counters it moved, read in pre_save
+TRACKED_FIELDS = {
+    User: 'role',
+    Bus: 'status',
+    DriverAttendance: 'date',
+}
+
+_local = threading.local()
+
+
+def dashboard_snapshot():
+    """
+    The admin dashboard counters and how stale they are, read from the
+    snapshot row in one primary key lookup. The row is recomputed first when
+    it does not exist yet or is older than DASHBOARD_MAX_AGE_SECONDS.
+    """
+    snapshot = DashboardSnapshot.objects.filter(pk=SNAPSHOT_ID).first()
+    now = timezone.now()
+    if snapshot is None or snapshot.recomputed_at is None or \
+            (now - snapshot.recomputed_at).total_seconds() > DASHBOARD_MAX_AGE_SECONDS:
+        snapshot, _ = recompute_dashboard()
+        now = timezone.now()
+
+    marked = _marked_today(snapshot, date.today())
+    return {
+        'total_buses': snapshot.total_buses,
+        'total_drivers': snapshot.total_drivers,
+        'total_students': snapshot.total_students,
+        'total_teachers': snapshot.total_teachers,
+        'pending_attendance': max(snapshot.total_drivers - marked, 0),
+        'breakdown_buses': snapshot.breakdown_buses,
+        'snapshot': {
+            'recomputed_at': snapshot.recomputed_at,
+            'updated_at': snapshot.updated_at,
+            'age_seconds': round((now - snapshot.recomputed_at).total_seconds(), 1),
+            'max_age_seconds': DASHBOARD_MAX_AGE_SECONDS,
+        },
+    }
+
+
+def dashboard_counts(today=None):
+    """Every counter counted from the tables, three aggregate queries"""
+    users = User.objects.aggregate(**{
+        field: Count('id', filter=Q(role=role)) for role, field in ROLE_COUNTERS.items()
+    })
+    buses = Bus.objects.aggregate(
+        total_buses=Count('id'),
+        breakdown_buses=Count('id', filter=Q(status='BREAKDOWN'))
+    )
+    # unique_together (driver, date): one row per driver and day
+    marked = DriverAttendance.objects.filter(date=today or date.today()).count()
+    return {**users, **buses, 'drivers_marked_today': marked}
+
+
+def recompute_dashboard(today=None):
+    """
+    Overwrite the snapshot with fresh counts. Returns the snapshot and the
+    counters that had drifted as {field: (snapshot value, counted value)}.
+
+    The row is created if needed and locked before counting, so an
+    adjustment committed while the counts run waits for the lock and is
+    added on top, never lost or counted twice.
+    """
+    today = today or date.today()
+    with transaction.atomic():
+        DashboardSnapshot.objects.bulk_create([DashboardSnapshot(pk=SNAPSHOT_ID)], ignore_conflicts=True)
+        snapshot = DashboardSnapshot.objects.select_for_update().get(pk=SNAPSHOT_ID)
+        counts = dashboard_counts(today)
+
+        drift = {}
+        for field, value in counts.items():
+            current = _marked_today(snapshot, today) if field == 'drivers_marked_today' else getattr(snapshot, field)
+            if current != value:
+                drift[field] = (current, value)
+            setattr(snapshot, field, value)
+        snapshot.attendance_date = today
+        snapshot.recomputed_at = snapshot.updated_at = timezone.now()
+        snapshot.save()
+    return snapshot, drift
+
+
+def adjust_dashboard(**deltas):
+    """
+    Add deltas to snapshot counters. Runs in the caller's transaction so
+    the counters commit or roll back with the change; a no-op until the
+    first recompute creates the row.
+    """
+    if getattr(_local, 'suspended', False):
+        return
+    updates = {field: Greatest(F(field) + delta, 0) for field, delta in deltas.items() if delta}
+    if updates:
+        DashboardSnapshot.objects.filter(pk=SNAPSHOT_ID).update(**updates, updated_at=timezone.now())
+
+
+def adjust_drivers_marked(day, delta):
+    """Count driver attendance added (+1) or removed (-1) for a day; only today's matters"""
+    today = date.today()
+    if not delta or _as_date(day) != today or getattr(_local, 'suspended', False):
+        return
+    DashboardSnapshot.objects.filter(pk=SNAPSHOT_ID).update(
+        # The first change of a new day starts the count again
+        drivers_marked_today=Case(
+            When(attendance_date=today, then=Greatest(F('drivers_marked_today') + delta, 0)),
+            default=Value(max(delta, 0))
+        ),
+        attendance_date=today,
+        updated_at=timezone.now()
+    )
+
+
+@contextmanager
+def dashboard_updates_suspended():
+    """
+    Skip per-row adjustments inside the block and recompute once after it,
+    for bulk jobs that would otherwise update the snapshot row per user
+    """
+    _local.suspended = True
+    try:
+        yield
+    finally:
+        _local.suspended = False
+    recompute_dashboard()
+
+
+# -- signal handlers -----------------------------------------------------
+
+def remember_state(instance, update_fields=None):
+    """
+    Read the tracked field as stored before an update, to compare with on
+    save. One primary key lookup, skipped for new rows and for saves whose
+    update_fields leave the field alone.
+    """
+    field = TRACKED_FIELDS[type(instance)]
+    instance._dashboard_state = None
+    if instance.pk is None or (update_fields is not None and field not in update_fields):
+        return
+    instance._dashboard_state = type(instance)._default_manager.filter(
+        pk=instance.pk
+    ).values_list(field, flat=True).first()
+
+
+def user_saved(user, created):
+    before = None if created else getattr(user, '_dashboard_state', None)
+    if created:
+        _adjust_roles({user.role: 1})
+    elif before is not None and before != user.role:
+        _adjust_roles({before: -1, user.role: 1})
+
+
+def user_deleted(user):
+    _adjust_roles({user.role: -1})
+
+
+def bus_saved(bus, created):
+    is_broken = int(bus.status == 'BREAKDOWN')
+    if created:
+        adjust_dashboard(total_buses=1, breakdown_buses=is_broken)
+    else:
+        before = getattr(bus, '_dashboard_state', None)
+        if before is not None:
+            adjust_dashboard(breakdown_buses=is_broken - int(before == 'BREAKDOWN'))
+
+
+def bus_deleted(bus):
+    adjust_dashboard(total_buses=-1, breakdown_buses=-int(bus.status == 'BREAKDOWN'))
+
+
+def driver_attendance_saved(attendance, created):
+    if created:
+        adjust_drivers_marked(attendance.date, 1)
+    else:
+        before = getattr(attendance, '_dashboard_state', None)
+        if before is not None and _as_date(before) != _as_date(attendance.date):
+            adjust_drivers_marked(before, -1)
+            adjust_drivers_marked(attendance.date, 1)
+
+
+def driver_attendance_deleted(attendance):
+    adjust_drivers_marked(attendance.date, -1)
+
+
+def _adjust_roles(role_deltas):
+    adjust_dashboard(**{
+        ROLE_COUNTERS[role]: delta for role, delta in role_deltas.items() if role in ROLE_COUNTERS
+    })
+
+
+def _marked_today(snapshot, today):
+    return snapshot.drivers_marked_today if snapshot.attendance_date == today else 0
+
+
+def _as_date(value):
+    # Unsaved instances may still hold the ISO string they were given
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
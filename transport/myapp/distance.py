@@ -0,0 +1,88 @@
+import math
+
+import numpy as np
+
+
+EARTH_RADIUS_KM = 6371
+
+# University location coordinates (KSR College, Tiruchengode)
+UNIVERSITY_LATITUDE = 11.3833
+UNIVERSITY_LONGITUDE = 77.8833
+
+# Rows per block when building large matrices, keeps temporaries around a few MB
+MATRIX_CHUNK_ROWS = 2048
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between two float coordinates"""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + \
+        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """Calculate distance between two coordinates in kilometers using Haversine formula"""
+    if not all([lat1, lon1, lat2, lon2]):
+        return None
+    return haversine_km(float(lat1), float(lon1), float(lat2), float(lon2))
+
+
+def coordinate_array(points):
+    """
+    Convert an iterable of (lat, lng) pairs into an (n, 2) float array in radians.
+    Missing coordinates (None or 0, matching calculate_distance) become NaN.
+    """
+    values = [
+        (float(lat), float(lng)) if lat and lng else (np.nan, np.nan)
+        for lat, lng in points
+    ]
+    if not values:
+        return np.empty((0, 2))
+    return np.radians(np.array(values, dtype=float))
+
+
+def _haversine(lat1, lng1, lat2, lng2):
+    a = np.sin((lat2 - lat1) / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def distance_matrix(origins, destinations):
+    """
+    Distances in km from every origin to every destination.
+
+    Both arguments are iterables of (lat, lng) pairs or arrays returned by
+    coordinate_array. Returns an (len(origins), len(destinations)) array with
+    NaN wherever either side has no coordinates.
+    """
+    origins = origins if isinstance(origins, np.ndarray) else coordinate_array(origins)
+    destinations = destinations if isinstance(destinations, np.ndarray) else coordinate_array(destinations)
+
+    result = np.empty((len(origins), len(destinations)))
+    dest_lat = destinations[:, 0][np.newaxis, :]
+    dest_lng = destinations[:, 1][np.newaxis, :]
+    for start in range(0, len(origins), MATRIX_CHUNK_ROWS):
+        block = origins[start:start + MATRIX_CHUNK_ROWS]
+        result[start:start + len(block)] = _haversine(
+            block[:, 0][:, np.newaxis], block[:, 1][:, np.newaxis], dest_lat, dest_lng
+        )
+    return result
+
+
+def distances_to_point(origins, latitude, longitude):
+    """Distances in km from every origin to a single point, NaN for missing coordinates"""
+    return distance_matrix(origins, [(latitude, longitude)])[:, 0]
+
+
+def distances_to_university(origins):
+    return distances_to_point(origins, UNIVERSITY_LATITUDE, UNIVERSITY_LONGITUDE)
+
+
+def path_distances(points):
+    """Distances in km between consecutive points of a path, one shorter than the path"""
+    points = points if isinstance(points, np.ndarray) else coordinate_array(points)
+    if len(points) < 2:
+        return np.zeros(0)
+    return _haversine(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1])
@@ -0,0 +1,333 @@
+import csv
+
+from django.conf import settings
+
+from .models import Attendance, Fee, User
+
+
+# Rows fetched per round trip; CSV output is flushed once per chunk too
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows per Parquet row group, the most an export holds in memory at once
+PARQUET_ROW_GROUP_SIZE = 50000
+
+EXPORT_FORMATS = ['csv', 'parquet']
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+_INTEGER_TYPES = {
+    'AutoField', 'BigAutoField', 'SmallAutoField', 'IntegerField', 'BigIntegerField',
+    'SmallIntegerField', 'PositiveIntegerField', 'PositiveSmallIntegerField', 'PositiveBigIntegerField',
+}
+
+_TRUE = {'1', 'true', 'yes'}
+_FALSE = {'0', 'false', 'no'}
+
+
+class ExportError(ValueError):
+    pass
+
+
+class ExportDataset:
+    """
+    An exportable table: the rows, the columns one can pick (name -> ORM
+    path for values_list) and the filters one can apply (name -> lookup).
+    """
+
+    def __init__(self, name, queryset, columns, filters, default_columns=None):
+        self.name = name
+        self.queryset = queryset
+        self.columns = columns
+        self.filters = filters
+        self.default_columns = default_columns or list(columns)
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'columns': list(self.columns),
+            'default_columns': self.default_columns,
+            'filters': list(self.filters),
+        }
+
+    def select(self, columns=None):
+        """The requested column names (a list or comma separated), validated"""
+        if isinstance(columns, str):
+            columns = [column.strip() for column in columns.split(',') if column.strip()]
+        columns = columns or self.default_columns
+        unknown = [column for column in columns if column not in self.columns]
+        if unknown:
+            raise ExportError(f"Unknown columns for {self.name}: {', '.join(unknown)}")
+        return columns
+
+    def rows(self, columns, filters=None):
+        """
+        A queryset of value tuples for columns, filtered and in primary key
+        order. Bad filter names or values raise ExportError here, before
+        anything is streamed.
+        """
+        lookups = {}
+        for name, value in (filters or {}).items():
+            if name not in self.filters:
+                raise ExportError(f"Unknown filter for {self.name}: {name}")
+            lookup = self.filters[name]
+            if lookup.endswith('__isnull') or lookup.startswith('is_'):
+                value = _boolean(name, value)
+            lookups[lookup] = value
+        try:
+            queryset = self.queryset().filter(**lookups)
+        except Exception as e:
+            raise ExportError(f"Invalid filter value: {e}")
+        return queryset.order_by('pk').values_list(*(self.columns[column] for column in columns))
+
+    def field(self, column):
+        """The model field a column reads, following relations"""
+        model = self.queryset().model
+        parts = self.columns[column].split('__')
+        for part in parts[:-1]:
+            model = model._meta.get_field(part).related_model
+        field = model._meta.get_field(parts[-1])
+        return field.target_field if field.is_relation else field
+
+
+def _boolean(name, value):
+    value = str(value).lower()
+    if value in _TRUE:
+        return True
+    if value in _FALSE:
+        return False
+    raise ExportError(f"Filter {name} must be true or false")
+
+
+EXPORTS = {dataset.name: dataset for dataset in [
+    ExportDataset(
+        'fees',
+        lambda: Fee.objects.all(),
+        columns={
+            'id': 'id',
+            'student_id': 'user_id',
+            'username': 'user__username',
+            'first_name': 'user__first_name',
+            'last_name': 'user__last_name',
+            'bus_number': 'user__assigned_seat__bus__bus_number',
+            'month': 'month',
+            'year': 'year',
+            'semester': 'semester',
+            'academic_year': 'academic_year',
+            'amount': 'amount',
+            'paid_amount': 'paid_amount',
+            'pending_amount': 'pending_amount',
+            'payment_status': 'payment_status',
+            'due_date': 'due_date',
+            'paid_date': 'paid_date',
+            'payment_method': 'payment_method',
+            'transaction_id': 'transaction_id',
+            'distance_km': 'distance_km',
+            'reminder_sent_count': 'reminder_sent_count',
+            'created_at': 'created_at',
+        },
+        filters={
+            'status': 'payment_status',
+            'year': 'year',
+            'month': 'month',
+            'semester': 'semester',
+            'academic_year': 'academic_year',
+            'student': 'user_id',
+            'bus': 'user__assigned_seat__bus_id',
+            'due_from': 'due_date__gte',
+            'due_to': 'due_date__lte',
+        },
+        default_columns=[
+            'id', 'student_id', 'username', 'month', 'year', 'amount', 'paid_amount',
+            'pending_amount', 'payment_status', 'due_date', 'paid_date', 'transaction_id',
+        ]
+    ),
+    ExportDataset(
+        'attendance',
+        lambda: Attendance.objects.all(),
+        columns={
+            'id': 'id',
+            'student_id': 'user_id',
+            'username': 'user__username',
+            'first_name': 'user__first_name',
+            'last_name': 'user__last_name',
+            'role': 'user__role',
+            'bus_number': 'user__assigned_seat__bus__bus_number',
+            'date': 'date',
+            'status': 'status',
+            'is_approved': 'is_approved',
+            'approved_by': 'approved_by__username',
+            'remarks': 'remarks',
+            'created_at': 'created_at',
+        },
+        filters={
+            'status': 'status',
+            'student': 'user_id',
+            'bus': 'user__assigned_seat__bus_id',
+            'date_from': 'date__gte',
+            'date_to': 'date__lte',
+            'is_approved': 'is_approved',
+        },
+        default_columns=['id', 'student_id', 'username', 'bus_number', 'date', 'status', 'is_approved']
+    ),
+    ExportDataset(
+        'students',
+        lambda: User.objects.filter(role='STUDENT'),
+        columns={
+            'id': 'id',
+            'username': 'username',
+            'first_name': 'first_name',
+            'last_name': 'last_name',
+            'email': 'email',
+            'phone': 'phone',
+            'college_name': 'college_name',
+            'year': 'year',
+            'course': 'course',
+            'semester': 'semester',
+            'academic_year': 'academic_year',
+            'gender': 'gender',
+            'home_location': 'home_location',
+            'home_latitude': 'home_latitude',
+            'home_longitude': 'home_longitude',
+            'bus_number': 'assigned_seat__bus__bus_number',
+            'seat_number': 'assigned_seat__seat_number',
+            'route_source': 'assigned_seat__bus__source',
+            'route_destination': 'assigned_seat__bus__destination',
+            'unpaid_fees': 'fee_balance__unpaid_count',
+            'pending_amount': 'fee_balance__pending_amount',
+        },
+        filters={
+            'bus': 'assigned_seat__bus_id',
+            'college': 'college_name',
+            'year': 'year',
+            'semester': 'semester',
+            'gender': 'gender',
+            'unseated': 'assigned_seat__isnull',
+        },
+        default_columns=[
+            'id', 'username', 'first_name', 'last_name', 'college_name', 'year',
+            'phone', 'bus_number', 'seat_number', 'pending_amount',
+        ]
+    ),
+]}
+
+
+def get_dataset(name):
+    try:
+        return EXPORTS[name]
+    except KeyError:
+        raise ExportError(f"Unknown export '{name}', choose from {', '.join(EXPORTS)}")
+
+
+def stream_export(dataset, columns, rows, file_format):
+    """The export as an iterator of str (CSV) or bytes (Parquet) chunks"""
+    if file_format == 'csv':
+        return _csv_chunks(columns, rows)
+    if file_format == 'parquet':
+        return _parquet_chunks(dataset, columns, rows)
+    raise ExportError(f"Unsupported format '{file_format}', use csv or parquet")
+
+
+class _Buffer:
+    """Write target that hands back and forgets whatever was written since the last take()"""
+
+    def __init__(self, empty):
+        self.parts = []
+        self.empty = empty
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def take(self):
+        data = self.empty.join(self.parts)
+        self.parts = []
+        return data
+
+    # What pyarrow expects of a file object
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+
+def _csv_chunks(columns, rows):
+    buffer = _Buffer('')
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, row in enumerate(rows.iterator(chunk_size=EXPORT_CHUNK_SIZE), 1):
+        writer.writerow(row)
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.take()
+    yield buffer.take()
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ExportError('Parquet export needs pyarrow, install it with: pip install pyarrow')
+    return pyarrow, pyarrow.parquet
+
+
+def parquet_available():
+    try:
+        _pyarrow()
+    except ExportError:
+        return False
+    return True
+
+
+def _arrow_type(pa, field):
+    internal_type = field.get_internal_type()
+    if internal_type in _INTEGER_TYPES:
+        return pa.int64()
+    if internal_type == 'DecimalField':
+        return pa.decimal128(field.max_digits, field.decimal_places)
+    if internal_type == 'FloatField':
+        return pa.float64()
+    if internal_type == 'BooleanField':
+        return pa.bool_()
+    if internal_type == 'DateField':
+        return pa.date32()
+    if internal_type == 'DateTimeField':
+        return pa.timestamp('us', tz='UTC' if settings.USE_TZ else None)
+    return pa.string()
+
+
+def _parquet_chunks(dataset, columns, rows):
+    pa, pq = _pyarrow()
+    schema = pa.schema([(column, _arrow_type(pa, dataset.field(column))) for column in columns])
+    buffer = _Buffer(b'')
+    writer = pq.ParquetWriter(buffer, schema)
+
+    def row_group(batch):
+        writer.write_table(pa.Table.from_arrays([
+            pa.array(values, type=schema.field(index).type)
+            for index, values in enumerate(zip(*batch))
+        ], schema=schema))
+
+    batch = []
+    for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        batch.append(row)
+        if len(batch) >= PARQUET_ROW_GROUP_SIZE:
+            row_group(batch)
+            batch = []
+            yield buffer.take()
+    if batch:
+        row_group(batch)
+    writer.close()
+    yield buffer.take()
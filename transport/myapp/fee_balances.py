@@ -0,0 +1,116 @@
+from django.db import connection, transaction
+from django.db.models import Count, Min, Sum
+from django.utils import timezone
+
+from .fees import UNPAID_FEE_STATUSES
+from .models import Fee, FeeBalance, User
+
+
+# Users per refresh transaction and per rebuild chunk
+BALANCE_BATCH_SIZE = 1000
+
+BALANCE_FIELDS = ['total_amount', 'paid_amount', 'pending_amount', 'unpaid_count', 'oldest_due_date']
+
+EMPTY_BALANCE = {
+    'total_amount': 0,
+    'paid_amount': 0,
+    'pending_amount': 0,
+    'unpaid_count': 0,
+    'oldest_due_date': None,
+}
+
+
+def fee_balance(user):
+    """
+    A user's balance, from the select_related/cached row when there is one,
+    otherwise an unsaved all-zero balance
+    """
+    try:
+        return user.fee_balance
+    except FeeBalance.DoesNotExist:
+        return FeeBalance(user=user)
+
+
+def refresh_fee_balances(user_ids):
+    """
+    Recompute the balances of these users from their fees. Call it in the
+    same transaction as any write that bypasses Fee.save/delete (bulk_create,
+    bulk_update, queryset.update of amounts or statuses).
+
+    Each user's balance row is created if needed and locked before the fees
+    are summed, so concurrent refreshes of one user serialize and the last
+    one always sees every committed fee.
+    """
+    user_ids = sorted(set(user_ids))
+    for start in range(0, len(user_ids), BALANCE_BATCH_SIZE):
+        with transaction.atomic():
+            _reconcile(user_ids[start:start + BALANCE_BATCH_SIZE])
+
+
+def rebuild_fee_balances(chunk_size=BALANCE_BATCH_SIZE):
+    """
+    Reconcile every balance with the fees table, walking users in id order
+    one chunk per transaction. Only rows that disagree are written. Returns
+    how many users were checked and how many balances were fixed.
+    """
+    counts = {'checked': 0, 'fixed': 0}
+    last_id = 0
+    while True:
+        user_ids = list(User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not user_ids:
+            return counts
+        with transaction.atomic():
+            billed = set(Fee.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True).distinct())
+            counts['fixed'] += _reconcile(user_ids, create=billed)
+        counts['checked'] += len(user_ids)
+        last_id = user_ids[-1]
+
+
+def unpaid_totals(user_ids):
+    """Balance values computed from the fees table, keyed by user id (users without unpaid fees are left out)"""
+    return {
+        row.pop('user_id'): row
+        for row in Fee.objects.filter(
+            user_id__in=user_ids, payment_status__in=UNPAID_FEE_STATUSES
+        ).values('user_id').annotate(
+            total_amount=Sum('amount'),
+            paid_amount=Sum('paid_amount'),
+            pending_amount=Sum('pending_amount'),
+            unpaid_count=Count('id'),
+            oldest_due_date=Min('due_date')
+        ).order_by()
+    }
+
+
+def _reconcile(user_ids, create=None):
+    """
+    Lock the balance rows of user_ids (creating those of `create`, default
+    all of them), recompute them and save the ones that changed. Must run
+    inside a transaction. Returns the number of rows written.
+    """
+    FeeBalance.objects.bulk_create(
+        [FeeBalance(user_id=user_id) for user_id in (user_ids if create is None else sorted(create))],
+        ignore_conflicts=True
+    )
+    balances = list(FeeBalance.objects.select_for_update().filter(user_id__in=user_ids).order_by('user_id'))
+    totals = unpaid_totals(user_ids)
+
+    now = timezone.now()
+    changed = []
+    for balance in balances:
+        values = totals.get(balance.user_id, EMPTY_BALANCE)
+        if all(getattr(balance, field) == values[field] for field in BALANCE_FIELDS):
+            continue
+        for field in BALANCE_FIELDS:
+            setattr(balance, field, values[field])
+        balance.updated_at = now
+        changed.append(balance)
+    if connection.features.supports_update_conflicts_with_target:
+        # One INSERT ... ON CONFLICT DO UPDATE, much cheaper than bulk_update's CASE per row
+        FeeBalance.objects.bulk_create(
+            changed, update_conflicts=True, unique_fields=['user'], update_fields=BALANCE_FIELDS + ['updated_at']
+        )
+    else:
+        # MySQL cannot name the conflict target; the rows exist already, created above
+        FeeBalance.objects.bulk_update(changed, BALANCE_FIELDS + ['updated_at'])
+    return len(changed)
@@ -0,0 +1,144 @@
+from collections import Counter
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.db import IntegrityError, transaction
+
+from .distance import coordinate_array, distances_to_university
+from .fee_balances import refresh_fee_balances
+from .fees import DEFAULT_FEE_DISTANCE_KM, calculate_bus_fee_from_distance, fee_assigned_message
+from .models import Fee, Notification, User
+from .notifications import notifications_created
+
+
+# Fees (and their notifications) per transaction
+FEE_GENERATION_CHUNK_SIZE = 2000
+
+
+def insert_unbilled_fees(fees, batch_size=None):
+    """
+    Insert the fees (all of one month and year) of the students not billed
+    for that period yet, returns the fees actually inserted.
+
+    When a concurrent request bills one of the students between the check
+    and the INSERT, the unique (user, month, year) key rejects the batch; it
+    is rolled back to a savepoint, the billed students are read again with a
+    locking read (which sees the other request's committed row) and the rest
+    inserted, so callers only ever notify and count their own rows.
+    """
+    if not fees:
+        return []
+    month, year = fees[0].month, fees[0].year
+    user_ids = [fee.user_id for fee in fees]
+    already_billed = billed_user_ids(month, year, user_ids)
+    while True:
+        fees = [fee for fee in fees if fee.user_id not in already_billed]
+        if not fees:
+            return []
+        try:
+            with transaction.atomic():
+                Fee.objects.bulk_create(fees, batch_size=batch_size)
+            return fees
+        except IntegrityError:
+            billed_now = billed_user_ids(month, year, user_ids, lock=True)
+            if billed_now <= already_billed:
+                # Not a duplicate fee
+                raise
+            already_billed = billed_now
+            for fee in fees:
+                # Ids from batches that were rolled back
+                fee.pk = None
+
+
+def billed_user_ids(month, year, user_ids, lock=False):
+    """Which of the students already have a fee for month/year"""
+    fees = Fee.objects.filter(month=month, year=year, user_id__in=user_ids)
+    if lock:
+        fees = fees.select_for_update()
+    return set(fees.values_list('user_id', flat=True))
+
+
+class FeeGenerationService:
+    """
+    Bills every seated student for one fee period in bulk.
+
+    plan() reads the students in one query, skips those already billed for
+    the period, computes every distance to the university in one vectorized
+    pass and prices them with calculate_bus_fee_from_distance. apply() then
+    writes the planned fees in chunks through insert_unbilled_fees, one
+    transaction per chunk, so running it again (or after a crash, or next to
+    a concurrent run) only adds and notifies what is missing.
+    """
+
+    @staticmethod
+    def plan(month, year, due_date, semester=None, academic_year=None, today=None):
+        """Unsaved fees for every seated student not yet billed for month/year, and a summary"""
+        students = list(User.objects.filter(
+            role='STUDENT', assigned_seat__isnull=False, assigned_seat__is_available=False
+        ).order_by('id').values_list('id', 'home_latitude', 'home_longitude', 'semester', 'academic_year'))
+        billed = set(Fee.objects.filter(month=month, year=year).values_list('user_id', flat=True))
+        to_bill = [row for row in students if row[0] not in billed]
+
+        distances = distances_to_university(coordinate_array((row[1], row[2]) for row in to_bill))
+        missing = np.isnan(distances)
+        distances = np.where(missing, DEFAULT_FEE_DISTANCE_KM, distances)
+
+        # Fee.save would mark a fee that is already past due OVERDUE
+        payment_status = 'OVERDUE' if due_date < (today or date.today()) else 'PENDING'
+        fees = []
+        for (user_id, _, _, student_semester, student_academic_year), distance_km in zip(to_bill, distances.tolist()):
+            amount = Decimal(calculate_bus_fee_from_distance(distance_km))
+            fees.append(Fee(
+                user_id=user_id,
+                amount=amount,
+                pending_amount=amount,
+                month=month,
+                year=year,
+                semester=semester or student_semester,
+                academic_year=academic_year or student_academic_year,
+                due_date=due_date,
+                payment_status=payment_status,
+                distance_km=Decimal(str(round(distance_km, 2)))
+            ))
+
+        tiers = Counter(fee.amount for fee in fees)
+        return {
+            'fees': fees,
+            'summary': {
+                'month': month,
+                'year': year,
+                'due_date': due_date,
+                'seated_students': len(students),
+                'already_billed': len(students) - len(to_bill),
+                'to_create': len(fees),
+                'missing_coordinates': int(missing.sum()),
+                'total_amount': sum(amount * count for amount, count in tiers.items()),
+                'tiers': {str(amount): tiers[amount] for amount in sorted(tiers)},
+            }
+        }
+
+    @staticmethod
+    def apply(plan, notify=True, chunk_size=FEE_GENERATION_CHUNK_SIZE):
+        """
+        Write a plan's fees, refresh their balances and notify the students.
+        Fees that exist by now (a re-run of a stale plan) are skipped and not
+        notified again. Returns the number of fees written.
+        """
+        fees = plan['fees']
+        written = 0
+        for start in range(0, len(fees), chunk_size):
+            with transaction.atomic():
+                chunk = insert_unbilled_fees(fees[start:start + chunk_size])
+                refresh_fee_balances(fee.user_id for fee in chunk)
+                if notify:
+                    notifications_created(Notification.objects.bulk_create([
+                        Notification(
+                            user_id=fee.user_id,
+                            message=fee_assigned_message(fee.amount, fee.month, fee.year, fee.due_date, float(fee.distance_km)),
+                            created_by=None
+                        )
+                        for fee in chunk
+                    ]))
+            written += len(chunk)
+        return written
@@ -0,0 +1,163 @@
+import logging
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .fees import UNPAID_FEE_STATUSES
+from .models import Fee, FeeBalance, FeeReminderJob, Notification
+from .notifications import notifications_created
+from .workers import BackgroundWorker
+
+
+logger = logging.getLogger(__name__)
+
+# Students per chunk: one balance query, one bulk_create, one UPDATE
+REMINDER_CHUNK_SIZE = 500
+
+
+def start_fee_reminder_job(created_by, bus_id=None, student_ids=None):
+    """
+    Queue a bulk fee reminder for the unpaid students of a bus, a list of
+    students, or (neither given) every unpaid student. Runs after commit.
+    """
+    job = FeeReminderJob(
+        bus_id=bus_id,
+        student_ids=None if bus_id else (list(student_ids) if student_ids else None),
+        created_by=created_by,
+        sender_role=created_by.role
+    )
+    job.total = owing_balances(job).count()
+    job.save()
+    transaction.on_commit(fee_reminders.wake)
+    return job
+
+
+def owing_balances(job):
+    """Fee balances of the students within a job's scope that have unpaid fees"""
+    balances = FeeBalance.objects.filter(unpaid_count__gt=0, user__role='STUDENT')
+    if job.bus_id:
+        balances = balances.filter(user__assigned_seat__bus_id=job.bus_id, user__assigned_seat__is_available=False)
+    elif job.student_ids is not None:
+        balances = balances.filter(user_id__in=job.student_ids)
+    return balances
+
+
+def reminder_message(student, sender_role, balance):
+    seat = getattr(student, 'assigned_seat', None)
+    if seat is not None:
+        bus_info = f"Bus {seat.bus.bus_number} (Seat {seat.seat_number})"
+        route_info = f"{seat.bus.source} → {seat.bus.destination}"
+    else:
+        bus_info = "Not assigned to any bus"
+        route_info = "N/A"
+
+    sender_text = "Admin" if sender_role == 'ADMIN' else "Driver"
+    return f"""
+🚨 FEE PAYMENT REMINDER (from {sender_text})
+
+Student: {student.first_name} {student.last_name}
+{bus_info}
+Route: {route_info}
+
+💰 Fee Details:
+Total Amount: ₹{balance.total_amount}
+Paid Amount: ₹{balance.paid_amount}
+Pending Amount: ₹{balance.pending_amount}
+
+📅 Unpaid Fees: {balance.unpaid_count}
+
+Please clear your pending dues at the earliest to continue using transport services.
+    """.strip()
+
+
+def job_progress(job):
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'total': job.total,
+        'sent_count': job.sent_count,
+        'progress': round(100 * job.sent_count / job.total, 1) if job.total else 100.0,
+        'error': job.error,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
+
+
+class FeeReminderRunner(BackgroundWorker):
+    """
+    Works through fee reminder jobs chunk by chunk.
+
+    Each chunk is one transaction: the students and their totals from one
+    query on the fee balances, the messages rendered in memory, one bulk_create of notifications
+    and one `reminder_sent_count = reminder_sent_count + 1` UPDATE, then the
+    job's cursor and progress. The job row is locked for the chunk, so a
+    crash loses at most the chunk in flight and any worker can pick the job
+    up where it stopped.
+    """
+    mode_setting = 'BACKGROUND_JOB_MODE'
+    thread_name = 'fee-reminders'
+
+    def run_pending(self):
+        """Run every queued or interrupted job, returns their ids"""
+        job_ids = list(FeeReminderJob.objects.filter(
+            status__in=['PENDING', 'RUNNING']
+        ).order_by('id').values_list('id', flat=True))
+        for job_id in job_ids:
+            self.run_job(job_id)
+        return job_ids
+
+    def run_job(self, job_id):
+        try:
+            while self.run_chunk(job_id):
+                pass
+        except Exception as e:
+            logger.exception('Fee reminder job %s failed', job_id)
+            FeeReminderJob.objects.filter(id=job_id).update(status='FAILED', error=str(e), finished_at=timezone.now())
+
+    def run_chunk(self, job_id):
+        """Process the next chunk of a job, False once there is nothing left"""
+        now = timezone.now()
+        with transaction.atomic():
+            job = FeeReminderJob.objects.select_for_update(skip_locked=True).filter(
+                id=job_id, status__in=['PENDING', 'RUNNING']
+            ).first()
+            if job is None:
+                return False
+            if job.status == 'PENDING':
+                job.status = 'RUNNING'
+                job.started_at = now
+
+            balances = list(owing_balances(job).select_related('user__assigned_seat__bus').filter(
+                user_id__gt=job.last_student_id
+            ).order_by('user_id')[:REMINDER_CHUNK_SIZE])
+            if not balances:
+                job.status = 'COMPLETED'
+                job.finished_at = now
+                job.save()
+                return False
+
+            user_ids = [balance.user_id for balance in balances]
+            notifications_created(Notification.objects.bulk_create([
+                Notification(
+                    user_id=balance.user_id,
+                    message=reminder_message(balance.user, job.sender_role, balance),
+                    created_by_id=job.created_by_id
+                )
+                for balance in balances
+            ]))
+            Fee.objects.filter(user_id__in=user_ids, payment_status__in=UNPAID_FEE_STATUSES).update(
+                reminder_sent_count=F('reminder_sent_count') + 1,
+                last_reminder_sent=now,
+                reminder_sent_by_id=job.created_by_id,
+                updated_at=now
+            )
+
+            job.last_student_id = user_ids[-1]
+            job.sent_count += len(balances)
+            job.save()
+        return True
+
+
+fee_reminders = FeeReminderRunner()
@@ -0,0 +1,58 @@
+from datetime import date, timedelta
+
+
+# Fee statuses that still have money outstanding
+UNPAID_FEE_STATUSES = ['PENDING', 'OVERDUE', 'PARTIAL']
+
+# Billing distance for students whose home has no coordinates (mid-range tier)
+DEFAULT_FEE_DISTANCE_KM = 15
+
+
+def calculate_bus_fee_from_distance(distance_km):
+    """
+    Calculate monthly bus fee based on distance from home to university
+    Distance tiers:
+    - 0-20 km: ₹15000
+    - 21-50 km: ₹30000
+    - 51-60 km: ₹40000
+    - 60+ km: ₹40000 (max)
+    """
+    if distance_km <= 20:
+        return 15000
+    elif distance_km <= 50:
+        return 30000
+    else:
+        return 40000
+
+
+def calculate_driver_salary_from_distance(distance_km):
+    """
+    Calculate driver salary based on route distance
+    - 0-20 km: ₹15000
+    - 21-50 km: ₹30000
+    - 51-60 km: ₹40000
+    """
+    if distance_km <= 20:
+        return 15000
+    elif distance_km <= 50:
+        return 30000
+    else:
+        return 40000
+
+
+def current_fee_period(today=None):
+    """Return (month_name, year, due_date) for the monthly fee, due at the end of the month"""
+    current_date = today or date.today()
+    year = current_date.year
+    
+    if current_date.month == 12:
+        next_month = date(year + 1, 1, 1)
+    else:
+        next_month = date(year, current_date.month + 1, 1)
+    due_date = next_month - timedelta(days=1)
+    
+    return current_date.strftime('%B'), year, due_date
+
+
+def fee_assigned_message(fee_amount, month_name, year, due_date, distance_km):
+    return f"💰 Bus fee assigned: ₹{fee_amount} for {month_name} {year}. Due date: {due_date}. Distance from university: {distance_km:.1f} km"
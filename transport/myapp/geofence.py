@@ -0,0 +1,318 @@
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.utils import timezone
+
+from .distance import UNIVERSITY_LATITUDE, UNIVERSITY_LONGITUDE, haversine_km
+from .models import Bus, Notification, Seat
+from .notifications import notifications_created
+
+
+# Radii in metres: approach announces the bus, arrival needs to be close, and
+# a departure is only reported once the bus is clearly moving away again
+APPROACH_RADIUS_M = 1000
+ARRIVAL_RADIUS_M = 150
+DEPARTURE_RADIUS_M = 300
+
+# Grid cell size in degrees (~2.2 km), larger than any fence diameter so a
+# fence covers at most four cells and a position only needs its own cell
+GEOFENCE_CELL_DEG = 0.02
+
+REBUILD_INTERVAL_SECONDS = 300
+
+# Invalidations within this window share one rebuild
+MIN_REBUILD_SECONDS = 30
+
+# Which transitions notify whom: 'student' is the student at a pickup point,
+# 'bus' every student seated on the bus
+NOTIFY = {
+    ('pickup', 'approaching'): 'student',
+    ('pickup', 'arrived'): 'student',
+    ('source', 'departed'): 'bus',
+    ('destination', 'arrived'): 'bus',
+    ('university', 'arrived'): 'bus',
+}
+
+
+class Fence:
+    __slots__ = ('id', 'kind', 'bus_id', 'lat', 'lng', 'user_id', 'label')
+
+    def __init__(self, fence_id, kind, bus_id, lat, lng, user_id=None, label=''):
+        self.id = fence_id
+        self.kind = kind
+        self.bus_id = bus_id
+        self.lat = lat
+        self.lng = lng
+        self.user_id = user_id
+        self.label = label
+
+
+class GeofenceEngine:
+    """
+    Streaming approach/arrival/departure detection for bus positions.
+
+    Fences are circles around every bus source and destination, the
+    university and the home of every seated student (a pickup point of that
+    student's bus only). They are hashed into a grid keyed by (bus, cell),
+    with the university under bus None, so each position only looks at the
+    fences of its own cell plus the few it is already inside, whatever the
+    size of the fleet. Per bus and fence a small state machine turns
+    positions into events, so each event fires once per visit. Changes to a
+    bus, its seats or its students' homes only reload that bus's fences.
+    """
+
+    def __init__(self, cell_size=GEOFENCE_CELL_DEG, rebuild_interval=REBUILD_INTERVAL_SECONDS):
+        self.cell_size = cell_size
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.RLock()
+        self._cells = defaultdict(list)  # (bus_id, row, col) -> [Fence]
+        self._fences = {}
+        self._buses = {}  # bus_id -> (bus_number, [student ids])
+        self._seats = {}  # seat_id -> (bus_id, student id) of every taken seat
+        self._student_buses = {}  # student id -> bus_id
+        self._states = defaultdict(dict)  # bus_id -> {fence_id: state}
+        self._built_at = None  # last full reload
+        self._refreshed_at = None  # last reload of any kind
+        self._stale = True
+        self._dirty_buses = set()
+        self._rebuilding = False
+
+    # -- maintenance -----------------------------------------------------
+
+    def invalidate(self, bus_id=None):
+        """
+        Reload the fences of one bus, or of every bus, on the next position
+        (cheap, safe to call from signals)
+        """
+        with self._lock:
+            if bus_id is None:
+                self._stale = True
+            else:
+                self._dirty_buses.add(bus_id)
+
+    def seat_changed(self, seat, deleted=False):
+        """Invalidate the seat's bus, unless the seat still has the passenger the fences were built with"""
+        passenger = None if deleted or seat.assigned_user_id is None else (seat.bus_id, seat.assigned_user_id)
+        if self._built_at is not None and self._seats.get(seat.id) == passenger:
+            return
+        self.invalidate(seat.bus_id)
+        previous = self._seats.get(seat.id)
+        if previous is not None and previous[0] != seat.bus_id:
+            self.invalidate(previous[0])
+
+    def student_moved(self, user_id):
+        """A student's home changed: only the bus they ride has a pickup fence for it"""
+        if self._built_at is None:
+            return
+        bus_id = self._student_buses.get(user_id)
+        if bus_id is not None:
+            self.invalidate(bus_id)
+
+    def needs_rebuild(self):
+        if self._built_at is None:
+            return True
+        now = time.monotonic()
+        if now - self._built_at > self.rebuild_interval:
+            return True
+        return (self._stale or bool(self._dirty_buses)) and now - self._refreshed_at > MIN_REBUILD_SECONDS
+
+    def claim_rebuild(self):
+        """
+        True for the one caller that should rebuild now. While its rebuild
+        runs everyone else gets False and keeps using the current fences.
+        """
+        with self._lock:
+            if self._rebuilding or not self.needs_rebuild():
+                return False
+            self._rebuilding = True
+            return True
+
+    def rebuild(self):
+        """
+        Reload the fences from the database: all of them when the engine is
+        stale or due its periodic reload, otherwise only the invalidated buses
+        """
+        with self._lock:
+            full = self._stale or self._built_at is None or \
+                time.monotonic() - self._built_at > self.rebuild_interval
+            dirty, self._dirty_buses = self._dirty_buses, set()
+            self._stale = False
+        try:
+            self._load(None if full else dirty)
+        except Exception:
+            with self._lock:
+                self._stale = self._stale or full
+                self._dirty_buses |= dirty
+            raise
+        finally:
+            self._rebuilding = False
+
+    def _load(self, bus_ids=None):
+        """Load the fences of the given buses, or of every bus and the university when None"""
+        fences = []
+        buses = {}
+        bus_rows = Bus.objects.only(
+            'id', 'bus_number', 'source', 'destination', 'source_latitude', 'source_longitude',
+            'destination_latitude', 'destination_longitude'
+        )
+        seat_rows = Seat.objects.filter(assigned_user__isnull=False)
+        if bus_ids is not None:
+            bus_rows = bus_rows.filter(id__in=bus_ids)
+            seat_rows = seat_rows.filter(bus_id__in=bus_ids)
+
+        for bus in bus_rows:
+            buses[bus.id] = (bus.bus_number, [])
+            if bus.source_latitude and bus.source_longitude:
+                fences.append(Fence(
+                    f'source:{bus.id}', 'source', bus.id,
+                    float(bus.source_latitude), float(bus.source_longitude), label=bus.source
+                ))
+            if bus.destination_latitude and bus.destination_longitude:
+                lat, lng = float(bus.destination_latitude), float(bus.destination_longitude)
+                # A destination at the university would only repeat its events
+                if haversine_km(lat, lng, UNIVERSITY_LATITUDE, UNIVERSITY_LONGITUDE) * 1000 > ARRIVAL_RADIUS_M:
+                    fences.append(Fence(f'destination:{bus.id}', 'destination', bus.id, lat, lng, label=bus.destination))
+
+        if bus_ids is None:
+            fences.append(Fence('university', 'university', None, UNIVERSITY_LATITUDE, UNIVERSITY_LONGITUDE, label='the university'))
+
+        seats = {}
+        for seat_id, bus_id, user_id, lat, lng in seat_rows.values_list(
+            'id', 'bus_id', 'assigned_user_id', 'assigned_user__home_latitude', 'assigned_user__home_longitude'
+        ):
+            seats[seat_id] = (bus_id, user_id)
+            if bus_id in buses:
+                buses[bus_id][1].append(user_id)
+            if lat and lng:
+                fences.append(Fence(f'pickup:{user_id}', 'pickup', bus_id, float(lat), float(lng), user_id=user_id))
+
+        cells = defaultdict(list)
+        for fence in fences:
+            for cell in self._covered_cells(fence):
+                cells[(fence.bus_id,) + cell].append(fence)
+
+        with self._lock:
+            if bus_ids is None:
+                self._cells = cells
+                self._fences = {fence.id: fence for fence in fences}
+                self._buses = buses
+                self._seats = seats
+            else:
+                # Swap in the reloaded buses, keep everyone else's fences
+                kept_cells = defaultdict(list, {key: value for key, value in self._cells.items() if key[0] not in bus_ids})
+                for key, value in cells.items():
+                    kept_cells[key].extend(value)
+                self._cells = kept_cells
+                self._fences = {
+                    **{fence_id: fence for fence_id, fence in self._fences.items() if fence.bus_id not in bus_ids},
+                    **{fence.id: fence for fence in fences}
+                }
+                self._buses = {**{key: value for key, value in self._buses.items() if key not in bus_ids}, **buses}
+                self._seats = {**{key: value for key, value in self._seats.items() if value[0] not in bus_ids}, **seats}
+            self._student_buses = {user_id: bus_id for bus_id, user_id in self._seats.values()}
+            now = time.monotonic()
+            if bus_ids is None:
+                self._built_at = now
+            self._refreshed_at = now
+
+    def _cell(self, lat, lng):
+        return (int(math.floor(lat / self.cell_size)), int(math.floor(lng / self.cell_size)))
+
+    def _covered_cells(self, fence):
+        d_lat = APPROACH_RADIUS_M / 111_320
+        d_lng = d_lat / max(math.cos(math.radians(fence.lat)), 0.01)
+        min_row, min_col = self._cell(fence.lat - d_lat, fence.lng - d_lng)
+        max_row, max_col = self._cell(fence.lat + d_lat, fence.lng + d_lng)
+        return [(row, col) for row in range(min_row, max_row + 1) for col in range(min_col, max_col + 1)]
+
+    # -- evaluation ------------------------------------------------------
+
+    def process(self, bus_id, lat, lng):
+        """
+        Evaluate one position of a bus, returns the events it triggers as
+        dicts with event, fence, fence_id, label, bus_id, distance_m.
+        """
+        events = []
+        cell = self._cell(lat, lng)
+        with self._lock:
+            states = self._states[bus_id]
+            candidates = {fence.id: fence for fence in self._cells.get((bus_id,) + cell, ())}
+            candidates.update((fence.id, fence) for fence in self._cells.get((None,) + cell, ()))
+            for fence_id in list(states):
+                fence = self._fences.get(fence_id)
+                if fence is None:
+                    del states[fence_id]
+                else:
+                    candidates[fence_id] = fence
+
+            for fence in candidates.values():
+                distance_m = haversine_km(lat, lng, fence.lat, fence.lng) * 1000
+                state = states.get(fence.id)
+                new_state = state
+                if distance_m <= ARRIVAL_RADIUS_M:
+                    new_state = 'arrived'
+                elif distance_m <= APPROACH_RADIUS_M:
+                    if state is None:
+                        new_state = 'approaching'
+                    elif state == 'arrived' and distance_m > DEPARTURE_RADIUS_M:
+                        new_state = 'departed'
+                elif state is not None:
+                    if state == 'arrived':
+                        events.append(self._event('departed', fence, bus_id, distance_m))
+                    del states[fence.id]
+                    continue
+
+                if new_state != state:
+                    states[fence.id] = new_state
+                    events.append(self._event(new_state, fence, bus_id, distance_m))
+        return events
+
+    @staticmethod
+    def _event(name, fence, bus_id, distance_m):
+        return {
+            'event': name,
+            'fence': fence.kind,
+            'fence_id': fence.id,
+            'label': fence.label,
+            'bus_id': bus_id,
+            'distance_m': round(distance_m),
+            'timestamp': timezone.now().isoformat(),
+        }
+
+    # -- notifications ---------------------------------------------------
+
+    def notify(self, events):
+        """Store the notifications for a batch of events with one bulk_create"""
+        notifications = []
+        for event in events:
+            audience = NOTIFY.get((event['fence'], event['event']))
+            if audience is None:
+                continue
+            bus_number, students = self._buses.get(event['bus_id'], (event['bus_id'], []))
+            message = _message(event, bus_number)
+            if audience == 'student':
+                fence = self._fences.get(event['fence_id'])
+                recipients = [fence.user_id] if fence is not None else []
+            else:
+                recipients = students
+            notifications.extend(
+                Notification(user_id=user_id, message=message, created_by=None) for user_id in recipients
+            )
+        if notifications:
+            notifications_created(Notification.objects.bulk_create(notifications))
+        return len(notifications)
+
+
+def _message(event, bus_number):
+    if event['fence'] == 'pickup' and event['event'] == 'approaching':
+        return f"🚌 Bus {bus_number} is approaching your pickup point (about {event['distance_m']} m away)"
+    if event['fence'] == 'pickup':
+        return f"📍 Bus {bus_number} has arrived at your pickup point"
+    if event['event'] == 'departed':
+        return f"🚌 Bus {bus_number} has departed from {event['label']}"
+    return f"🏁 Bus {bus_number} has arrived at {event['label']}"
+
+
+geofences = GeofenceEngine()
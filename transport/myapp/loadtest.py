@@ -0,0 +1,292 @@
+import asyncio
+import json
+import math
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.db import connection
+
+from .distance import UNIVERSITY_LATITUDE, UNIVERSITY_LONGITUDE
+from .location_buffer import location_buffer
+from .models import Bus
+from .routing import websocket_urlpatterns
+
+
+LOAD_TEST_TARGETS = ['bus', 'driver']
+
+# Average bus speed along the synthetic tracks
+TRACK_SPEED_KMH = 35
+
+# How long to wait after the last update for deliveries still in flight
+DRAIN_SECONDS = 5
+
+_WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class _QueryCounter:
+    """execute_wrapper counting statements while `counting` is set"""
+
+    def __init__(self):
+        self.counting = False
+        self.queries = 0
+        self.writes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.counting:
+            self.queries += 1
+            if sql.lstrip()[:6].upper() in _WRITE_STATEMENTS:
+                self.writes += 1
+        return execute(sql, params, many, context)
+
+
+class Track:
+    """A bus driving back and forth between its route start and the university"""
+
+    def __init__(self, start, phase, speed_kmh=TRACK_SPEED_KMH):
+        self.start = start
+        self.phase = phase
+        lat_km = (UNIVERSITY_LATITUDE - start[0]) * 111.0
+        lng_km = (UNIVERSITY_LONGITUDE - start[1]) * 111.0 * math.cos(math.radians(start[0]))
+        self.hours_per_leg = max(math.hypot(lat_km, lng_km), 1.0) / speed_kmh
+
+    def position(self, seconds):
+        legs = (seconds / 3600 / self.hours_per_leg + self.phase) % 2
+        fraction = legs if legs <= 1 else 2 - legs
+        return (
+            round(self.start[0] + (UNIVERSITY_LATITUDE - self.start[0]) * fraction, 6),
+            round(self.start[1] + (UNIVERSITY_LONGITUDE - self.start[1]) * fraction, 6),
+        )
+
+
+class LocationLoadTest:
+    """
+    Drives BusConsumer and DriverLocationConsumer in-process and measures them.
+
+    Every simulated driver owns one bus of the database and replays a GPS
+    track at `rate` updates per second to ws/bus/<id>/ and/or
+    ws/drivers/location/ (`targets`). Bus watchers are spread round-robin over
+    the driven buses; fleet watchers listen to every driver like the admin
+    live map. Drivers subscribe their location socket to their own bus so
+    they do not receive the whole fleet themselves.
+
+    Everything runs in this process through channels' WebsocketCommunicator
+    and the configured channel layer, so the load generator shares the CPU
+    with the consumers and the numbers are a lower bound for one worker.
+    """
+
+    def __init__(self, drivers=50, bus_watchers=100, fleet_watchers=5, rate=1.0, duration=30,
+                 targets=LOAD_TEST_TARGETS, seed=42, drain_seconds=DRAIN_SECONDS, log=None):
+        self.drivers = drivers
+        self.bus_watchers = bus_watchers
+        self.fleet_watchers = fleet_watchers
+        self.rate = rate
+        self.duration = duration
+        self.targets = list(targets)
+        self.rng = np.random.default_rng(seed)
+        self.drain_seconds = drain_seconds
+        self.log = log or (lambda message: None)
+
+    def run(self):
+        """Run the load test, returns the report"""
+        buses = list(Bus.objects.filter(driver__isnull=False).order_by('id').values_list(
+            'id', 'driver_id', 'source_latitude', 'source_longitude'
+        )[:self.drivers])
+        if len(buses) < self.drivers:
+            raise ValueError(
+                f'Only {len(buses)} buses have a driver, {self.drivers} needed. '
+                'Generate more with: python manage.py generate_synthetic_data'
+            )
+        self.fleet = [
+            (bus_id, driver_id, Track(
+                (float(lat), float(lng)) if lat and lng else (UNIVERSITY_LATITUDE - 0.2, UNIVERSITY_LONGITUDE),
+                float(self.rng.random() * 2)
+            ))
+            for bus_id, driver_id, lat, lng in buses
+        ]
+        # Database work of the consumers runs on this thread (thread-sensitive sync_to_async)
+        self.counter = _QueryCounter()
+        with connection.execute_wrapper(self.counter):
+            return async_to_sync(self._run)()
+
+    async def _run(self):
+        application = URLRouter(websocket_urlpatterns)
+        self.sent_at = {}
+        self.latencies = []
+        self.delivered = 0
+        self.expected = 0
+        self.lags = []
+
+        tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        self.log('Connecting')
+        senders, watchers = await self._connect(application)
+        sender_sockets = [communicator for sockets in senders.values() for communicator in sockets.values()]
+        connections = len(sender_sockets) + len(watchers)
+        memory_per_connection = (tracemalloc.get_traced_memory()[0] - memory_before) / max(connections, 1)
+        tracemalloc.stop()
+
+        receivers = [asyncio.ensure_future(self._receive(*watcher)) for watcher in watchers]
+        receivers += [asyncio.ensure_future(self._drain(communicator)) for communicator in sender_sockets]
+
+        self.log(f'Replaying tracks for {self.duration}s')
+        self.counter.counting = True
+        started = time.perf_counter()
+        sent = await asyncio.gather(*[
+            self._drive(senders[bus_id], bus_id, driver_id, track, started)
+            for bus_id, driver_id, track in self.fleet
+        ])
+        replayed = time.perf_counter() - started
+        drain_until = time.perf_counter() + self.drain_seconds
+        while self.delivered < self.expected and time.perf_counter() < drain_until:
+            await asyncio.sleep(0.05)
+
+        for receiver in receivers:
+            receiver.cancel()
+        await asyncio.gather(*receivers, return_exceptions=True)
+        for communicator in sender_sockets:
+            await communicator.disconnect()
+        for communicator, *_ in watchers:
+            await communicator.disconnect()
+        # The periodic flush belongs to this event loop; write what it still holds
+        task, location_buffer._flush_task = location_buffer._flush_task, None
+        if task is not None:
+            task.cancel()
+        await database_sync_to_async(location_buffer.flush)()
+        self.counter.counting = False
+        elapsed = time.perf_counter() - started
+
+        return self._report(sum(sent), replayed, elapsed, connections, len(sender_sockets), memory_per_connection)
+
+    async def _connect(self, application):
+        """
+        Open every socket. Returns the senders as {bus_id: {target: communicator}}
+        and the watchers as [(communicator, target, bus_id)].
+        """
+        senders, watchers = {}, []
+        for bus_id, _, _ in self.fleet:
+            sockets = senders[bus_id] = {}
+            if 'bus' in self.targets:
+                sockets['bus'] = await _open(application, f'/ws/bus/{bus_id}/')
+            if 'driver' in self.targets:
+                sockets['driver'] = await _open(application, '/ws/drivers/location/')
+                await sockets['driver'].send_to(text_data=json.dumps({'type': 'subscribe', 'bus_ids': [bus_id]}))
+        self.watchers_per_bus = {}
+        if 'bus' in self.targets:
+            for index in range(self.bus_watchers):
+                bus_id = self.fleet[index % len(self.fleet)][0]
+                self.watchers_per_bus[bus_id] = self.watchers_per_bus.get(bus_id, 0) + 1
+                watchers.append((await _open(application, f'/ws/bus/{bus_id}/'), 'bus', bus_id))
+        if 'driver' in self.targets:
+            for _ in range(self.fleet_watchers):
+                watchers.append((await _open(application, '/ws/drivers/location/'), 'driver', None))
+        return senders, watchers
+
+    async def _drive(self, sockets, bus_id, driver_id, track, started):
+        """Send this driver's updates on schedule until the duration is up, returns how many were sent"""
+        interval = 1 / self.rate
+        due = started + float(self.rng.random()) * interval
+        sent = sequence = 0
+        while due - started < self.duration:
+            now = time.perf_counter()
+            if due > now:
+                await asyncio.sleep(due - now)
+            else:
+                self.lags.append(now - due)
+            lat, lng = track.position(due - started)
+            sequence += 1
+            if 'bus' in sockets:
+                self.sent_at[('bus', bus_id, sequence)] = time.perf_counter()
+                self.expected += self.watchers_per_bus.get(bus_id, 0)
+                await sockets['bus'].send_to(text_data=json.dumps({
+                    'type': 'location_update',
+                    'location': {'latitude': lat, 'longitude': lng, 'seq': sequence},
+                }))
+                sent += 1
+            if 'driver' in sockets:
+                self.sent_at[('driver', driver_id, lat, lng)] = time.perf_counter()
+                self.expected += self.fleet_watchers
+                await sockets['driver'].send_to(text_data=json.dumps({
+                    'type': 'update_location', 'driver_id': driver_id, 'latitude': lat, 'longitude': lng,
+                }))
+                sent += 1
+            due += interval
+        return sent
+
+    async def _receive(self, communicator, kind, bus_id):
+        while True:
+            data = json.loads(await communicator.receive_from(timeout=None))
+            if kind == 'bus' and data.get('type') == 'location_update':
+                key = ('bus', bus_id, data['location'].get('seq'))
+            elif kind == 'driver' and data.get('type') == 'driver_location_broadcast':
+                key = ('driver', data['driver_id'], data['latitude'], data['longitude'])
+            else:
+                continue
+            sent_at = self.sent_at.get(key)
+            if sent_at is not None:
+                self.latencies.append(time.perf_counter() - sent_at)
+                self.delivered += 1
+
+    async def _drain(self, communicator):
+        """Senders also get their own bus's broadcasts; read and drop them"""
+        while True:
+            await communicator.receive_output(timeout=None)
+
+    def _report(self, sent, replayed, elapsed, connections, sender_count, memory_per_connection):
+        latencies = np.array(self.latencies) * 1000
+        lags = np.array(self.lags) * 1000
+
+        def percentile(values, q):
+            return round(float(np.percentile(values, q)), 2) if len(values) else None
+
+        return {
+            'connections': {
+                'senders': sender_count,
+                'bus_watchers': self.bus_watchers if 'bus' in self.targets else 0,
+                'fleet_watchers': self.fleet_watchers if 'driver' in self.targets else 0,
+                'total': connections,
+            },
+            'duration_seconds': round(replayed, 2),
+            'messages': {
+                'sent': sent,
+                'target_per_second': round(len(self.fleet) * len(self.targets) * self.rate, 1),
+                'sent_per_second': round(sent / replayed, 1) if replayed else None,
+                'expected_deliveries': self.expected,
+                'delivered': self.delivered,
+                'undelivered': self.expected - self.delivered,
+                'delivered_per_second': round(self.delivered / replayed, 1) if replayed else None,
+            },
+            'fanout_latency_ms': {
+                'p50': percentile(latencies, 50),
+                'p90': percentile(latencies, 90),
+                'p99': percentile(latencies, 99),
+                'max': round(float(latencies.max()), 2) if len(latencies) else None,
+            },
+            # How far behind schedule updates went out; large values mean the worker saturated
+            'send_lag_ms': {
+                'late_updates': len(lags),
+                'p99': percentile(lags, 99),
+            },
+            'database': {
+                'queries': self.counter.queries,
+                'writes': self.counter.writes,
+                'writes_per_second': round(self.counter.writes / elapsed, 2) if elapsed else None,
+            },
+            'memory': {
+                'per_connection_kb': round(memory_per_connection / 1024, 1),
+                'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            },
+        }
+
+
+async def _open(application, path):
+    communicator = WebsocketCommunicator(application, path)
+    connected, _ = await communicator.connect()
+    if not connected:
+        raise RuntimeError(f'Could not connect to {path}')
+    return communicator
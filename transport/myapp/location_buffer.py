@@ -0,0 +1,185 @@
+import asyncio
+import atexit
+import logging
+import threading
+from decimal import Decimal, InvalidOperation
+
+from channels.db import database_sync_to_async
+from django.utils import timezone
+
+from .location_history import location_history, parse_point
+from .models import Bus, User
+
+
+logger = logging.getLogger(__name__)
+
+# How often buffered positions are written to the database
+FLUSH_INTERVAL_SECONDS = 5
+
+# Flush early once this many buses/drivers are waiting
+MAX_BUFFERED = 5000
+
+WRITE_BATCH_SIZE = 500
+
+COORDINATE_PLACES = Decimal('0.000001')
+
+
+class LocationBuffer:
+    """
+    Write-behind buffer for live positions.
+
+    Consumers record the latest position of each bus and driver here and
+    broadcast straight away; a background task per event loop writes only the
+    newest position of everything that moved since the last flush, with one
+    narrow bulk UPDATE per model instead of a full save() per message. Every
+    point with coordinates is also queued for the location history. The last
+    location socket to close and process exit flush what is left.
+    """
+
+    def __init__(self, interval=FLUSH_INTERVAL_SECONDS, max_buffered=MAX_BUFFERED):
+        self.interval = interval
+        self.max_buffered = max_buffered
+        self._lock = threading.Lock()
+        self._buses = {}  # bus_id -> (current_location, timestamp)
+        self._drivers = {}  # driver_id -> (lat, lng, timestamp)
+        self._flush_task = None
+        self._sockets = 0
+
+    # -- recording -------------------------------------------------------
+
+    def put_bus(self, bus_id, location):
+        try:
+            bus_id = int(bus_id)
+        except (TypeError, ValueError):
+            return False
+        current_location = str(location)[:Bus._meta.get_field('current_location').max_length]
+        now = timezone.now()
+        point = parse_point(location)
+        if point is not None:
+            location_history.record(bus_id, *point, timestamp=now)
+        with self._lock:
+            self._buses[bus_id] = (current_location, now)
+            full = len(self._buses) >= self.max_buffered
+        self._schedule(full)
+        return True
+
+    def put_driver(self, driver_id, latitude, longitude):
+        try:
+            driver_id = int(driver_id)
+            latitude = Decimal(str(latitude)).quantize(COORDINATE_PLACES)
+            longitude = Decimal(str(longitude)).quantize(COORDINATE_PLACES)
+        except (TypeError, ValueError, InvalidOperation):
+            return False
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return False
+        now = timezone.now()
+        location_history.record_driver(driver_id, latitude, longitude, timestamp=now)
+        with self._lock:
+            self._drivers[driver_id] = (latitude, longitude, now)
+            full = len(self._drivers) >= self.max_buffered
+        self._schedule(full)
+        return True
+
+    # -- flushing --------------------------------------------------------
+
+    def flush(self):
+        """Write every buffered position in bulk, returns (buses, drivers) written"""
+        with self._lock:
+            buses, self._buses = self._buses, {}
+            drivers, self._drivers = self._drivers, {}
+
+        buses_written = False
+        try:
+            if buses:
+                Bus.objects.bulk_update(
+                    [
+                        Bus(id=bus_id, current_location=location, updated_at=timestamp)
+                        for bus_id, (location, timestamp) in buses.items()
+                    ],
+                    ['current_location', 'updated_at'],
+                    batch_size=WRITE_BATCH_SIZE
+                )
+            buses_written = True
+            if drivers:
+                User.objects.bulk_update(
+                    [
+                        User(id=driver_id, current_latitude=lat, current_longitude=lng, last_location_update=timestamp)
+                        for driver_id, (lat, lng, timestamp) in drivers.items()
+                    ],
+                    ['current_latitude', 'current_longitude', 'last_location_update'],
+                    batch_size=WRITE_BATCH_SIZE
+                )
+        except Exception:
+            self._requeue({} if buses_written else buses, drivers)
+            raise
+        location_history.flush()
+        return len(buses), len(drivers)
+
+    def _requeue(self, buses, drivers):
+        """Put back the positions of a failed flush, unless a newer one arrived meanwhile"""
+        with self._lock:
+            for bus_id, entry in buses.items():
+                self._buses.setdefault(bus_id, entry)
+            for driver_id, entry in drivers.items():
+                self._drivers.setdefault(driver_id, entry)
+        logger.warning(
+            'Location flush failed, kept %d bus and %d driver positions for the next one', len(buses), len(drivers)
+        )
+
+    def pending(self):
+        with self._lock:
+            return len(self._buses), len(self._drivers)
+
+    # -- lifecycle -------------------------------------------------------
+
+    def socket_opened(self):
+        with self._lock:
+            self._sockets += 1
+
+    async def socket_closed(self):
+        """
+        Flush once the last location socket of the process closes, so a
+        deploy that drains its sockets keeps the final positions
+        """
+        with self._lock:
+            self._sockets = max(self._sockets - 1, 0)
+            last = self._sockets == 0
+        if last:
+            await self._flush_async()
+
+    def flush_at_exit(self):
+        """Write whatever is still buffered when the process exits"""
+        if not any(self.pending()) and not location_history.pending():
+            return
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed to flush buffered locations at exit')
+
+    def _schedule(self, flush_now=False):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Called outside an event loop (management commands, tests): write through
+            self.flush()
+            return
+        task = self._flush_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._flush_task = loop.create_task(self._run())
+        if flush_now:
+            loop.create_task(self._flush_async())
+
+    async def _flush_async(self):
+        try:
+            await database_sync_to_async(self.flush)()
+        except Exception:
+            logger.exception('Failed to flush buffered locations')
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._flush_async()
+
+
+location_buffer = LocationBuffer()
+atexit.register(location_buffer.flush_at_exit)
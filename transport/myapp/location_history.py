@@ -0,0 +1,259 @@
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+from django.utils import timezone
+
+from .distance import EARTH_RADIUS_KM, path_distances
+from .models import Bus, BusLocationPoint
+
+
+logger = logging.getLogger(__name__)
+
+# Recent points kept in memory per bus (an hour at one point every 5 s)
+RING_BUFFER_POINTS = 720
+
+# Trip replay defaults: points returned and Douglas-Peucker tolerance
+DEFAULT_MAX_POINTS = 500
+MAX_POINTS_LIMIT = 5000
+DEFAULT_TOLERANCE_M = 10
+
+WRITE_BATCH_SIZE = 1000
+
+# Points kept for the next flush while the database is unavailable
+MAX_PENDING_POINTS = 100_000
+
+
+def parse_point(location):
+    """
+    Extract (lat, lng) floats from a location message: a dict with lat/lng or
+    latitude/longitude keys, a [lat, lng] pair or a "lat,lng" string.
+    Returns None when the message carries no usable coordinates.
+    """
+    if isinstance(location, dict):
+        lat = location.get('lat', location.get('latitude'))
+        lng = location.get('lng', location.get('lon', location.get('longitude')))
+    elif isinstance(location, (list, tuple)) and len(location) == 2:
+        lat, lng = location
+    elif isinstance(location, str) and location.count(',') == 1:
+        lat, lng = location.split(',')
+    else:
+        return None
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+class LocationHistory:
+    """
+    Append-only bus position history.
+
+    Points are queued in memory and written with bulk_create whenever the
+    location buffer flushes. The newest points of every bus also sit in a
+    bounded ring buffer, so a replay can include positions that have not been
+    written yet. Driver positions are attributed to the bus the driver runs.
+    """
+
+    def __init__(self, ring_size=RING_BUFFER_POINTS):
+        self.ring_size = ring_size
+        self._lock = threading.Lock()
+        self._recent = {}  # bus_id -> deque of (timestamp, lat, lng)
+        self._pending = []  # (bus_id, timestamp, lat, lng)
+        self._pending_drivers = []  # (driver_id, timestamp, lat, lng)
+
+    def record(self, bus_id, latitude, longitude, timestamp=None):
+        point = (timestamp or timezone.now(), float(latitude), float(longitude))
+        with self._lock:
+            self._pending.append((bus_id,) + point)
+            self._add_recent(bus_id, point)
+
+    def record_driver(self, driver_id, latitude, longitude, timestamp=None):
+        with self._lock:
+            self._pending_drivers.append(
+                (driver_id, timestamp or timezone.now(), float(latitude), float(longitude))
+            )
+
+    def _add_recent(self, bus_id, point):
+        """
+        Put a point into the bus's ring in timestamp order. Driver points only
+        reach the ring at flush time, up to a flush interval late, so they are
+        placed by walking back from the newest end.
+        """
+        ring = self._recent.get(bus_id)
+        if ring is None:
+            ring = self._recent[bus_id] = deque(maxlen=self.ring_size)
+        if not ring or ring[-1][0] <= point[0]:
+            ring.append(point)
+            return
+        index = len(ring)
+        while index and ring[index - 1][0] > point[0]:
+            index -= 1
+        if len(ring) == ring.maxlen:
+            if index == 0:
+                # Older than everything the ring still holds
+                return
+            ring.popleft()
+            index -= 1
+        ring.insert(index, point)
+
+    def recent(self, bus_id, since=None):
+        """Buffered points of a bus, oldest first, optionally only those after `since`"""
+        with self._lock:
+            points = list(self._recent.get(bus_id, ()))
+        if since is not None:
+            points = [p for p in points if p[0] > since]
+        return points
+
+    def flush(self):
+        """
+        Write every queued point, returns the number of rows inserted. If the
+        write fails the points are queued again for the next flush.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            pending_drivers, self._pending_drivers = self._pending_drivers, []
+
+        try:
+            if pending_drivers:
+                driver_buses = dict(Bus.objects.filter(
+                    driver_id__in={row[0] for row in pending_drivers}
+                ).values_list('driver_id', 'id'))
+                resolved = [
+                    (driver_buses[driver_id], timestamp, lat, lng)
+                    for driver_id, timestamp, lat, lng in pending_drivers
+                    if driver_id in driver_buses
+                ]
+                with self._lock:
+                    for bus_id, timestamp, lat, lng in resolved:
+                        self._add_recent(bus_id, (timestamp, lat, lng))
+                pending += resolved
+                pending_drivers = []
+
+            if not pending:
+                return 0
+            BusLocationPoint.objects.bulk_create(
+                [
+                    BusLocationPoint(
+                        bus_id=bus_id,
+                        day=timezone.localdate(timestamp),
+                        recorded_at=timestamp,
+                        latitude=lat,
+                        longitude=lng
+                    )
+                    for bus_id, timestamp, lat, lng in pending
+                ],
+                batch_size=WRITE_BATCH_SIZE
+            )
+        except Exception:
+            self._requeue(pending, pending_drivers)
+            raise
+        return len(pending)
+
+    def _requeue(self, pending, pending_drivers):
+        """Queue the points of a failed flush again, ahead of newer ones, dropping the oldest beyond the cap"""
+        with self._lock:
+            self._pending[:0] = pending
+            self._pending_drivers[:0] = pending_drivers
+            dropped = max(len(self._pending) - MAX_PENDING_POINTS, 0)
+            del self._pending[:dropped]
+            dropped_drivers = max(len(self._pending_drivers) - MAX_PENDING_POINTS, 0)
+            del self._pending_drivers[:dropped_drivers]
+        logger.warning(
+            'Location history flush failed, kept %d points for the next one (%d dropped over the cap)',
+            len(pending) + len(pending_drivers) - dropped - dropped_drivers, dropped + dropped_drivers
+        )
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending) + len(self._pending_drivers)
+
+    def trip(self, bus_id, start, end):
+        """
+        All points of a bus between two aware datetimes, oldest first, as
+        (timestamps, lat_lng) where lat_lng is an (n, 2) array in degrees.
+        Only the day buckets covering the range are scanned.
+        """
+        rows = list(BusLocationPoint.objects.filter(
+            bus_id=bus_id,
+            day__range=(timezone.localdate(start), timezone.localdate(end)),
+            recorded_at__range=(start, end)
+        ).order_by('recorded_at').values_list('recorded_at', 'latitude', 'longitude'))
+
+        last_written = rows[-1][0] if rows else start
+        rows += [p for p in self.recent(bus_id, since=last_written) if p[0] <= end]
+        # Keep the joined trail in time order, however late points arrived
+        rows.sort(key=lambda row: row[0])
+
+        timestamps = [row[0] for row in rows]
+        lat_lng = np.array([row[1:] for row in rows], dtype=float).reshape(-1, 2)
+        return timestamps, lat_lng
+
+
+def simplify_path(lat_lng, tolerance_m=DEFAULT_TOLERANCE_M, max_points=DEFAULT_MAX_POINTS):
+    """
+    Douglas-Peucker simplification of an (n, 2) lat/lng path in degrees.
+
+    Every point gets the tolerance at which Douglas-Peucker would still keep
+    it; points above tolerance_m are kept, and if that is still more than
+    max_points only the most significant ones are. The first and last points
+    always stay. Returns the sorted indexes of the kept points.
+    """
+    n = len(lat_lng)
+    if n <= 2:
+        return np.arange(n)
+
+    # Local equirectangular projection in metres is plenty for a trip
+    radians = np.radians(lat_lng)
+    scale = EARTH_RADIUS_KM * 1000
+    xy = np.column_stack([
+        radians[:, 1] * np.cos(radians[:, 0].mean()) * scale,
+        radians[:, 0] * scale
+    ])
+
+    importance = np.zeros(n)
+    importance[0] = importance[-1] = np.inf
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        first, last, parent = stack.pop()
+        if last - first < 2:
+            continue
+        offsets = _segment_distances(xy[first + 1:last], xy[first], xy[last])
+        index = int(offsets.argmax())
+        significance = min(float(offsets[index]), parent)
+        if significance <= tolerance_m:
+            # Nothing inside this stretch can be kept
+            continue
+        index += first + 1
+        importance[index] = significance
+        stack.append((first, index, significance))
+        stack.append((index, last, significance))
+
+    keep = np.flatnonzero(importance > tolerance_m)
+    if len(keep) > max_points:
+        keep = np.sort(np.argsort(-importance, kind='stable')[:max(max_points, 2)])
+    return keep
+
+
+def _segment_distances(points, start, end):
+    """Distance of every point to the segment start-end"""
+    direction = end - start
+    length_sq = float(direction @ direction)
+    if length_sq == 0:
+        return np.hypot(*(points - start).T)
+    t = np.clip(((points - start) @ direction) / length_sq, 0, 1)
+    return np.hypot(*(points - (start + t[:, np.newaxis] * direction)).T)
+
+
+def path_length_km(lat_lng):
+    """Length in km of an (n, 2) lat/lng path in degrees"""
+    if len(lat_lng) < 2:
+        return 0.0
+    return float(path_distances(np.radians(lat_lng)).sum())
+
+
+location_history = LocationHistory()
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+
+class LoopCommand(BaseCommand):
+    """
+    A command that does one pass of run_once(), or with --loop keeps doing
+    one every --interval seconds. Subclasses extend add_arguments through
+    super() and can override handle() for setup before calling super().
+    """
+    default_interval = 300
+    loop_help = 'Keep running every --interval seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help=self.loop_help)
+        parser.add_argument(
+            '--interval', type=float, default=self.default_interval,
+            help=f'Seconds between runs with --loop (default {self.default_interval})'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self.run_once(**options)
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
+
+    def run_once(self, **options):
+        raise NotImplementedError('LoopCommand subclasses must implement run_once()')
@@ -0,0 +1,25 @@
+from myapp.management.base import LoopCommand
+from myapp.models import NotificationOutbox
+from myapp.outbox import dispatcher
+from myapp.workers import POLL_SECONDS
+
+
+class Command(LoopCommand):
+    help = 'Expand pending notification outbox entries into notifications'
+    default_interval = POLL_SECONDS
+    loop_help = 'Keep polling for new entries'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--retry-failed', action='store_true', help='Requeue entries that gave up before dispatching')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            requeued = NotificationOutbox.objects.filter(status='FAILED').update(status='PENDING', attempts=0)
+            self.stdout.write(f'🔁 Requeued {requeued} failed entries')
+        super().handle(*args, **options)
+
+    def run_once(self, **options):
+        handled = dispatcher.dispatch_pending()
+        if handled:
+            self.stdout.write(self.style.SUCCESS(f'✅ Dispatched {handled} outbox entries'))
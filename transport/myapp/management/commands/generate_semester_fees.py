@@ -0,0 +1,54 @@
+import time
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.fee_generation import FEE_GENERATION_CHUNK_SIZE, FeeGenerationService
+from myapp.fees import current_fee_period
+
+
+class Command(BaseCommand):
+    help = 'Bill every seated student for a fee period in bulk (prints a dry-run summary first)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Month name of the fee, e.g. "June" (default: current month)')
+        parser.add_argument('--year', type=int, help='Year of the fee (default: current year)')
+        parser.add_argument('--due-date', help='Due date as YYYY-MM-DD (default: end of the month)')
+        parser.add_argument('--semester', type=int, help="Semester to record on the fees (default: each student's own)")
+        parser.add_argument('--academic-year', help="Academic year to record, e.g. 2026-2027 (default: each student's own)")
+        parser.add_argument('--dry-run', action='store_true', help='Only print the summary, write nothing')
+        parser.add_argument('--no-notify', action='store_true', help="Don't notify the billed students")
+        parser.add_argument('--chunk-size', type=int, default=FEE_GENERATION_CHUNK_SIZE, help=f'Fees per transaction (default {FEE_GENERATION_CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        today = date.today()
+        try:
+            month_number = datetime.strptime(options['month'], '%B').month if options['month'] else today.month
+            month, year, due_date = current_fee_period(date(options['year'] or today.year, month_number, 1))
+            if options['due_date']:
+                due_date = date.fromisoformat(options['due_date'])
+        except ValueError as e:
+            raise CommandError(f'Invalid fee period: {e}')
+
+        started = time.monotonic()
+        plan = FeeGenerationService.plan(
+            month, year, due_date, semester=options['semester'], academic_year=options['academic_year']
+        )
+        summary = plan['summary']
+        self.stdout.write(f"📋 Fee plan for {month} {year} (due {due_date}):")
+        self.stdout.write(f"   Seated students: {summary['seated_students']}")
+        self.stdout.write(f"   Already billed: {summary['already_billed']}")
+        self.stdout.write(f"   Fees to create: {summary['to_create']} totaling ₹{summary['total_amount']}")
+        for amount, count in summary['tiers'].items():
+            self.stdout.write(f"      ₹{amount}: {count}")
+        if summary['missing_coordinates']:
+            self.stdout.write(self.style.WARNING(
+                f"   ⚠️  {summary['missing_coordinates']} students have no home coordinates, billed at the default distance"
+            ))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'✅ Dry run, nothing written ({time.monotonic() - started:.2f}s)'))
+            return
+
+        created = FeeGenerationService.apply(plan, notify=not options['no_notify'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Created {created} fees ({time.monotonic() - started:.2f}s)'))
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.synthetic import (
+    PRESETS, SYNTHETIC_BATCH_SIZE, SYNTHETIC_PASSWORD, SYNTHETIC_PREFIX, SyntheticDataGenerator
+)
+
+
+class Command(BaseCommand):
+    help = 'Bulk-generate a seeded synthetic fleet, students, attendance and fees for load testing and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=list(PRESETS), default='small', help='Base size (default: small)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, the same seed gives the same data')
+        parser.add_argument('--buses', type=int, help='Override the number of buses')
+        parser.add_argument('--seats-per-bus', type=int, default=60)
+        parser.add_argument('--students', type=int, help='Override the number of students')
+        parser.add_argument('--attendance-days', type=int, help='Days of attendance history to create')
+        parser.add_argument('--fee-months', type=int, help='Months of fees to create')
+        parser.add_argument('--unseated', type=float, default=0.05, help='Share of students left without a seat (default: 0.05)')
+        parser.add_argument('--batch-size', type=int, default=SYNTHETIC_BATCH_SIZE)
+        parser.add_argument('--reset', action='store_true', help='Delete existing synthetic data first')
+        parser.add_argument('--reset-only', action='store_true', help='Delete existing synthetic data and exit')
+
+    def handle(self, *args, **options):
+        if options['reset'] or options['reset_only']:
+            deleted = SyntheticDataGenerator.reset()
+            self.stdout.write(self.style.SUCCESS(
+                f"🗑️ Deleted {deleted['buses']} synthetic buses and {deleted['users']} synthetic users"
+            ))
+            if options['reset_only']:
+                return
+
+        size = dict(PRESETS[options['preset']])
+        for option in ['buses', 'students', 'attendance_days', 'fee_months']:
+            if options[option] is not None:
+                size[option] = options[option]
+
+        generator = SyntheticDataGenerator(
+            seed=options['seed'],
+            seats_per_bus=options['seats_per_bus'],
+            unseated=options['unseated'],
+            batch_size=options['batch_size'],
+            log=lambda message: self.stdout.write(f'  {message}...'),
+            **size
+        )
+        started = time.monotonic()
+        try:
+            counts = generator.run()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Synthetic data ready in {time.monotonic() - started:.1f}s'))
+        for name, count in counts.items():
+            self.stdout.write(f"  {name.replace('_', ' ')}: {count}")
+        self.stdout.write(f"  Log in as {SYNTHETIC_PREFIX}admin / {SYNTHETIC_PASSWORD} (drivers and students share the password)")
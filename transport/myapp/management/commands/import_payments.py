@@ -0,0 +1,53 @@
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.payment_import import PAYMENT_IMPORT_BATCH_SIZE, PAYMENT_IMPORT_FORMATS, PaymentImporter, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Apply a bank or gateway settlement file (CSV or JSON lines) to fees, streaming'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Settlement file, '-' for stdin")
+        parser.add_argument('--format', choices=PAYMENT_IMPORT_FORMATS, help='File format (default: from the extension, else csv)')
+        parser.add_argument('--report', help='Write the exception report (CSV) here (default: stderr)')
+        parser.add_argument('--batch-size', type=int, default=PAYMENT_IMPORT_BATCH_SIZE, help=f'Rows per transaction (default {PAYMENT_IMPORT_BATCH_SIZE})')
+        parser.add_argument('--no-notify', action='store_true', help="Don't notify students of their payments")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = detect_format(None if path == '-' else path, options['format'])
+        try:
+            source = sys.stdin if path == '-' else open(path, encoding='utf-8-sig', newline='')
+        except OSError as e:
+            raise CommandError(f'Cannot open {path}: {e}')
+        report_file = open(options['report'], 'w', newline='', encoding='utf-8') if options['report'] else sys.stderr
+
+        started = time.monotonic()
+        try:
+            report = csv.DictWriter(report_file, fieldnames=['line', 'transaction_id', 'reason', 'detail'])
+            report.writeheader()
+            counts = PaymentImporter(
+                batch_size=options['batch_size'],
+                on_exception=report.writerow,
+                notify=not options['no_notify']
+            ).run(read_rows(source, file_format))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if report_file is not sys.stderr:
+                report_file.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Applied {counts['applied']}/{counts['rows']} payments totaling ₹{counts['amount_applied']} "
+            f"({time.monotonic() - started:.2f}s)"
+        ))
+        rejected = counts['rows'] - counts['applied']
+        if rejected:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  {rejected} exceptions: {counts['duplicate']} duplicate, {counts['unmatched']} unmatched, "
+                f"{counts['overpayment']} overpayment, {counts['invalid']} invalid"
+            ))
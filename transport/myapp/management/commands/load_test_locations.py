@@ -0,0 +1,79 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.loadtest import DRAIN_SECONDS, LOAD_TEST_TARGETS, LocationLoadTest
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the bus and driver location sockets in-process: N simulated drivers replay GPS tracks '
+        'while M watchers listen; reports msg/s, fan-out latency, DB writes/s and memory per connection'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=50, help='Simulated drivers, one bus each (default: 50)')
+        parser.add_argument('--bus-watchers', type=int, default=100, help='Listeners on ws/bus/<id>/, spread over the buses (default: 100)')
+        parser.add_argument('--fleet-watchers', type=int, default=5, help='Listeners on ws/drivers/location/ for every driver (default: 5)')
+        parser.add_argument('--rate', type=float, default=1.0, help='Updates per second per driver and socket (default: 1)')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to replay (default: 30)')
+        parser.add_argument('--targets', default=','.join(LOAD_TEST_TARGETS), help='bus, driver or both (default: bus,driver)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--drain', type=float, default=DRAIN_SECONDS, help='Seconds to wait for in-flight deliveries')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        targets = [target.strip() for target in options['targets'].split(',') if target.strip()]
+        if not targets or set(targets) - set(LOAD_TEST_TARGETS):
+            raise CommandError(f"--targets takes {' and/or '.join(LOAD_TEST_TARGETS)}")
+        if options['drivers'] < 1 or options['rate'] <= 0 or options['duration'] <= 0:
+            raise CommandError('--drivers, --rate and --duration must be positive')
+
+        load_test = LocationLoadTest(
+            drivers=options['drivers'],
+            bus_watchers=options['bus_watchers'],
+            fleet_watchers=options['fleet_watchers'],
+            rate=options['rate'],
+            duration=options['duration'],
+            targets=targets,
+            seed=options['seed'],
+            drain_seconds=options['drain'],
+            log=lambda message: self.stdout.write(f'  {message}...')
+        )
+        try:
+            report = load_test.run()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        connections, messages = report['connections'], report['messages']
+        latency, database, memory = report['fanout_latency_ms'], report['database'], report['memory']
+        self.stdout.write(self.style.SUCCESS(f"✅ Load test finished after {report['duration_seconds']}s"))
+        self.stdout.write(
+            f"🔌 Connections: {connections['total']} ({connections['senders']} driver sockets, "
+            f"{connections['bus_watchers']} bus watchers, {connections['fleet_watchers']} fleet watchers)"
+        )
+        self.stdout.write(
+            f"📤 Sent: {messages['sent']} updates, {messages['sent_per_second']}/s (target {messages['target_per_second']}/s)"
+        )
+        self.stdout.write(
+            f"📥 Delivered: {messages['delivered']} of {messages['expected_deliveries']}, {messages['delivered_per_second']}/s"
+        )
+        self.stdout.write(
+            f"⏱️ Fan-out latency: p50 {latency['p50']} ms, p90 {latency['p90']} ms, p99 {latency['p99']} ms, max {latency['max']} ms"
+        )
+        self.stdout.write(
+            f"🗄️ Database: {database['queries']} queries, {database['writes']} writes, {database['writes_per_second']} writes/s"
+        )
+        self.stdout.write(f"🧠 Memory: {memory['per_connection_kb']} KB per connection, peak RSS {memory['peak_rss_mb']} MB")
+        if messages['undelivered']:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ {messages['undelivered']} deliveries never arrived (channel layer full or the worker fell behind)"
+            ))
+        if report['send_lag_ms']['late_updates']:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ {report['send_lag_ms']['late_updates']} updates went out late (p99 {report['send_lag_ms']['p99']} ms behind schedule)"
+            ))
@@ -0,0 +1,56 @@
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from myapp.profiling import PROFILE_DUMP_SECONDS, SORT_KEYS, build_report, clear_snapshots, load_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Print the slowest / most query-heavy endpoints recorded by the request profiling middleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sort', choices=SORT_KEYS, default='p95_ms', help='Rank endpoints by (default: p95_ms)')
+        parser.add_argument('--limit', type=int, default=20, help='Endpoints to show (default: 20)')
+        parser.add_argument('--duplicates', type=int, default=3, help='Repeated queries to show per endpoint (default: 3)')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+        parser.add_argument('--reset', action='store_true', help='Delete the saved profiles and exit')
+
+    def handle(self, *args, **options):
+        directory = settings.REQUEST_PROFILING_DIR
+        if options['reset']:
+            clear_snapshots(directory)
+            self.stdout.write(self.style.SUCCESS(f'✅ Cleared the saved profiles in {directory}'))
+            return
+
+        snapshots = load_snapshots(directory)
+        if not snapshots:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️ No profiles in {directory}. Run the server with REQUEST_PROFILING=True; '
+                f'each process saves its profile every {PROFILE_DUMP_SECONDS}s.'
+            ))
+            return
+
+        report = build_report(snapshots, options['sort'], options['limit'])
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        since = datetime.fromtimestamp(report['since']).strftime('%Y-%m-%d %H:%M:%S')
+        self.stdout.write(f"📊 {report['processes']} process(es), profiling since {since}, sorted by {options['sort']}\n")
+        self.stdout.write(
+            f"{'endpoint':<40} {'reqs':>7} {'avg ms':>8} {'p95 ms':>8} {'max ms':>8} "
+            f"{'avg q':>6} {'max q':>6} {'db ms':>7} {'avg KB':>7} {'5xx':>4}"
+        )
+        for row in report['endpoints']:
+            p95 = row['p95_ms'] if row['p95_ms'] is not None else '>10000'
+            self.stdout.write(
+                f"{row['endpoint'][:40]:<40} {row['requests']:>7} {row['avg_ms']:>8} {p95:>8} {row['max_ms']:>8} "
+                f"{row['avg_queries']:>6} {row['max_queries']:>6} {row['avg_db_ms']:>7} "
+                f"{row['avg_bytes'] / 1024:>7.1f} {row['errors']:>4}"
+            )
+            for duplicate in row['duplicate_queries'][:options['duplicates']]:
+                self.stdout.write(self.style.WARNING(
+                    f"    ↻ x{duplicate['max_repeats']} in {duplicate['requests']} request(s): {duplicate['sql'][:120]}"
+                ))
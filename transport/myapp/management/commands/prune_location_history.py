@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from myapp.models import BusLocationPoint
+
+
+class Command(BaseCommand):
+    help = 'Delete bus location history older than the retention window, one day bucket at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Days of history to keep (default 90)')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.localdate() - timedelta(days=options['days'])
+        buckets = BusLocationPoint.objects.filter(day__lt=cutoff).values_list('day', flat=True).distinct().order_by('day')
+
+        total = 0
+        for day in list(buckets):
+            deleted, _ = BusLocationPoint.objects.filter(day=day).delete()
+            total += deleted
+            self.stdout.write(f'🗑️  {day}: {deleted} points')
+
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Deleted {total} location points older than {cutoff}'))
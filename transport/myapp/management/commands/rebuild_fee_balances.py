@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.fee_balances import BALANCE_BATCH_SIZE, rebuild_fee_balances
+
+
+class Command(BaseCommand):
+    help = 'Reconcile every fee balance with the fees table, fixing any that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=BALANCE_BATCH_SIZE, help=f'Users per transaction (default {BALANCE_BATCH_SIZE})')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        counts = rebuild_fee_balances(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Fee balances: {counts['checked']} users checked, {counts['fixed']} balances fixed "
+            f"({time.monotonic() - started:.2f}s)"
+        ))
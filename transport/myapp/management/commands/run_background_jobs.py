@@ -0,0 +1,32 @@
+from myapp.fee_reminders import fee_reminders
+from myapp.management.base import LoopCommand
+from myapp.models import FeeReminderJob
+from myapp.workers import POLL_SECONDS
+
+
+class Command(LoopCommand):
+    help = 'Run queued background jobs (bulk fee reminders)'
+    default_interval = POLL_SECONDS
+    loop_help = 'Keep polling for new jobs'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--resume', type=int, metavar='JOB_ID', help='Resume a failed fee reminder job from where it stopped')
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            resumed = FeeReminderJob.objects.filter(id=options['resume'], status='FAILED').update(
+                status='RUNNING', error=None, finished_at=None
+            )
+            if not resumed:
+                self.stdout.write(self.style.ERROR(f"❌ No failed fee reminder job #{options['resume']}"))
+                return
+            self.stdout.write(f"🔁 Resuming fee reminder job #{options['resume']}")
+        super().handle(*args, **options)
+
+    def run_once(self, **options):
+        for job in FeeReminderJob.objects.filter(id__in=fee_reminders.run_pending()).order_by('id'):
+            if job.status == 'COMPLETED':
+                self.stdout.write(self.style.SUCCESS(f'✅ Fee reminder job #{job.id}: {job.sent_count}/{job.total} sent'))
+            else:
+                self.stdout.write(self.style.ERROR(f'❌ Fee reminder job #{job.id} {job.status}: {job.sent_count}/{job.total} sent. {job.error or ""}'))
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.benchmarks import (
+    BENCHMARK_RESULTS_FILE, BENCHMARKS, REGRESSION_THRESHOLD, compare, find_baseline, load_runs, run_benchmarks, save_run
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the hot endpoints and location consumers against the current database, record the run '
+        'and compare it with the previous one. Writes are rolled back; generate data first with generate_synthetic_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK', help='Benchmarks to run (default: all)')
+        parser.add_argument('--iterations', type=int, help='Timed runs per benchmark (default: per benchmark)')
+        parser.add_argument('--label', help='Name this run, e.g. a branch or "baseline"')
+        parser.add_argument('--results', default=BENCHMARK_RESULTS_FILE, help=f'Results file (default: {BENCHMARK_RESULTS_FILE})')
+        parser.add_argument('--baseline', help='Compare with the latest run with this label (default: the previous run)')
+        parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help='Slowdown that counts as a regression (default: 0.25)')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit with an error when a benchmark regressed')
+        parser.add_argument('--no-save', action='store_true', help='Do not record this run')
+        parser.add_argument('--list', action='store_true', help='List the benchmarks and exit')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for benchmark in BENCHMARKS.values():
+                self.stdout.write(f'{benchmark.name:<28} {benchmark.description}')
+            return
+
+        unknown = [name for name in options['benchmarks'] if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(unknown)}. Use --list to see them.")
+
+        runs = load_runs(options['results'])
+        baseline = find_baseline(runs, options['baseline'])
+        if options['baseline'] and baseline is None:
+            raise CommandError(f"No recorded run labelled {options['baseline']} in {options['results']}")
+
+        def report(name, result):
+            line = (
+                f"  {name:<28} median {result['median_ms']:>9.1f} ms  p95 {result['p95_ms']:>9.1f} ms  "
+                f"{result['queries']:>5} queries"
+            )
+            if 'messages_per_second' in result:
+                line += f"  {result['messages_per_second']:.0f} msg/s"
+            self.stdout.write(line)
+
+        record = run_benchmarks(options['benchmarks'] or None, options['iterations'], options['label'], on_result=report)
+        dataset = ', '.join(f'{count} {name}' for name, count in record['dataset'].items())
+        self.stdout.write(f'📦 Dataset: {dataset}')
+        for name, reason in record['skipped'].items():
+            self.stdout.write(self.style.WARNING(f'⚠️ Skipped {name}: {reason}'))
+
+        if not options['no_save']:
+            save_run(record, options['results'])
+            self.stdout.write(self.style.SUCCESS(f"✅ Recorded run in {options['results']}"))
+
+        if baseline is None:
+            return
+        self.stdout.write(f"\n📊 Compared with {baseline.get('label') or baseline['run_at']} ({baseline.get('git_revision') or 'unknown revision'}):")
+        if baseline['dataset'] != record['dataset']:
+            self.stdout.write(self.style.WARNING('⚠️ The dataset differs from the baseline run'))
+        regressed = []
+        for row in compare(record, baseline, options['threshold']):
+            if row['baseline_ms'] is None:
+                self.stdout.write(f"  {row['name']:<28} {row['median_ms']:>9.1f} ms  (new)")
+                continue
+            change = f"{row['change']:+.0%}" if row['change'] is not None else 'n/a'
+            line = f"  {row['name']:<28} {row['baseline_ms']:>9.1f} → {row['median_ms']:>9.1f} ms  {change}"
+            if row['regressed']:
+                regressed.append(row['name'])
+                self.stdout.write(self.style.ERROR(f'{line}  ❌ regression'))
+            else:
+                self.stdout.write(line)
+
+        if regressed and options['fail_on_regression']:
+            raise CommandError(f"Regressed: {', '.join(regressed)}")
@@ -0,0 +1,22 @@
+import time
+
+from myapp.management.base import LoopCommand
+from myapp.services import FEE_SWEEP_CHUNK_SIZE, FeeService
+
+
+class Command(LoopCommand):
+    help = 'Move unpaid fees past their due date to OVERDUE with chunked set-based UPDATEs (safe to run often)'
+    loop_help = 'Keep sweeping every --interval seconds'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--chunk-size', type=int, default=FEE_SWEEP_CHUNK_SIZE, help=f'Fee ids per UPDATE (default {FEE_SWEEP_CHUNK_SIZE})')
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to sleep between chunks')
+
+    def run_once(self, **options):
+        started = time.monotonic()
+        counts = FeeService.sweep_overdue_fees(chunk_size=options['chunk_size'], pause=options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Overdue sweep: {counts['overdue']} now OVERDUE, {counts['pending']} back to PENDING "
+            f"({time.monotonic() - started:.2f}s)"
+        ))
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.2 on 2026-10-18 04:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0012_alter_user_role'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BusLocationPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('recorded_at', models.DateTimeField()),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('bus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_points', to='myapp.bus')),
+            ],
+            options={
+                'db_table': 'bus_location_points',
+                'indexes': [models.Index(fields=['bus', 'day', 'recorded_at'], name='bus_location_day_idx'), models.Index(fields=['day'], name='bus_location_bucket_idx')],
+            },
+        ),
+    ]
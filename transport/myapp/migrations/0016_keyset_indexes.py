@@ -0,0 +1,41 @@
+# Generated by Django 6.0.2 on 2026-10-18 04:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0015_notificationcounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['-date', '-id'], name='attendance_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyalert',
+            index=models.Index(fields=['-created_at', '-id'], name='alert_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fee',
+            index=models.Index(fields=['-created_at', '-id'], name='fee_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fee',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='fee_user_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='notification_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentquery',
+            index=models.Index(fields=['-created_at', '-id'], name='student_query_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentquery',
+            index=models.Index(fields=['student', '-created_at', '-id'], name='student_query_user_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0017_feereminderjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fee',
+            index=models.Index(fields=['payment_status', 'due_date'], name='fee_status_due_idx'),
+        ),
+    ]
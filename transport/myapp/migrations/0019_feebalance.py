@@ -0,0 +1,49 @@
+# Generated by Django 6.0.2 on 2026-10-18 05:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_balances(apps, schema_editor):
+    Fee = apps.get_model('myapp', 'Fee')
+    FeeBalance = apps.get_model('myapp', 'FeeBalance')
+    totals = Fee.objects.filter(payment_status__in=['PENDING', 'OVERDUE', 'PARTIAL']).values('user_id').annotate(
+        total_amount=models.Sum('amount'),
+        paid_amount=models.Sum('paid_amount'),
+        pending_amount=models.Sum('pending_amount'),
+        unpaid_count=models.Count('id'),
+        oldest_due_date=models.Min('due_date')
+    ).order_by()
+    now = timezone.now()
+    FeeBalance.objects.bulk_create(
+        [FeeBalance(updated_at=now, **row) for row in totals],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0018_fee_status_due_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeeBalance',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fee_balance', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('pending_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('unpaid_count', models.IntegerField(default=0)),
+                ('oldest_due_date', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'fee_balances',
+            },
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.2 on 2026-10-18 05:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0019_feebalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeePayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('transaction_id', models.CharField(blank=True, max_length=100, null=True, unique=True)),
+                ('payment_method', models.CharField(blank=True, max_length=50, null=True)),
+                ('paid_date', models.DateField()),
+                ('source', models.CharField(choices=[('MANUAL', 'Manual'), ('IMPORT', 'Settlement Import')], default='MANUAL', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('fee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='myapp.fee')),
+                ('recorded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recorded_payments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'fee_payments',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.2 on 2026-10-18 05:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0020_feepayment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_buses', models.IntegerField(default=0)),
+                ('total_drivers', models.IntegerField(default=0)),
+                ('total_students', models.IntegerField(default=0)),
+                ('total_teachers', models.IntegerField(default=0)),
+                ('breakdown_buses', models.IntegerField(default=0)),
+                ('drivers_marked_today', models.IntegerField(default=0)),
+                ('attendance_date', models.DateField(blank=True, null=True)),
+                ('recomputed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'dashboard_snapshot',
+            },
+        ),
+    ]
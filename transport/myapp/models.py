@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 from datetime import date
@@ -158,6 +158,9 @@ class Attendance(models.Model):
     class Meta:
         db_table = 'attendances'
         unique_together = ['user', 'date']
+        indexes = [
+            models.Index(fields=['-date', '-id'], name='attendance_keyset_idx'),
+        ]
 
 
 class Notification(models.Model):
@@ -174,6 +177,60 @@ class Notification(models.Model):
     class Meta:
         db_table = 'notifications'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='notification_keyset_idx'),
+        ]
+
+
+class NotificationCounter(models.Model):
+    """Denormalized count of a user's unseen notifications"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread"
+
+    class Meta:
+        db_table = 'notification_counters'
+
+
+class NotificationOutbox(models.Model):
+    """
+    One fan-out intent per row: a message for everyone in an audience. The
+    outbox dispatcher expands it into Notification rows in the background.
+    """
+    AUDIENCE_CHOICES = [
+        ('ROLE', 'Everyone with a role'),
+        ('BUS', 'Passengers of a bus'),
+        ('USERS', 'Listed users'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('DISPATCHED', 'Dispatched'),
+        ('FAILED', 'Failed'),
+    ]
+
+    audience = models.CharField(max_length=10, choices=AUDIENCE_CHOICES)
+    target = models.JSONField(default=dict)
+    message = models.TextField()
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='outbox_notifications')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    recipients = models.IntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.audience} {self.target} - {self.status}"
+
+    class Meta:
+        db_table = 'notification_outbox'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='outbox_status_idx'),
+        ]
 
 
 class Query(models.Model):
@@ -231,7 +288,8 @@ class Fee(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
+    def update_payment_status(self):
+        """Set pending_amount and payment_status from the amounts and due date, as save() does"""
         # Auto-calculate pending amount
         self.pending_amount = self.amount - self.paid_amount
         
@@ -244,8 +302,17 @@ class Fee(models.Model):
             self.payment_status = 'OVERDUE'
         else:
             self.payment_status = 'PENDING'
+
+    def save(self, *args, **kwargs):
+        self.update_payment_status()
             
-        super().save(*args, **kwargs)
+        # The student's FeeBalance is refreshed by a post_save signal, in this transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user.username} - {self.month} {self.year} - {self.payment_status}"
@@ -254,6 +321,101 @@ class Fee(models.Model):
         db_table = 'fees'
         unique_together = ['user', 'month', 'year']
         ordering = ['-year', '-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='fee_keyset_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='fee_user_keyset_idx'),
+            models.Index(fields=['payment_status', 'due_date'], name='fee_status_due_idx'),
+        ]
+
+
+class FeePayment(models.Model):
+    """
+    One payment applied to a fee. transaction_id is unique, so a bank or
+    gateway transaction can only ever be applied once.
+    """
+    SOURCE_CHOICES = [
+        ('MANUAL', 'Manual'),
+        ('IMPORT', 'Settlement Import'),
+    ]
+
+    fee = models.ForeignKey(Fee, on_delete=models.CASCADE, related_name='payments')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    transaction_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    payment_method = models.CharField(max_length=50, null=True, blank=True)
+    paid_date = models.DateField()
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='MANUAL')
+    recorded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='recorded_payments')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.transaction_id or 'no transaction'} - ₹{self.amount} for fee {self.fee_id}"
+
+    class Meta:
+        db_table = 'fee_payments'
+        ordering = ['-created_at']
+
+
+class FeeBalance(models.Model):
+    """
+    Materialized totals of a user's unpaid fees, kept in step with the fees
+    table by fee_balances.refresh_fee_balances. A missing row means no
+    unpaid fees.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='fee_balance')
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    paid_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    pending_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    unpaid_count = models.IntegerField(default=0)
+    oldest_due_date = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def has_unpaid_fees(self):
+        return self.unpaid_count > 0
+
+    def is_overdue(self, today=None):
+        """True if any unpaid fee is past its due date"""
+        return self.oldest_due_date is not None and self.oldest_due_date < (today or date.today())
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unpaid_count} unpaid, ₹{self.pending_amount} pending"
+
+    class Meta:
+        db_table = 'fee_balances'
+
+
+class FeeReminderJob(models.Model):
+    """
+    A bulk fee reminder run. Students are processed in id order in chunks;
+    last_student_id is saved with each chunk so the job can resume.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
+
+    bus = models.ForeignKey(Bus, on_delete=models.SET_NULL, null=True, blank=True, related_name='fee_reminder_jobs')
+    student_ids = models.JSONField(null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='fee_reminder_jobs')
+    sender_role = models.CharField(max_length=10)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    total = models.IntegerField(default=0)
+    sent_count = models.IntegerField(default=0)
+    last_student_id = models.IntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Fee reminders #{self.id} - {self.status} ({self.sent_count}/{self.total})"
+
+    class Meta:
+        db_table = 'fee_reminder_jobs'
+        ordering = ['-created_at']
 
 
 class EmergencyAlert(models.Model):
@@ -279,6 +441,9 @@ class EmergencyAlert(models.Model):
     class Meta:
         db_table = 'emergency_alerts'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='alert_keyset_idx'),
+        ]
 
 
 class DriverLeave(models.Model):
@@ -365,6 +530,53 @@ class StudentQuery(models.Model):
     class Meta:
         db_table = 'student_queries'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='student_query_keyset_idx'),
+            models.Index(fields=['student', '-created_at', '-id'], name='student_query_user_keyset_idx'),
+        ]
+
+
+class BusLocationPoint(models.Model):
+    """
+    Append-only GPS history of a bus. Rows are bucketed by day so replays
+    and retention only ever touch the buckets in range.
+    """
+    bus = models.ForeignKey(Bus, on_delete=models.CASCADE, related_name='location_points')
+    day = models.DateField()
+    recorded_at = models.DateTimeField()
+    latitude = models.FloatField()
+    longitude = models.FloatField()
 
+    def __str__(self):
+        return f"Bus {self.bus_id} @ {self.recorded_at}"
 
+    class Meta:
+        db_table = 'bus_location_points'
+        indexes = [
+            models.Index(fields=['bus', 'day', 'recorded_at'], name='bus_location_day_idx'),
+            models.Index(fields=['day'], name='bus_location_bucket_idx'),
+        ]
+
+
+class DashboardSnapshot(models.Model):
+    """
+    The admin dashboard counters in a single row, adjusted by signals as
+    users, buses and driver attendance change and fully recomputed by
+    dashboard.recompute_dashboard. drivers_marked_today counts
+    attendance_date only.
+    """
+    total_buses = models.IntegerField(default=0)
+    total_drivers = models.IntegerField(default=0)
+    total_students = models.IntegerField(default=0)
+    total_teachers = models.IntegerField(default=0)
+    breakdown_buses = models.IntegerField(default=0)
+    drivers_marked_today = models.IntegerField(default=0)
+    attendance_date = models.DateField(null=True, blank=True)
+    recomputed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(null=True, blank=True)
 
+    def __str__(self):
+        return f"Dashboard snapshot recomputed at {self.recomputed_at}"
+
+    class Meta:
+        db_table = 'dashboard_snapshot'
@@ -0,0 +1,134 @@
+import logging
+from collections import Counter, defaultdict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import Notification, NotificationCounter
+
+
+logger = logging.getLogger(__name__)
+
+# Users per counter UPDATE
+COUNTER_BATCH_SIZE = 1000
+
+
+def notification_group(user_id):
+    """Channel group of a user's notification sockets"""
+    return f'notifications_{user_id}'
+
+
+def notifications_created(notifications):
+    """
+    Bookkeeping for freshly saved notifications: bumps the unread counter of
+    every recipient in the current transaction and pushes the notifications
+    to their users' sockets once it commits. Every code path that creates
+    Notification rows calls this.
+    """
+    if not notifications:
+        return
+    counts = Counter(n.user_id for n in notifications if not n.is_seen)
+    _increment(counts)
+    notifications = list(notifications)
+    transaction.on_commit(lambda: push_notifications(notifications))
+
+
+def mark_notifications_seen(user_id, notification_ids=None):
+    """
+    Mark a user's unseen notifications (all, or only the given ids) as seen
+    and lower the counter by however many actually changed. Returns that number.
+    """
+    with transaction.atomic():
+        unseen = Notification.objects.filter(user_id=user_id, is_seen=False)
+        if notification_ids is not None:
+            unseen = unseen.filter(id__in=notification_ids)
+        changed = unseen.update(is_seen=True)
+        if changed:
+            adjust_unread(user_id, -changed)
+    return changed
+
+
+def adjust_unread(user_id, delta):
+    """
+    Atomically add delta to a user's unread counter, never below zero, and
+    tell their sockets the new count after commit
+    """
+    NotificationCounter.objects.get_or_create(user_id=user_id)
+    NotificationCounter.objects.filter(user_id=user_id).update(unread=Greatest(F('unread') + delta, 0))
+    transaction.on_commit(lambda: push_unread_count(user_id))
+
+
+def unread_notification_count(user_id):
+    """The user's unread notifications, one primary key lookup"""
+    return NotificationCounter.objects.filter(user_id=user_id).values_list('unread', flat=True).first() or 0
+
+
+def _increment(counts):
+    user_ids = list(counts)
+    for start in range(0, len(user_ids), COUNTER_BATCH_SIZE):
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id) for user_id in user_ids[start:start + COUNTER_BATCH_SIZE]],
+            ignore_conflicts=True
+        )
+    # Usually every recipient got one notification, so this is one UPDATE
+    by_amount = defaultdict(list)
+    for user_id, amount in counts.items():
+        by_amount[amount].append(user_id)
+    for amount, ids in by_amount.items():
+        for start in range(0, len(ids), COUNTER_BATCH_SIZE):
+            NotificationCounter.objects.filter(
+                user_id__in=ids[start:start + COUNTER_BATCH_SIZE]
+            ).update(unread=F('unread') + amount)
+
+
+def _group_send_all(messages):
+    """Send (group, event) pairs through the channel layer from sync code"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not messages:
+        return
+
+    async def send_all():
+        for group, event in messages:
+            await channel_layer.group_send(group, event)
+
+    try:
+        async_to_sync(send_all)()
+    except Exception:
+        # Sockets are best effort, the rows are already stored
+        logger.exception('Failed to push notifications')
+
+
+def push_notifications(notifications):
+    """Send notifications, with the recipient's new unread count, to their sockets"""
+    if not notifications:
+        return
+    unread = {}
+    user_ids = list({n.user_id for n in notifications})
+    for start in range(0, len(user_ids), COUNTER_BATCH_SIZE):
+        unread.update(NotificationCounter.objects.filter(
+            user_id__in=user_ids[start:start + COUNTER_BATCH_SIZE]
+        ).values_list('user_id', 'unread'))
+    _group_send_all([
+        (notification_group(n.user_id), {
+            'type': 'notification_created',
+            'notification': {
+                'id': n.id,
+                'message': n.message,
+                'is_seen': n.is_seen,
+                'created_by': n.created_by_id,
+                'created_at': n.created_at.isoformat() if n.created_at else None,
+            },
+            'unread': unread.get(n.user_id, 0),
+        })
+        for n in notifications
+    ])
+
+
+def push_unread_count(user_id):
+    """Send a user's current unread count to their sockets"""
+    _group_send_all([
+        (notification_group(user_id), {'type': 'unread_count', 'unread': unread_notification_count(user_id)})
+    ])
@@ -0,0 +1,115 @@
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Notification, NotificationOutbox, User
+from .notifications import notifications_created
+from .workers import BackgroundWorker
+
+
+logger = logging.getLogger(__name__)
+
+# Notification rows per bulk_create
+DISPATCH_BATCH_SIZE = 1000
+
+# Give up on an entry after this many failed dispatches
+MAX_ATTEMPTS = 5
+
+
+def enqueue(audience, message, created_by=None, **target):
+    """
+    Record a fan-out intent in the caller's transaction and have it dispatched
+    once that transaction commits. Costs one INSERT whatever the audience size.
+    """
+    entry = NotificationOutbox.objects.create(
+        audience=audience,
+        target=target,
+        message=message,
+        created_by=created_by
+    )
+    transaction.on_commit(dispatcher.wake)
+    return entry
+
+
+def recipient_ids(entry):
+    """User ids an outbox entry expands to"""
+    target = entry.target
+    if entry.audience == 'ROLE':
+        users = User.objects.filter(role=target['role'])
+    elif entry.audience == 'BUS':
+        users = User.objects.filter(
+            assigned_seat__bus_id=target['bus_id'],
+            assigned_seat__is_available=False
+        )
+        if target.get('role'):
+            users = users.filter(role=target['role'])
+    else:
+        users = User.objects.filter(id__in=target.get('user_ids', []))
+    return users.order_by('id').values_list('id', flat=True)
+
+
+class OutboxDispatcher(BackgroundWorker):
+    """
+    Expands pending outbox entries into Notification rows with batched
+    bulk_create; the rows are pushed to WebSocket groups after commit.
+
+    Each entry is claimed with SELECT ... FOR UPDATE SKIP LOCKED and expanded
+    and marked dispatched in the same transaction, so concurrent dispatchers
+    never deliver an entry twice. settings.NOTIFICATION_DISPATCH_MODE picks
+    where it runs (see BackgroundWorker), 'command' meaning the
+    dispatch_notifications command.
+    """
+    mode_setting = 'NOTIFICATION_DISPATCH_MODE'
+    thread_name = 'notification-outbox'
+
+    def run_pending(self):
+        return self.dispatch_pending()
+
+    def dispatch_pending(self, limit=None):
+        """Dispatch pending entries until none are left, returns how many were handled"""
+        handled = 0
+        failed = set()  # retried on the next pass, not straight away
+        while limit is None or handled < limit:
+            entry_id, dispatched = self.dispatch_one(skip=failed)
+            if entry_id is None:
+                break
+            if not dispatched:
+                failed.add(entry_id)
+            handled += 1
+        return handled
+
+    def dispatch_one(self, skip=()):
+        """
+        Claim and dispatch the oldest pending entry not in `skip`. Returns
+        (entry id, dispatched), or (None, False) when there is nothing to do.
+        """
+        with transaction.atomic():
+            entry = NotificationOutbox.objects.select_for_update(skip_locked=True).filter(
+                status='PENDING'
+            ).exclude(id__in=skip).order_by('id').first()
+            if entry is None:
+                return None, False
+            try:
+                with transaction.atomic():
+                    user_ids = list(recipient_ids(entry))
+                    for start in range(0, len(user_ids), DISPATCH_BATCH_SIZE):
+                        notifications_created(Notification.objects.bulk_create([
+                            Notification(user_id=user_id, message=entry.message, created_by_id=entry.created_by_id)
+                            for user_id in user_ids[start:start + DISPATCH_BATCH_SIZE]
+                        ]))
+                entry.status = 'DISPATCHED'
+                entry.recipients = len(user_ids)
+                entry.dispatched_at = timezone.now()
+            except Exception as e:
+                entry.attempts += 1
+                entry.last_error = str(e)
+                if entry.attempts >= MAX_ATTEMPTS:
+                    entry.status = 'FAILED'
+                logger.exception('Failed to dispatch notification outbox entry %s', entry.id)
+            entry.save(update_fields=['status', 'recipients', 'dispatched_at', 'attempts', 'last_error'])
+
+        return entry.id, entry.status == 'DISPATCHED'
+
+
+dispatcher = OutboxDispatcher()
@@ -0,0 +1,155 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination on a unique ordering such as (created_at, id).
+
+    Instead of an OFFSET, the cursor carries the ordering values of the last
+    (or first) row of the current page and the next page is fetched with a
+    WHERE on them, so every page costs the same however deep it is and rows
+    inserted meanwhile never shift or repeat a page. The ordering comes from
+    the view's `keyset_ordering`, or the constructor for function views; its
+    last field must make it unique. Pages are `?page_size=` rows, capped at
+    `max_page_size`.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = DEFAULT_PAGE_SIZE
+    max_page_size = MAX_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=None, page_size=None, max_page_size=None):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+        if page_size is not None:
+            self.page_size = page_size
+        if max_page_size is not None:
+            self.max_page_size = max_page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordering = tuple(getattr(view, 'keyset_ordering', self.ordering))
+        fields = [name.lstrip('-') for name in ordering]
+        size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['r'])
+        if reverse:
+            # Walk backwards from the first row of the page the client is on
+            ordering = tuple(name[1:] if name.startswith('-') else '-' + name for name in ordering)
+        queryset = queryset.order_by(*ordering)
+        if cursor:
+            if len(cursor['v']) != len(fields):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                queryset = queryset.filter(self._after(ordering, cursor['v']))
+            except (DjangoValidationError, TypeError, ValueError):
+                # Cursor values the fields cannot hold
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = list(queryset[:size + 1])
+        has_more = len(rows) > size
+        rows = rows[:size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else cursor is not None
+        self.first_key = self._key(rows[0], fields) if rows else None
+        self.last_key = self._key(rows[-1], fields) if rows else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data, results_key='results'):
+        """Envelope for a page, function views can choose their own key for the rows"""
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'page_size': self.get_page_size(self.request),
+            results_key: data,
+        }
+
+    def get_next_link(self):
+        if not self.has_next or self.last_key is None:
+            return None
+        return self._link(self.last_key, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_key is None:
+            return None
+        return self._link(self.first_key, reverse=True)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query', 'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query', 'schema': {'type': 'integer'}},
+        ]
+
+    # -- cursors ---------------------------------------------------------
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii') + b'=' * (-len(encoded) % 4)))
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(cursor, dict) or not isinstance(cursor.get('v'), list):
+            raise NotFound(self.invalid_cursor_message)
+        cursor['r'] = bool(cursor.get('r'))
+        return cursor
+
+    def _link(self, key, reverse):
+        payload = json.dumps({'v': key, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    @staticmethod
+    def _key(row, fields):
+        key = []
+        for field in fields:
+            value = getattr(row, field)
+            if isinstance(value, (date, datetime)):
+                value = value.isoformat()
+            key.append(value)
+        return key
+
+    @staticmethod
+    def _after(ordering, values):
+        """Rows strictly after `values` in `ordering`, as one OR of prefix matches"""
+        condition = Q()
+        for i, name in enumerate(ordering):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            term = Q(**{f'{field}__{lookup}': values[i]})
+            for previous, value in zip(ordering[:i], values):
+                term &= Q(**{previous.lstrip('-'): value})
+            condition |= term
+        return condition
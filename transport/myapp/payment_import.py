@@ -0,0 +1,244 @@
+import codecs
+import csv
+import json
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .fee_balances import refresh_fee_balances
+from .models import Fee, FeePayment, Notification, User
+from .notifications import notifications_created
+
+
+# Rows per transaction: a fixed handful of queries whatever the batch holds
+PAYMENT_IMPORT_BATCH_SIZE = 1000
+
+PAYMENT_IMPORT_FORMATS = ['csv', 'jsonl']
+
+# Fees per UPDATE statement; bulk_update's CASE per row and field grows with it
+FEE_UPDATE_BATCH_SIZE = 250
+
+# Exception rows returned by the upload API, the command reports them all
+MAX_REPORTED_EXCEPTIONS = 1000
+
+# Fee columns a payment changes
+FEE_PAYMENT_FIELDS = ['paid_amount', 'pending_amount', 'payment_status', 'paid_date', 'payment_method', 'transaction_id', 'updated_at']
+
+
+def detect_format(filename, requested=None):
+    """'csv' or 'jsonl', from the requested format or the file extension"""
+    if requested:
+        if requested not in PAYMENT_IMPORT_FORMATS:
+            raise ValueError(f"Unsupported format '{requested}', use csv or jsonl")
+        return requested
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return 'csv'
+
+
+def decode_lines(stream):
+    """Text lines of a binary stream such as an upload, decoded as they are read"""
+    return codecs.iterdecode(stream, 'utf-8-sig')
+
+
+def read_rows(lines, file_format):
+    """
+    Yield (line_number, row dict) from an iterable of text lines, one row at
+    a time. Column names are lower-cased; a JSON line that is not an object
+    comes out as a None row.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, {
+                key.strip().lower(): (value or '').strip()
+                for key, value in row.items() if key is not None
+            }
+    else:
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, {str(key).lower(): value for key, value in row.items()} if isinstance(row, dict) else None
+
+
+def parse_row(row):
+    """Validate one settlement row, raises ValueError with the reason"""
+    if row is None:
+        raise ValueError('Not a JSON object')
+    transaction_id = str(row.get('transaction_id') or '').strip()
+    if not transaction_id:
+        raise ValueError('transaction_id is required')
+    try:
+        amount = Decimal(str(row.get('amount') or '').strip()).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        amount = None
+    # NaN survives quantize but fails every comparison after it
+    if amount is None or not amount.is_finite():
+        raise ValueError(f"Invalid amount '{row.get('amount')}'")
+    if amount <= 0:
+        raise ValueError('Payment amount must be greater than 0')
+
+    # "June", or "June 2026" with the year folded in
+    month = str(row.get('month') or '').strip()
+    year = row.get('year')
+    if ' ' in month and not year:
+        month, year = month.rsplit(' ', 1)
+    try:
+        year = int(year) if year not in (None, '') else None
+        student_id = int(row['student_id']) if row.get('student_id') not in (None, '') else None
+        paid_date = date.fromisoformat(str(row['paid_date'])) if row.get('paid_date') else date.today()
+    except (TypeError, ValueError) as e:
+        raise ValueError(str(e))
+
+    return {
+        'transaction_id': transaction_id,
+        'amount': amount,
+        'student_id': student_id,
+        'username': str(row.get('username') or '').strip() or None,
+        'month': month.capitalize() or None,
+        'year': year,
+        'payment_method': str(row.get('payment_method') or '').strip() or 'ONLINE',
+        'paid_date': paid_date,
+    }
+
+
+class PaymentImporter:
+    """
+    Applies a bank or gateway settlement file to fees, streaming.
+
+    A row is matched to the unpaid fee whose transaction_id it carries (a
+    gateway reference recorded on the fee), otherwise to the fee of its
+    student (student_id or username) and month/year.
+
+    Rows are read one line at a time and applied in batches, each batch one
+    transaction: which transactions are already known, the students and the
+    fees (locked) are loaded with one query each, the payments are applied in
+    memory with Fee's status rules, then the fees are written back with
+    bulk_update and the FeePayment rows, balances and notifications in bulk.
+    A row whose transaction_id was already applied (in an earlier batch, an
+    earlier import or by hand) is a duplicate, so importing a file twice
+    changes nothing. Rows that cannot be applied go to on_exception.
+    """
+
+    def __init__(self, recorded_by=None, batch_size=PAYMENT_IMPORT_BATCH_SIZE, on_exception=None, notify=True):
+        self.recorded_by = recorded_by
+        self.batch_size = batch_size
+        self.on_exception = on_exception or (lambda exception: None)
+        self.notify = notify
+        self.counts = {
+            'rows': 0, 'applied': 0, 'duplicate': 0, 'unmatched': 0,
+            'overpayment': 0, 'invalid': 0, 'amount_applied': Decimal('0'),
+        }
+
+    def run(self, rows):
+        """Import (line_number, row) pairs such as read_rows yields, returns the counts"""
+        batch = []
+        for line_number, row in rows:
+            self.counts['rows'] += 1
+            try:
+                batch.append((line_number, parse_row(row)))
+            except ValueError as e:
+                self._reject(line_number, row.get('transaction_id') if row else None, 'invalid', str(e))
+                continue
+            if len(batch) >= self.batch_size:
+                self.apply_batch(batch)
+                batch = []
+        if batch:
+            self.apply_batch(batch)
+        return self.counts
+
+    def apply_batch(self, batch):
+        transaction_ids = {payment['transaction_id'] for _, payment in batch}
+        now = timezone.now()
+        with transaction.atomic():
+            applied = set(FeePayment.objects.filter(
+                transaction_id__in=transaction_ids
+            ).values_list('transaction_id', flat=True))
+            user_ids = dict(User.objects.filter(
+                username__in={payment['username'] for _, payment in batch if payment['username']}
+            ).values_list('username', 'id'))
+            for _, payment in batch:
+                payment['student_id'] = payment['student_id'] or user_ids.get(payment['username'])
+            # Fees carrying one of the transaction ids, and fees of the students and months, in one locked read
+            locked = list(Fee.objects.select_for_update().filter(
+                Q(transaction_id__in=transaction_ids) | Q(
+                    user_id__in={payment['student_id'] for _, payment in batch if payment['student_id']},
+                    month__in={payment['month'] for _, payment in batch if payment['month']},
+                    year__in={payment['year'] for _, payment in batch if payment['year']}
+                )
+            ))
+            fees = {(fee.user_id, fee.month, fee.year): fee for fee in locked}
+            references = {}
+            for fee in locked:
+                if fee.transaction_id in transaction_ids:
+                    if fee.paid_amount:
+                        # Paid under this id before FeePayment rows were kept
+                        applied.add(fee.transaction_id)
+                    else:
+                        references[fee.transaction_id] = fee
+
+            changed = {}
+            payments = []
+            notifications = []
+            for line_number, payment in batch:
+                transaction_id = payment['transaction_id']
+                if transaction_id in applied:
+                    self._reject(line_number, transaction_id, 'duplicate', 'Transaction already applied')
+                    continue
+                fee = references.get(transaction_id) or fees.get((payment['student_id'], payment['month'], payment['year']))
+                if fee is None:
+                    self._reject(line_number, transaction_id, 'unmatched', 'No fee with this transaction_id or for this student and month')
+                    continue
+                if fee.paid_amount + payment['amount'] > fee.amount:
+                    self._reject(line_number, transaction_id, 'overpayment', f'Payment exceeds pending amount ₹{fee.amount - fee.paid_amount} of fee {fee.id}')
+                    continue
+
+                applied.add(transaction_id)
+                fee.paid_amount += payment['amount']
+                fee.payment_method = payment['payment_method']
+                fee.transaction_id = transaction_id
+                if fee.paid_amount >= fee.amount:
+                    fee.paid_date = payment['paid_date']
+                fee.update_payment_status()
+                fee.updated_at = now
+                changed[fee.id] = fee
+                payments.append(FeePayment(
+                    fee=fee,
+                    amount=payment['amount'],
+                    transaction_id=transaction_id,
+                    payment_method=payment['payment_method'],
+                    paid_date=payment['paid_date'],
+                    source='IMPORT',
+                    recorded_by=self.recorded_by
+                ))
+                notifications.append(Notification(
+                    user_id=fee.user_id,
+                    message=f"✅ Payment Received: ₹{payment['amount']} for {fee.month} {fee.year}. Remaining: ₹{fee.pending_amount}",
+                    created_by=self.recorded_by
+                ))
+                self.counts['applied'] += 1
+                self.counts['amount_applied'] += payment['amount']
+
+            if changed:
+                # Fee's status rules were applied above
+                Fee.objects.bulk_update(list(changed.values()), FEE_PAYMENT_FIELDS, batch_size=FEE_UPDATE_BATCH_SIZE)
+                FeePayment.objects.bulk_create(payments)
+                refresh_fee_balances(fee.user_id for fee in changed.values())
+                if self.notify:
+                    notifications_created(Notification.objects.bulk_create(notifications))
+
+    def _reject(self, line_number, transaction_id, reason, detail):
+        self.counts[reason] += 1
+        self.on_exception({
+            'line': line_number,
+            'transaction_id': transaction_id,
+            'reason': reason.upper(),
+            'detail': detail,
+        })
@@ -0,0 +1,335 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds; one more bucket catches everything above
+TIME_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+QUERY_BUCKETS = [0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+# Repeated-query signatures kept per endpoint, the least frequent are dropped
+MAX_DUPLICATE_SIGNATURES = 10
+
+# Distinct endpoints tracked; anything past this is folded into OTHER_ENDPOINT
+MAX_ENDPOINTS = 500
+OTHER_ENDPOINT = '<other>'
+UNRESOLVED_ENDPOINT = '<unresolved>'
+
+# How often each process saves its profile for the report command
+PROFILE_DUMP_SECONDS = 30
+
+SORT_KEYS = ['p95_ms', 'total_ms', 'avg_queries', 'max_queries', 'duplicates', 'avg_db_ms', 'requests', 'avg_bytes']
+
+# "IN (%s, %s, %s)" of any length is the same query
+_IN_LIST = re.compile(r'\((?:%s, )*%s\)')
+_SIGNATURE_LENGTH = 300
+
+
+def query_signature(sql):
+    return _IN_LIST.sub('(...)', sql)[:_SIGNATURE_LENGTH]
+
+
+class Histogram:
+    """Counts per fixed bucket, so histograms from any process can be added together"""
+
+    def __init__(self, bounds, counts=None):
+        self.bounds = bounds
+        self.counts = list(counts) if counts else [0] * (len(bounds) + 1)
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding that fraction of values (None past the last bound)"""
+        total = sum(self.counts)
+        if not total:
+            return 0
+        running = 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= fraction * total:
+                return self.bounds[index] if index < len(self.bounds) else None
+        return None
+
+
+class EndpointStats:
+    def __init__(self, data=None):
+        data = data or {}
+        self.requests = data.get('requests', 0)
+        self.errors = data.get('errors', 0)
+        self.total_ms = data.get('total_ms', 0.0)
+        self.max_ms = data.get('max_ms', 0.0)
+        self.queries = data.get('queries', 0)
+        self.max_queries = data.get('max_queries', 0)
+        self.db_ms = data.get('db_ms', 0.0)
+        self.bytes = data.get('bytes', 0)
+        self.max_bytes = data.get('max_bytes', 0)
+        self.time_histogram = Histogram(TIME_BUCKETS_MS, data.get('time_histogram'))
+        self.query_histogram = Histogram(QUERY_BUCKETS, data.get('query_histogram'))
+        # signature -> [requests where it repeated, most repeats in one request]
+        self.duplicates = {signature: list(value) for signature, value in data.get('duplicates', {}).items()}
+
+    def add(self, wall_ms, queries, db_ms, repeated, size, status_code):
+        self.requests += 1
+        self.errors += status_code >= 500
+        self.total_ms += wall_ms
+        self.max_ms = max(self.max_ms, wall_ms)
+        self.queries += queries
+        self.max_queries = max(self.max_queries, queries)
+        self.db_ms += db_ms
+        if size is not None:
+            self.bytes += size
+            self.max_bytes = max(self.max_bytes, size)
+        self.time_histogram.add(wall_ms)
+        self.query_histogram.add(queries)
+        for signature, count in repeated.items():
+            self._add_duplicate(signature, 1, count)
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.errors += other.errors
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+        self.queries += other.queries
+        self.max_queries = max(self.max_queries, other.max_queries)
+        self.db_ms += other.db_ms
+        self.bytes += other.bytes
+        self.max_bytes = max(self.max_bytes, other.max_bytes)
+        self.time_histogram.merge(other.time_histogram)
+        self.query_histogram.merge(other.query_histogram)
+        for signature, (requests, repeats) in other.duplicates.items():
+            self._add_duplicate(signature, requests, repeats)
+
+    def _add_duplicate(self, signature, requests, repeats):
+        entry = self.duplicates.get(signature)
+        if entry is not None:
+            entry[0] += requests
+            entry[1] = max(entry[1], repeats)
+            return
+        if len(self.duplicates) >= MAX_DUPLICATE_SIGNATURES:
+            rarest = min(self.duplicates, key=lambda key: self.duplicates[key][0])
+            if self.duplicates[rarest][0] > requests:
+                return
+            del self.duplicates[rarest]
+        self.duplicates[signature] = [requests, repeats]
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'total_ms': self.total_ms,
+            'max_ms': self.max_ms,
+            'queries': self.queries,
+            'max_queries': self.max_queries,
+            'db_ms': self.db_ms,
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'time_histogram': self.time_histogram.counts,
+            'query_histogram': self.query_histogram.counts,
+            'duplicates': self.duplicates,
+        }
+
+    def summary(self, endpoint):
+        requests = self.requests or 1
+        return {
+            'endpoint': endpoint,
+            'requests': self.requests,
+            'errors': self.errors,
+            'total_ms': round(self.total_ms, 1),
+            'avg_ms': round(self.total_ms / requests, 1),
+            'p50_ms': self.time_histogram.percentile(0.5),
+            'p95_ms': self.time_histogram.percentile(0.95),
+            'p99_ms': self.time_histogram.percentile(0.99),
+            'max_ms': round(self.max_ms, 1),
+            'avg_queries': round(self.queries / requests, 1),
+            'p95_queries': self.query_histogram.percentile(0.95),
+            'max_queries': self.max_queries,
+            'avg_db_ms': round(self.db_ms / requests, 1),
+            'avg_bytes': round(self.bytes / requests),
+            'max_bytes': self.max_bytes,
+            'duplicates': sum(requests for requests, _ in self.duplicates.values()),
+            'duplicate_queries': [
+                {'sql': signature, 'requests': requests, 'max_repeats': repeats}
+                for signature, (requests, repeats) in sorted(
+                    self.duplicates.items(), key=lambda item: item[1][0], reverse=True
+                )
+            ],
+        }
+
+
+class _QueryTracker:
+    """execute_wrapper counting and timing one request's queries by signature"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.signatures[query_signature(sql)] += 1
+
+
+class Profiler:
+    """This process's per-endpoint statistics, bounded in size"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._since = time.time()
+        self._last_dump = time.monotonic()
+
+    def record(self, endpoint, wall_ms, queries, db_ms, repeated, size, status_code):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                if len(self._endpoints) >= MAX_ENDPOINTS:
+                    endpoint = OTHER_ENDPOINT
+                stats = self._endpoints.setdefault(endpoint, EndpointStats())
+            stats.add(wall_ms, queries, db_ms, repeated, size, status_code)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'since': self._since,
+                'saved_at': time.time(),
+                'endpoints': {name: stats.to_dict() for name, stats in self._endpoints.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self._since = time.time()
+
+    def maybe_dump(self, directory):
+        if time.monotonic() - self._last_dump < PROFILE_DUMP_SECONDS:
+            return
+        self._last_dump = time.monotonic()
+        try:
+            save_snapshot(directory, self.snapshot())
+        except OSError:
+            logger.exception('Could not save the request profile')
+
+
+profiler = Profiler()
+
+
+def save_snapshot(directory, snapshot):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"profile-{snapshot['pid']}.json")
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def load_snapshots(directory, exclude_pid=None):
+    """Profiles saved by every process, except exclude_pid's"""
+    snapshots = []
+    if not os.path.isdir(directory):
+        return snapshots
+    for name in os.listdir(directory):
+        if not (name.startswith('profile-') and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if snapshot.get('pid') != exclude_pid:
+            snapshots.append(snapshot)
+    return snapshots
+
+
+def clear_snapshots(directory):
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.startswith('profile-'):
+            os.remove(os.path.join(directory, name))
+
+
+def merge_snapshots(snapshots):
+    endpoints = {}
+    for snapshot in snapshots:
+        for name, data in snapshot['endpoints'].items():
+            endpoints.setdefault(name, EndpointStats()).merge(EndpointStats(data))
+    return endpoints
+
+
+def build_report(snapshots, sort='p95_ms', limit=20):
+    """Per-endpoint summaries of the merged snapshots, worst first by sort"""
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Unknown sort '{sort}', choose from {', '.join(SORT_KEYS)}")
+    rows = [stats.summary(name) for name, stats in merge_snapshots(snapshots).items()]
+    # None means past the last histogram bucket, i.e. the slowest of all
+    rows.sort(key=lambda row: float('inf') if row[sort] is None else row[sort], reverse=True)
+    return {
+        'processes': len(snapshots),
+        'since': min((snapshot['since'] for snapshot in snapshots), default=None),
+        'endpoints': rows[:limit],
+    }
+
+
+def current_report(sort='p95_ms', limit=20):
+    """This process live, plus whatever the other processes last saved"""
+    directory = settings.REQUEST_PROFILING_DIR
+    return build_report([profiler.snapshot()] + load_snapshots(directory, exclude_pid=os.getpid()), sort, limit)
+
+
+class ProfilingMiddleware:
+    """
+    Records, per URL name, wall time, query count, DB time, repeated query
+    signatures (N+1 candidates) and response size. Only installed when
+    settings.REQUEST_PROFILING is on; otherwise Django drops it at startup
+    and requests never pass through it.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.directory = settings.REQUEST_PROFILING_DIR
+
+    def __call__(self, request):
+        tracker = _QueryTracker()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(tracker))
+            response = self.get_response(request)
+        wall_ms = (time.perf_counter() - started) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        endpoint = (match.view_name or match.route) if match else UNRESOLVED_ENDPOINT
+        profiler.record(
+            endpoint,
+            wall_ms,
+            tracker.count,
+            tracker.seconds * 1000,
+            {signature: count for signature, count in tracker.signatures.items() if count > 1},
+            None if response.streaming else len(response.content),
+            response.status_code
+        )
+        profiler.maybe_dump(self.directory)
+        return response
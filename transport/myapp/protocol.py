@@ -0,0 +1,129 @@
+"""
+Wire formats for the location WebSockets.
+
+Clients pick a format when connecting, either with a WebSocket subprotocol
+or a ?format= query parameter:
+
+    json        (default) one JSON text message per update, as before
+    json-batch  one {"type": "location_batch", "updates": [...]} per tick
+    binary      one packed binary frame per tick
+
+Binary frames are little-endian: a header of version (uint8), kind (uint8),
+update count (uint16) and tick sequence (uint32), followed by one record per
+update. A record is the id (uint32) and a flag (uint8), then either absolute
+coordinates in microdegrees (2 x int32, flag 0) or the change since the last
+position sent for that id on this connection (2 x int16, flag 1).
+"""
+import json
+import struct
+from urllib.parse import parse_qs
+
+
+PROTOCOL_VERSION = 1
+
+FORMAT_JSON = 'json'
+FORMAT_JSON_BATCH = 'json-batch'
+FORMAT_BINARY = 'binary'
+
+SUBPROTOCOLS = {
+    'transport.json.v1': FORMAT_JSON,
+    'transport.json-batch.v1': FORMAT_JSON_BATCH,
+    'transport.bin.v1': FORMAT_BINARY,
+}
+
+KIND_DRIVER = 1
+KIND_BUS = 2
+
+MICRODEGREES = 1_000_000
+
+_HEADER = struct.Struct('<BBHI')
+_ABSOLUTE = struct.Struct('<IBii')
+_DELTA = struct.Struct('<IBhh')
+_INT16_MIN, _INT16_MAX = -(1 << 15), (1 << 15) - 1
+_MAX_RECORDS = (1 << 16) - 1
+
+
+def negotiate(scope):
+    """
+    Pick the wire format for a connection. Returns (format, subprotocol), where
+    subprotocol is the one to accept, or None if the client offered none.
+    """
+    for offered in scope.get('subprotocols') or ():
+        if offered in SUBPROTOCOLS:
+            return SUBPROTOCOLS[offered], offered
+
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    requested = (query.get('format') or [FORMAT_JSON])[0]
+    if requested not in (FORMAT_JSON, FORMAT_JSON_BATCH, FORMAT_BINARY):
+        requested = FORMAT_JSON
+    return requested, None
+
+
+class FrameEncoder:
+    """
+    Per-connection encoder for batched position updates. Remembers the last
+    position sent for every id so later records can be sent as small deltas.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.sequence = 0
+        self._last_sent = {}  # id -> (lat_e6, lng_e6)
+
+    def encode(self, updates):
+        """
+        Pack an iterable of (id, lat, lng) into binary frames, splitting when a
+        frame would exceed the uint16 record count. Returns a list of bytes.
+        """
+        frames = []
+        records = []
+        for object_id, lat, lng in updates:
+            lat_e6 = int(round(float(lat) * MICRODEGREES))
+            lng_e6 = int(round(float(lng) * MICRODEGREES))
+            last = self._last_sent.get(object_id)
+            if last is not None:
+                d_lat, d_lng = lat_e6 - last[0], lng_e6 - last[1]
+            if last is not None and _INT16_MIN <= d_lat <= _INT16_MAX and _INT16_MIN <= d_lng <= _INT16_MAX:
+                records.append(_DELTA.pack(object_id, 1, d_lat, d_lng))
+            else:
+                records.append(_ABSOLUTE.pack(object_id, 0, lat_e6, lng_e6))
+            self._last_sent[object_id] = (lat_e6, lng_e6)
+            if len(records) == _MAX_RECORDS:
+                frames.append(self._frame(records))
+                records = []
+        if records:
+            frames.append(self._frame(records))
+        return frames
+
+    def _frame(self, records):
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        return _HEADER.pack(PROTOCOL_VERSION, self.kind, len(records), self.sequence) + b''.join(records)
+
+
+def decode_frame(data, previous=None):
+    """
+    Decode a binary frame into (kind, sequence, [(id, lat, lng), ...]).
+    `previous` is the id -> (lat_e6, lng_e6) state of the receiving side and is
+    updated in place; it is what a client keeps between frames.
+    """
+    previous = {} if previous is None else previous
+    _, kind, count, sequence = _HEADER.unpack_from(data, 0)
+    offset = _HEADER.size
+    updates = []
+    for _ in range(count):
+        object_id, flag = struct.unpack_from('<IB', data, offset)
+        if flag:
+            _, _, d_lat, d_lng = _DELTA.unpack_from(data, offset)
+            last = previous[object_id]
+            lat_e6, lng_e6 = last[0] + d_lat, last[1] + d_lng
+            offset += _DELTA.size
+        else:
+            _, _, lat_e6, lng_e6 = _ABSOLUTE.unpack_from(data, offset)
+            offset += _ABSOLUTE.size
+        previous[object_id] = (lat_e6, lng_e6)
+        updates.append((object_id, lat_e6 / MICRODEGREES, lng_e6 / MICRODEGREES))
+    return kind, sequence, updates
+
+
+def json_batch(updates):
+    return json.dumps({'type': 'location_batch', 'updates': updates})
@@ -4,4 +4,5 @@ from . import consumers
 websocket_urlpatterns = [
     re_path(r'ws/bus/(?P<bus_id>\w+)/$', consumers.BusConsumer.as_asgi()),
     re_path(r'ws/drivers/location/$', consumers.DriverLocationConsumer.as_asgi()),
+    re_path(r'ws/notifications/$', consumers.NotificationConsumer.as_asgi()),
 ]
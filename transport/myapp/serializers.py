@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from django.core.validators import RegexValidator
+from .fee_balances import fee_balance
 from .models import User, Bus, Seat, Attendance, Notification, Query, Fee, EmergencyAlert, DriverLeave, DriverAttendance, StudentQuery
 import re
 
@@ -146,12 +147,7 @@ class SeatSerializer(serializers.ModelSerializer):
 
     def get_user_details(self, obj):
         if obj.assigned_user:
-            # Check for unpaid fees
-            from .models import Fee
-            unpaid_fees = Fee.objects.filter(
-                user=obj.assigned_user, 
-                payment_status__in=['PENDING', 'OVERDUE']
-            ).exists()
+            unpaid_fees = fee_balance(obj.assigned_user).has_unpaid_fees
             
             return {
                 'id': obj.assigned_user.id,
@@ -171,7 +167,6 @@ class SeatSerializer(serializers.ModelSerializer):
                 'fee_status': 'Unpaid' if unpaid_fees else 'Paid'
             }
         return None
-        return None
 
 
 class AttendanceSerializer(serializers.ModelSerializer):
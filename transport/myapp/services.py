@@ -1,5 +1,15 @@
+import time
+
 from django.db import transaction
-from .models import Bus, Seat, User, Notification
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from . import outbox
+from .models import Bus, Seat, User, Notification, Fee, FeeBalance
+from .notifications import notifications_created
+
+
+# Primary key span per UPDATE in the overdue sweep
+FEE_SWEEP_CHUNK_SIZE = 10000
 
 
 class BusService:
@@ -48,9 +58,6 @@ class BusService:
     @transaction.atomic
     def assign_users_to_bus(bus_id, user_ids):
         """Assign students/teachers to bus seats automatically"""
-        from .models import Fee
-        from datetime import date
-        
         bus = Bus.objects.get(id=bus_id)
         available_seats = Seat.objects.filter(bus=bus, is_available=True).order_by('seat_number')
         
@@ -59,16 +66,12 @@ class BusService:
         
         users = User.objects.filter(id__in=user_ids, role__in=['TEACHER', 'STUDENT'])
         
-        # Check for unpaid fees
-        users_with_unpaid_fees = []
-        for user in users:
-            unpaid_fees = Fee.objects.filter(
-                user=user, 
-                payment_status__in=['PENDING', 'OVERDUE'],
-                due_date__lt=date.today()
-            ).exists()
-            if unpaid_fees:
-                users_with_unpaid_fees.append(user.username)
+        # Check for unpaid fees past their due date
+        users_with_unpaid_fees = list(FeeBalance.objects.filter(
+            user__in=users,
+            unpaid_count__gt=0,
+            oldest_due_date__lt=timezone.localdate()
+        ).values_list('user__username', flat=True))
         
         if users_with_unpaid_fees:
             raise ValueError(f"Cannot assign seats. Users with unpaid fees: {', '.join(users_with_unpaid_fees)}")
@@ -125,24 +128,24 @@ class BusService:
     @staticmethod
     def notify_admins_of_breakdown(bus):
         """Notify all admins when a bus breaks down"""
-        admins = User.objects.filter(role='ADMIN')
-        for admin in admins:
-            NotificationService.send_notification(
-                user=admin,
-                message=f"🚨 URGENT: Bus {bus.bus_number} ({bus.source} → {bus.destination}) has broken down! Please reassign passengers immediately.",
-                created_by=None
-            )
+        NotificationService.notify_role(
+            'ADMIN',
+            f"🚨 URGENT: Bus {bus.bus_number} ({bus.source} → {bus.destination}) has broken down! Please reassign passengers immediately.",
+            created_by=None
+        )
 
 
 class NotificationService:
     @staticmethod
     def send_notification(user, message, created_by):
         """Send notification to a user"""
-        return Notification.objects.create(
+        notification = Notification.objects.create(
             user=user,
             message=message,
             created_by=created_by
         )
+        notifications_created([notification])
+        return notification
 
     @staticmethod
     def send_bulk_notifications(user_ids, message, created_by):
@@ -152,7 +155,9 @@ class NotificationService:
             Notification(user=user, message=message, created_by=created_by)
             for user in users
         ]
-        return Notification.objects.bulk_create(notifications)
+        notifications = Notification.objects.bulk_create(notifications)
+        notifications_created(notifications)
+        return notifications
 
     @staticmethod
     def send_role_based_notifications(role, message, created_by):
@@ -162,7 +167,64 @@ class NotificationService:
             Notification(user=user, message=message, created_by=created_by)
             for user in users
         ]
-        return Notification.objects.bulk_create(notifications)
+        notifications = Notification.objects.bulk_create(notifications)
+        notifications_created(notifications)
+        return notifications
+
+    @staticmethod
+    def notify_role(role, message, created_by=None):
+        """Queue a notification for every user with a role"""
+        return outbox.enqueue('ROLE', message, created_by, role=role)
+
+    @staticmethod
+    def notify_bus_passengers(bus, message, created_by=None, role=None):
+        """Queue a notification for everyone seated on a bus, optionally only one role"""
+        return outbox.enqueue('BUS', message, created_by, bus_id=bus.id, role=role)
+
+    @staticmethod
+    def notify_users(user_ids, message, created_by=None):
+        """Queue a notification for a list of users"""
+        return outbox.enqueue('USERS', message, created_by, user_ids=list(user_ids))
+
+
+class FeeService:
+    @staticmethod
+    def sweep_overdue_fees(today=None, chunk_size=FEE_SWEEP_CHUNK_SIZE, pause=0):
+        """
+        Bring payment_status in line with due dates the way Fee.save would:
+        unpaid PENDING fees past their due date become OVERDUE, and OVERDUE
+        fees whose due date moved back into the future become PENDING again.
+
+        Works in primary key ranges of chunk_size, each UPDATE committing on
+        its own so no lock is held for long, and only over the id span of
+        candidate rows (found through the status/due date index). Running it
+        again changes nothing. Both statuses count as unpaid, so fee balances
+        are unaffected. Returns the counts of fees moved each way.
+        """
+        today = today or timezone.localdate()
+        now = timezone.now()
+        unpaid = Q(paid_amount__lte=0)
+        to_overdue = Q(payment_status='PENDING', due_date__lt=today) & unpaid
+        to_pending = Q(payment_status='OVERDUE', due_date__gte=today) & unpaid
+
+        span = Fee.objects.filter(
+            Q(payment_status='PENDING', due_date__lt=today) | Q(payment_status='OVERDUE', due_date__gte=today)
+        ).aggregate(first=Min('id'), last=Max('id'))
+        counts = {'overdue': 0, 'pending': 0}
+        if span['first'] is None:
+            return counts
+
+        for start in range(span['first'], span['last'] + 1, chunk_size):
+            in_range = Q(id__gte=start, id__lt=start + chunk_size)
+            counts['overdue'] += Fee.objects.filter(in_range & to_overdue).update(
+                payment_status='OVERDUE', updated_at=now
+            )
+            counts['pending'] += Fee.objects.filter(in_range & to_pending).update(
+                payment_status='PENDING', updated_at=now
+            )
+            if pause:
+                time.sleep(pause)
+        return counts
 
 
 class AttendanceService:
@@ -0,0 +1,96 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import dashboard
+from .fee_balances import refresh_fee_balances
+from .geofence import geofences
+from .models import Bus, DriverAttendance, Fee, Seat, User
+from .spatial import bus_index
+
+
+@receiver(post_save, sender=Bus)
+@receiver(post_delete, sender=Bus)
+def refresh_bus_index_for_bus(sender, instance, **kwargs):
+    bus_index.invalidate(instance.id)
+
+
+@receiver(post_save, sender=Seat)
+@receiver(post_delete, sender=Seat)
+def refresh_bus_index_for_seat(sender, instance, **kwargs):
+    bus_index.invalidate(instance.bus_id)
+
+
+@receiver(post_save, sender=Bus)
+@receiver(post_delete, sender=Bus)
+def refresh_geofences_for_bus(sender, instance, **kwargs):
+    geofences.invalidate(instance.id)
+
+
+@receiver(post_save, sender=Seat)
+def refresh_geofences_for_seat(sender, instance, **kwargs):
+    geofences.seat_changed(instance)
+
+
+@receiver(post_delete, sender=Seat)
+def refresh_geofences_for_deleted_seat(sender, instance, **kwargs):
+    geofences.seat_changed(instance, deleted=True)
+
+
+@receiver(post_save, sender=User)
+def refresh_geofences_for_student(sender, instance, update_fields=None, **kwargs):
+    # Pickup points follow student homes; skip saves like last_login updates
+    if instance.role != 'STUDENT':
+        return
+    if update_fields is None or {'home_latitude', 'home_longitude'} & set(update_fields):
+        geofences.student_moved(instance.id)
+
+
+@receiver(post_save, sender=Fee)
+def refresh_fee_balance_on_save(sender, instance, **kwargs):
+    # Fee.save runs in a transaction, so the balance commits with the fee
+    refresh_fee_balances([instance.user_id])
+
+
+@receiver(post_delete, sender=Fee)
+def refresh_fee_balance_on_delete(sender, instance, origin=None, **kwargs):
+    # Deleting the user cascades to the balance row as well
+    if isinstance(origin, User) or getattr(origin, 'model', None) is User:
+        return
+    refresh_fee_balances([instance.user_id])
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Bus)
+@receiver(pre_save, sender=DriverAttendance)
+def remember_dashboard_state(sender, instance, update_fields=None, **kwargs):
+    dashboard.remember_state(instance, update_fields)
+
+
+@receiver(post_save, sender=User)
+def update_dashboard_for_user(sender, instance, created, **kwargs):
+    dashboard.user_saved(instance, created)
+
+
+@receiver(post_delete, sender=User)
+def update_dashboard_for_deleted_user(sender, instance, **kwargs):
+    dashboard.user_deleted(instance)
+
+
+@receiver(post_save, sender=Bus)
+def update_dashboard_for_bus(sender, instance, created, **kwargs):
+    dashboard.bus_saved(instance, created)
+
+
+@receiver(post_delete, sender=Bus)
+def update_dashboard_for_deleted_bus(sender, instance, **kwargs):
+    dashboard.bus_deleted(instance)
+
+
+@receiver(post_save, sender=DriverAttendance)
+def update_dashboard_for_driver_attendance(sender, instance, created, **kwargs):
+    dashboard.driver_attendance_saved(instance, created)
+
+
+@receiver(post_delete, sender=DriverAttendance)
+def update_dashboard_for_deleted_driver_attendance(sender, instance, **kwargs):
+    dashboard.driver_attendance_deleted(instance)
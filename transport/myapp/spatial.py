@@ -0,0 +1,208 @@
+import math
+import threading
+import time
+
+from django.db.models import Count, Q
+
+from .distance import EARTH_RADIUS_KM, distances_to_point
+from .models import Bus
+
+
+# Grid cell size in degrees (~5.5 km of latitude per cell)
+CELL_SIZE_DEG = 0.05
+
+# Full rebuild interval, covers changes made by other worker processes
+REBUILD_INTERVAL_SECONDS = 300
+
+
+class BusSpatialIndex:
+    """
+    In-process grid index over bus source coordinates.
+
+    Buses are bucketed into fixed-size lat/lng cells. Queries search rings of
+    cells outwards from the query point and stop as soon as no unvisited cell
+    can hold a closer bus, so a lookup only touches the buses around the point.
+    Only WORKING buses with at least one free passenger seat are indexed.
+    """
+
+    def __init__(self, cell_size=CELL_SIZE_DEG, rebuild_interval=REBUILD_INTERVAL_SECONDS):
+        self.cell_size = cell_size
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.RLock()
+        self._cells = {}
+        self._buses = {}  # bus_id -> (lat, lng, free_seats)
+        self._dirty = set()
+        self._bounds = None  # (min_row, max_row, min_col, max_col)
+        self._built_at = None
+
+    # -- maintenance -----------------------------------------------------
+
+    def _cell(self, lat, lng):
+        return (int(math.floor(lat / self.cell_size)), int(math.floor(lng / self.cell_size)))
+
+    @staticmethod
+    def _indexed_buses(bus_ids=None):
+        queryset = Bus.objects.filter(
+            status='WORKING',
+            source_latitude__isnull=False,
+            source_longitude__isnull=False,
+        )
+        if bus_ids is not None:
+            queryset = queryset.filter(id__in=bus_ids)
+        # Seat 1 is the driver seat and is never handed out to students
+        return queryset.annotate(
+            free_seats=Count('seats', filter=Q(seats__is_available=True) & ~Q(seats__seat_number=1))
+        ).values_list('id', 'source_latitude', 'source_longitude', 'free_seats')
+
+    def _put(self, bus_id, lat, lng, free_seats):
+        self._remove(bus_id)
+        if free_seats <= 0:
+            return
+        lat, lng = float(lat), float(lng)
+        self._buses[bus_id] = (lat, lng, free_seats)
+        row, col = self._cell(lat, lng)
+        self._cells.setdefault((row, col), set()).add(bus_id)
+        if self._bounds is None:
+            self._bounds = (row, row, col, col)
+        else:
+            min_row, max_row, min_col, max_col = self._bounds
+            self._bounds = (min(min_row, row), max(max_row, row), min(min_col, col), max(max_col, col))
+
+    def _remove(self, bus_id):
+        entry = self._buses.pop(bus_id, None)
+        if entry is None:
+            return
+        cell = self._cell(entry[0], entry[1])
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(bus_id)
+            if not members:
+                del self._cells[cell]
+
+    def rebuild(self):
+        """Reload every indexed bus from the database"""
+        rows = list(self._indexed_buses())
+        with self._lock:
+            self._cells = {}
+            self._buses = {}
+            self._dirty = set()
+            self._bounds = None
+            for bus_id, lat, lng, free_seats in rows:
+                self._put(bus_id, lat, lng, free_seats)
+            self._built_at = time.monotonic()
+
+    def invalidate(self, bus_id):
+        """Mark a bus for refresh on the next query (cheap, safe to call from signals)"""
+        with self._lock:
+            self._dirty.add(bus_id)
+
+    def refresh(self, bus_ids):
+        """Reload the given buses from the database in one query"""
+        bus_ids = set(bus_ids)
+        if not bus_ids:
+            return
+        rows = {row[0]: row for row in self._indexed_buses(bus_ids)}
+        with self._lock:
+            for bus_id in bus_ids:
+                if bus_id in rows:
+                    self._put(*rows[bus_id])
+                else:
+                    self._remove(bus_id)
+                self._dirty.discard(bus_id)
+
+    def _ensure_fresh(self):
+        with self._lock:
+            stale = (
+                self._built_at is None
+                or time.monotonic() - self._built_at > self.rebuild_interval
+            )
+            dirty = set(self._dirty)
+        if stale:
+            self.rebuild()
+        elif dirty:
+            self.refresh(dirty)
+
+    # -- queries ---------------------------------------------------------
+
+    def _cell_distance_bound(self, lat, ring):
+        """Lower bound in km to any point at least `ring` cells away"""
+        if ring <= 0:
+            return 0.0
+        # A degree of longitude shrinks towards the poles, latitude does not
+        lat_rad = math.radians(min(abs(lat) + ring * self.cell_size, 89.9))
+        km_per_cell = math.cos(lat_rad) * self.cell_size * (math.pi / 180) * EARTH_RADIUS_KM
+        return (ring - 1) * km_per_cell
+
+    def k_nearest(self, latitude, longitude, k=1, exclude=()):
+        """Return up to k (bus_id, distance_km) pairs nearest to the point, closest first"""
+        self._ensure_fresh()
+        latitude, longitude = float(latitude), float(longitude)
+        exclude = set(exclude)
+
+        with self._lock:
+            if not self._buses:
+                return []
+            row, col = self._cell(latitude, longitude)
+            min_row, max_row, min_col, max_col = self._bounds
+            max_ring = max(row - min_row, max_row - row, col - min_col, max_col - col)
+            found = []
+            ring = 0
+            while ring <= max_ring:
+                candidates = [
+                    bus_id
+                    for cell in self._ring_cells(row, col, ring)
+                    for bus_id in self._cells.get(cell, ())
+                    if bus_id not in exclude
+                ]
+                if candidates:
+                    distances = distances_to_point(
+                        [self._buses[bus_id][:2] for bus_id in candidates], latitude, longitude
+                    )
+                    found.extend(zip(distances.tolist(), candidates))
+                ring += 1
+                if len(found) >= k:
+                    found.sort()
+                    found = found[:k]
+                    if found[-1][0] <= self._cell_distance_bound(latitude, ring):
+                        break
+            found.sort()
+            return [(bus_id, distance) for distance, bus_id in found[:k]]
+
+    def nearest(self, latitude, longitude, exclude=()):
+        """Return (bus_id, distance_km) of the nearest bus with a free seat, or None"""
+        result = self.k_nearest(latitude, longitude, k=1, exclude=exclude)
+        return result[0] if result else None
+
+    @staticmethod
+    def _ring_cells(row, col, ring):
+        if ring == 0:
+            yield (row, col)
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield (row - ring, c)
+            yield (row + ring, c)
+        for r in range(row - ring + 1, row + ring):
+            yield (r, col - ring)
+            yield (r, col + ring)
+
+
+bus_index = BusSpatialIndex()
+
+
+# Live map grid: cells of ~11 km; viewport subscriptions join one channel
+# group per cell, and wider viewports fall back to the fleet-wide group
+LIVE_MAP_CELL_DEG = 0.1
+LIVE_MAP_MAX_CELLS = 400
+
+
+def live_map_cell(lat, lng):
+    return (int(math.floor(lat / LIVE_MAP_CELL_DEG)), int(math.floor(lng / LIVE_MAP_CELL_DEG)))
+
+
+def live_map_cells(south, west, north, east):
+    """Cells covering a bounding box, or None when there are more than LIVE_MAP_MAX_CELLS"""
+    min_row, min_col = live_map_cell(south, west)
+    max_row, max_col = live_map_cell(north, east)
+    if (max_row - min_row + 1) * (max_col - min_col + 1) > LIVE_MAP_MAX_CELLS:
+        return None
+    return [(row, col) for row in range(min_row, max_row + 1) for col in range(min_col, max_col + 1)]
@@ -0,0 +1,357 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max
+
+from .dashboard import dashboard_updates_suspended
+from .distance import UNIVERSITY_LATITUDE, UNIVERSITY_LONGITUDE, coordinate_array, distances_to_university
+from .fee_balances import rebuild_fee_balances
+from .fees import calculate_bus_fee_from_distance, calculate_driver_salary_from_distance, current_fee_period
+from .models import Attendance, Bus, DriverAttendance, Fee, FeePayment, Seat, User
+
+
+# Every synthetic user's username starts with this, which is how --reset finds them
+SYNTHETIC_PREFIX = 'syn_'
+
+# Synthetic buses are numbered from here up, clear of real fleet numbers
+SYNTHETIC_BUS_NUMBER_START = 100000
+
+SYNTHETIC_PASSWORD = 'synthetic123'
+
+# Rows per bulk_create
+SYNTHETIC_BATCH_SIZE = 5000
+
+# Towns the students commute from: (name, latitude, longitude, share of students, spread in km)
+TOWNS = [
+    ('Tiruchengode', 11.3796, 77.8946, 0.22, 3.0),
+    ('Namakkal', 11.2189, 78.1677, 0.12, 3.5),
+    ('Salem', 11.6643, 78.1460, 0.12, 5.0),
+    ('Erode', 11.3410, 77.7172, 0.11, 4.5),
+    ('Sankari', 11.4746, 77.8690, 0.06, 2.0),
+    ('Rasipuram', 11.4600, 78.1800, 0.06, 2.5),
+    ('Komarapalayam', 11.4440, 77.6935, 0.06, 2.0),
+    ('Bhavani', 11.4450, 77.6820, 0.04, 2.0),
+    ('Karur', 10.9601, 78.0766, 0.05, 3.5),
+    ('Perundurai', 11.2750, 77.5870, 0.04, 2.5),
+    ('Paramathi Velur', 11.1107, 78.0050, 0.03, 2.0),
+    ('Mohanur', 11.0600, 78.1400, 0.02, 1.5),
+    ('Sendamangalam', 11.2850, 78.2330, 0.02, 1.5),
+    ('Mallasamudram', 11.4930, 78.0310, 0.03, 1.5),
+    ('Edappadi', 11.5850, 77.8380, 0.02, 1.5),
+]
+
+UNIVERSITY_NAME = 'KSR College, Tiruchengode'
+
+FIRST_NAMES = [
+    'Arun', 'Priya', 'Karthik', 'Divya', 'Rajesh', 'Lakshmi', 'Vijay', 'Meena', 'Suresh', 'Kavya',
+    'Ramesh', 'Deepa', 'Kumar', 'Sangeetha', 'Ganesh', 'Nithya', 'Prakash', 'Revathi', 'Selvam', 'Janaki',
+    'Murugan', 'Saranya', 'Bala', 'Vani', 'Senthil', 'Mythili', 'Ravi', 'Pooja', 'Anand', 'Sowmya',
+]
+LAST_NAMES = [
+    'Kumar', 'Raj', 'Krishnan', 'Murugan', 'Selvam', 'Pandian', 'Rajan', 'Babu',
+    'Moorthy', 'Samy', 'Kannan', 'Subramanian', 'Venkat', 'Prasad', 'Shankar',
+]
+COLLEGES = ['KSRCT', 'KSRCE', 'KSRCAS', 'KSRCAS (Women)', 'KSRDS', 'KSRCN']
+YEARS = ['I', 'II', 'III', 'IV']
+
+# Named sizes for --preset; "large" is the fleet the benchmarks are meant for
+PRESETS = {
+    'small': {'buses': 20, 'students': 1000, 'attendance_days': 30, 'fee_months': 3},
+    'medium': {'buses': 200, 'students': 10000, 'attendance_days': 120, 'fee_months': 6},
+    'large': {'buses': 1000, 'students': 50000, 'attendance_days': 730, 'fee_months': 24},
+}
+
+_KM_PER_DEGREE = 111.0
+
+
+class SyntheticDataGenerator:
+    """
+    Builds a reproducible fleet with bulk inserts: drivers, buses with their
+    seats, students living in clusters around the towns near Tiruchengode,
+    and a history of student attendance, driver attendance and monthly fees.
+
+    Everything random comes from one numpy generator seeded with `seed`, so
+    the same arguments produce the same data. Students fill the seats of
+    buses from their own town; `unseated` of them (plus any town overflow)
+    are left without a seat for the assignment endpoints to work on.
+    """
+
+    def __init__(self, seed=42, buses=20, seats_per_bus=60, students=1000, attendance_days=30,
+                 fee_months=3, unseated=0.05, today=None, batch_size=SYNTHETIC_BATCH_SIZE, log=None):
+        self.rng = np.random.default_rng(seed)
+        self.buses = buses
+        self.seats_per_bus = seats_per_bus
+        self.students = students
+        self.attendance_days = attendance_days
+        self.fee_months = fee_months
+        self.unseated = unseated
+        self.today = today or date.today()
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.counts = {}
+
+    @staticmethod
+    def reset():
+        """Delete every synthetic user and bus, with their seats, fees and attendance"""
+        # Deleting users one by one would update the dashboard snapshot per user
+        with dashboard_updates_suspended(), transaction.atomic():
+            buses = Bus.objects.filter(bus_number__gte=SYNTHETIC_BUS_NUMBER_START).delete()[1].get('myapp.Bus', 0)
+            users = User.objects.filter(username__startswith=SYNTHETIC_PREFIX)
+            # Fee's delete signal would make the cascade load every fee one by one;
+            # their balances go with the users
+            FeePayment.objects.filter(fee__user__in=users)._raw_delete(FeePayment.objects.db)
+            Fee.objects.filter(user__in=users)._raw_delete(Fee.objects.db)
+            deleted = users.delete()[1].get('myapp.User', 0)
+        return {'buses': buses, 'users': deleted}
+
+    def run(self):
+        if User.objects.filter(username__startswith=SYNTHETIC_PREFIX).exists():
+            raise ValueError('Synthetic data already exists, run with --reset to replace it')
+        self.password = make_password(SYNTHETIC_PASSWORD)
+        # Bulk inserts skip the dashboard signals; recount once at the end instead
+        with dashboard_updates_suspended():
+            with transaction.atomic():
+                self._create_admin()
+                towns = self._town_weights()
+                bus_towns = self._create_buses(towns)
+                student_ids, student_towns, distances = self._create_students(towns)
+                seated = self._create_seats(bus_towns, student_ids, student_towns)
+            self._create_attendance(seated)
+            self._create_fees(seated, dict(zip(student_ids, distances)))
+            self.log('Rebuilding fee balances')
+            rebuild_fee_balances()
+        return self.counts
+
+    # -- fleet -----------------------------------------------------------
+
+    def _town_weights(self):
+        weights = np.array([town[3] for town in TOWNS])
+        return weights / weights.sum()
+
+    def _create_admin(self):
+        User.objects.create(
+            username=f'{SYNTHETIC_PREFIX}admin', password=self.password, role='ADMIN',
+            first_name='Synthetic', last_name='Admin', is_staff=True
+        )
+
+    def _create_buses(self, towns):
+        """One driver and bus per route, starting in a town picked by its share of students"""
+        self.log(f'Creating {self.buses} drivers and buses')
+        # Routes per town in proportion to its students, largest remainders first
+        share = towns * self.buses
+        routes = np.floor(share).astype(int)
+        routes[np.argsort(routes - share)[:self.buses - routes.sum()]] += 1
+        bus_towns = self.rng.permutation(np.repeat(np.arange(len(TOWNS)), routes))
+        starts = np.vstack([self._scatter(*TOWNS[town][1:3], TOWNS[town][4], 1) for town in bus_towns.tolist()])
+        distances = distances_to_university(coordinate_array(starts.tolist())).tolist()
+
+        User.objects.bulk_create([
+            User(
+                username=f'{SYNTHETIC_PREFIX}driver_{number:05d}',
+                password=self.password,
+                role='DRIVER',
+                first_name=self._choice(FIRST_NAMES),
+                last_name=self._choice(LAST_NAMES),
+                phone=self._phone(),
+                driving_experience=int(self.rng.integers(1, 25)),
+                hire_date=self.today - timedelta(days=int(self.rng.integers(30, 3650))),
+                license_number=f'TN{int(self.rng.integers(10, 99))}{number:09d}',
+                salary=Decimal(calculate_driver_salary_from_distance(distance_km)),
+                driver_status='AVAILABLE'
+            )
+            for number, distance_km in enumerate(distances, 1)
+        ], batch_size=self.batch_size)
+        # Read the ids back, bulk_create does not set them on every database
+        driver_ids = list(User.objects.filter(
+            username__startswith=f'{SYNTHETIC_PREFIX}driver_'
+        ).order_by('username').values_list('id', flat=True))
+
+        first_number = max(
+            SYNTHETIC_BUS_NUMBER_START,
+            (Bus.objects.aggregate(Max('bus_number'))['bus_number__max'] or 0) + 1
+        )
+        Bus.objects.bulk_create([
+            Bus(
+                bus_number=first_number + index,
+                source=TOWNS[town][0],
+                destination=UNIVERSITY_NAME,
+                source_latitude=Decimal(f'{lat:.6f}'),
+                source_longitude=Decimal(f'{lng:.6f}'),
+                destination_latitude=Decimal(str(UNIVERSITY_LATITUDE)),
+                destination_longitude=Decimal(str(UNIVERSITY_LONGITUDE)),
+                distance_km=Decimal(f'{distance_km:.2f}'),
+                capacity=self.seats_per_bus,
+                driver_id=driver_id
+            )
+            for index, (town, (lat, lng), distance_km, driver_id) in enumerate(
+                zip(bus_towns.tolist(), starts.tolist(), distances, driver_ids)
+            )
+        ], batch_size=self.batch_size)
+        self.fleet = list(Bus.objects.filter(
+            bus_number__gte=first_number
+        ).order_by('bus_number').values_list('id', 'driver_id', 'distance_km'))
+        self.counts['buses'] = len(self.fleet)
+        self.counts['drivers'] = len(driver_ids)
+        return bus_towns
+
+    def _create_students(self, towns):
+        self.log(f'Creating {self.students} students')
+        student_towns = self.rng.choice(len(TOWNS), size=self.students, p=towns)
+        homes = np.empty((self.students, 2))
+        for town, (_, lat, lng, _, spread_km) in enumerate(TOWNS):
+            members = student_towns == town
+            homes[members] = self._scatter(lat, lng, spread_km, int(members.sum()))
+        distances = distances_to_university(coordinate_array(homes.tolist())).tolist()
+
+        students = []
+        for number, (town, (lat, lng)) in enumerate(zip(student_towns, homes.tolist()), 1):
+            college = self._choice(COLLEGES)
+            year_index = int(self.rng.integers(0, len(YEARS)))
+            students.append(User(
+                username=f'{SYNTHETIC_PREFIX}student_{number:06d}',
+                password=self.password,
+                role='STUDENT',
+                first_name=self._choice(FIRST_NAMES),
+                last_name=self._choice(LAST_NAMES),
+                email=f'{SYNTHETIC_PREFIX}student_{number:06d}@ksrct.ac.in',
+                phone=self._phone(),
+                college_name=college,
+                year=YEARS[year_index],
+                semester=year_index * 2 + int(self.rng.integers(1, 3)),
+                academic_year=f'{self.today.year}-{self.today.year + 1}',
+                gender='FEMALE' if college == 'KSRCAS (Women)' else self._choice(['MALE', 'FEMALE']),
+                home_location=TOWNS[town][0],
+                home_latitude=Decimal(f'{lat:.6f}'),
+                home_longitude=Decimal(f'{lng:.6f}')
+            ))
+        User.objects.bulk_create(students, batch_size=self.batch_size)
+        student_ids = list(User.objects.filter(
+            username__startswith=f'{SYNTHETIC_PREFIX}student_'
+        ).order_by('username').values_list('id', flat=True))
+        self.counts['students'] = len(student_ids)
+        return student_ids, student_towns, distances
+
+    def _create_seats(self, bus_towns, student_ids, student_towns):
+        """
+        Seat students on buses from their town, then any town's overflow on
+        the seats still free. Returns the ids of the seated students.
+        """
+        self.log(f'Creating {self.buses * self.seats_per_bus} seats')
+        wants_seat = (self.rng.random(len(student_ids)) >= self.unseated).tolist()
+        by_town = {}
+        for student_id, town, wants in zip(student_ids, student_towns.tolist(), wants_seat):
+            if wants:
+                by_town.setdefault(town, []).append(student_id)
+
+        riders = {}
+        for (bus_id, _, _), town in zip(self.fleet, bus_towns.tolist()):
+            waiting = by_town.get(town, [])
+            riders[bus_id], by_town[town] = waiting[:self.seats_per_bus], waiting[self.seats_per_bus:]
+        overflow = [student_id for waiting in by_town.values() for student_id in waiting]
+        for bus_id, seated in riders.items():
+            free = self.seats_per_bus - len(seated)
+            seated.extend(overflow[:free])
+            overflow = overflow[free:]
+
+        seats = []
+        for bus_id, seated in riders.items():
+            for seat_number in range(1, self.seats_per_bus + 1):
+                student_id = seated[seat_number - 1] if seat_number <= len(seated) else None
+                seats.append(Seat(bus_id=bus_id, seat_number=seat_number, assigned_user_id=student_id, is_available=student_id is None))
+        Seat.objects.bulk_create(seats, batch_size=self.batch_size)
+
+        seated = [student_id for students in riders.values() for student_id in students]
+        self.counts['seats'] = len(seats)
+        self.counts['seated_students'] = len(seated)
+        self.counts['unseated_students'] = len(student_ids) - len(seated)
+        return seated
+
+    # -- history ---------------------------------------------------------
+
+    def _create_attendance(self, seated):
+        """Student and driver attendance for every Monday-Saturday of the last attendance_days days"""
+        days = [
+            self.today - timedelta(days=offset) for offset in range(self.attendance_days, 0, -1)
+            if (self.today - timedelta(days=offset)).weekday() < 6
+        ]
+        self.log(f'Creating attendance for {len(days)} days')
+        driver_ids = [driver_id for _, driver_id, _ in self.fleet]
+        km_driven = [distance_km * 2 for _, _, distance_km in self.fleet]
+        statuses = np.array(['PRESENT', 'LATE', 'ABSENT'])
+        driver_statuses = np.array(['PRESENT', 'HALF_DAY', 'LEAVE'])
+        students = drivers = 0
+        for day in days:
+            with transaction.atomic():
+                picked = statuses[self.rng.choice(3, size=len(seated), p=[0.88, 0.04, 0.08])]
+                students += len(Attendance.objects.bulk_create([
+                    Attendance(user_id=student_id, date=day, status=status, is_approved=True)
+                    for student_id, status in zip(seated, picked.tolist())
+                ], batch_size=self.batch_size))
+                picked = driver_statuses[self.rng.choice(3, size=len(driver_ids), p=[0.95, 0.02, 0.03])]
+                drivers += len(DriverAttendance.objects.bulk_create([
+                    DriverAttendance(
+                        driver_id=driver_id, date=day, status=status,
+                        km_driven=km if status == 'PRESENT' else (km / 2 if status == 'HALF_DAY' else 0)
+                    )
+                    for driver_id, status, km in zip(driver_ids, picked.tolist(), km_driven)
+                ], batch_size=self.batch_size))
+        self.counts['attendance'] = students
+        self.counts['driver_attendance'] = drivers
+
+    def _create_fees(self, seated, distances):
+        """
+        One fee per seated student for each of the last fee_months months.
+        Past months are mostly paid, with some partial and overdue ones; the
+        current month is mostly still pending.
+        """
+        months = []
+        month_start = self.today.replace(day=1)
+        for _ in range(self.fee_months):
+            months.append(month_start)
+            month_start = (month_start - timedelta(days=1)).replace(day=1)
+        self.log(f'Creating fees for {len(months)} months')
+
+        amounts = {student_id: Decimal(calculate_bus_fee_from_distance(distances[student_id])) for student_id in seated}
+        total = 0
+        for month_start in reversed(months):
+            month, year, due_date = current_fee_period(month_start)
+            past_due = due_date < self.today
+            outcome = self.rng.choice(3, size=len(seated), p=[0.85, 0.05, 0.10] if past_due else [0.3, 0.1, 0.6])
+            fees = []
+            for student_id, paid in zip(seated, outcome.tolist()):
+                amount = amounts[student_id]
+                fee = Fee(
+                    user_id=student_id,
+                    amount=amount,
+                    paid_amount=amount if paid == 0 else (amount / 2 if paid == 1 else Decimal('0')),
+                    month=month,
+                    year=year,
+                    due_date=due_date,
+                    distance_km=Decimal(f'{distances[student_id]:.2f}')
+                )
+                if paid < 2:
+                    fee.payment_method = 'ONLINE'
+                    fee.transaction_id = f'SYN-{student_id}-{year}{month_start.month:02d}'
+                    fee.paid_date = min(due_date, self.today) if paid == 0 else None
+                fee.update_payment_status()
+                fees.append(fee)
+            with transaction.atomic():
+                total += len(Fee.objects.bulk_create(fees, batch_size=self.batch_size))
+        self.counts['fees'] = total
+
+    # -- helpers ---------------------------------------------------------
+
+    def _scatter(self, lat, lng, spread_km, count):
+        """count points normally distributed around (lat, lng), spread_km standard deviation"""
+        offsets = self.rng.normal(0, spread_km / _KM_PER_DEGREE, size=(count, 2))
+        offsets[:, 1] /= np.cos(np.radians(lat))
+        return np.column_stack([lat + offsets[:, 0], lng + offsets[:, 1]])
+
+    def _choice(self, values):
+        return values[int(self.rng.integers(0, len(values)))]
+
+    def _phone(self):
+        return f'+91{int(self.rng.integers(7000000000, 9999999999))}'
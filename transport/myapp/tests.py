@@ -1,3 +1,1426 @@
-from django.test import TestCase
+import asyncio
+import itertools
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib.util import find_spec
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, connection
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from transport.channel_layers import channel_layers
+
+from .assignment import BulkAssignmentService, solve_capacitated_assignment
+from .benchmarks import compare, run_benchmarks
+from .consumers import detect_geofence_events
+from .dashboard import dashboard_counts, dashboard_snapshot, recompute_dashboard
+from .distance import calculate_distance, distance_matrix, distances_to_university, path_distances
+from .fee_balances import fee_balance, rebuild_fee_balances
+from .fee_generation import FeeGenerationService, billed_user_ids
+from .fee_reminders import fee_reminders, start_fee_reminder_job
+from .fees import current_fee_period
+from .geofence import MIN_REBUILD_SECONDS, GeofenceEngine
+from .loadtest import LocationLoadTest
+from .location_buffer import LocationBuffer, location_buffer
+from .location_history import LocationHistory, location_history, simplify_path
+from .models import Attendance, Bus, BusLocationPoint, DashboardSnapshot, DriverAttendance, EmergencyAlert, Fee, FeeBalance, FeePayment, Notification, Seat, User
+from .notifications import mark_notifications_seen, unread_notification_count
+from .outbox import MAX_ATTEMPTS, dispatcher, enqueue
+from .profiling import Profiler, build_report, profiler, query_signature
+from .protocol import KIND_BUS, KIND_DRIVER, FrameEncoder, decode_frame
+from .routing import websocket_urlpatterns
+from .services import BusService, FeeService, NotificationService
+from .spatial import bus_index
+from .synthetic import SyntheticDataGenerator
+
+
+class BusSpatialIndexTests(TestCase):
+    """The grid index finds the same nearest bus as a scan over every bus with a free seat"""
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.buses = []
+        for number, (lat, lng) in enumerate(rng.uniform((10.9, 77.4), (11.9, 78.4), size=(25, 2)), 1):
+            self.buses.append(BusService.create_bus_with_seats({
+                'bus_number': number, 'capacity': 3, 'source': f'Town {number}', 'destination': 'University',
+                'source_latitude': Decimal(f'{lat:.6f}'), 'source_longitude': Decimal(f'{lng:.6f}')
+            }))
+        self.points = rng.uniform((10.7, 77.2), (12.1, 78.6), size=(40, 2))
+        bus_index.rebuild()
+
+    def linear_scan(self, lat, lng):
+        candidates = [
+            (calculate_distance(lat, lng, bus.source_latitude, bus.source_longitude), bus.id)
+            for bus in Bus.objects.filter(status='WORKING', seats__is_available=True, seats__seat_number__gt=1).distinct()
+        ]
+        return min(candidates)[::-1] if candidates else None
+
+    def assertAgreesWithScan(self):
+        for lat, lng in self.points:
+            bus_id, distance = bus_index.nearest(lat, lng)
+            expected_id, expected_distance = self.linear_scan(lat, lng)
+            self.assertAlmostEqual(distance, expected_distance, places=6)
+            self.assertEqual(bus_id, expected_id)
+
+    def test_nearest_matches_linear_scan(self):
+        self.assertAgreesWithScan()
+        nearest = bus_index.k_nearest(11.4, 77.9, k=5)
+        self.assertEqual([d for _, d in nearest], sorted(d for _, d in nearest))
+
+    def test_invalidated_buses_are_refreshed_before_the_next_query(self):
+        # Fill the nearest buses of some points; queryset updates skip the signals, so mark them by hand
+        for bus_id in {bus_index.nearest(lat, lng)[0] for lat, lng in self.points[:10]}:
+            Seat.objects.filter(bus_id=bus_id).update(is_available=False)
+            bus_index.invalidate(bus_id)
+        # Saving a bus marks it through its signal
+        moved = self.buses[0]
+        moved.source_latitude, moved.source_longitude = Decimal('13.000000'), Decimal('80.000000')
+        moved.save()
+
+        self.assertAgreesWithScan()
+        self.assertEqual(bus_index.nearest(13.0, 80.0)[0], moved.id)
+
+
+class DistanceMatrixTests(TestCase):
+    """The vectorized Haversine agrees with calculate_distance pair by pair"""
+
+    def test_matrix_matches_calculate_distance(self):
+        rng = np.random.default_rng(2)
+        origins = [tuple(point) for point in rng.uniform((8, 76), (13, 80), size=(30, 2))] + [(None, None), (0, 77.5)]
+        destinations = [tuple(point) for point in rng.uniform((8, 76), (13, 80), size=(7, 2))]
+
+        matrix = distance_matrix(origins, destinations)
+        self.assertEqual(matrix.shape, (32, 7))
+        for i, (lat, lng) in enumerate(origins):
+            for j, (dest_lat, dest_lng) in enumerate(destinations):
+                expected = calculate_distance(lat, lng, dest_lat, dest_lng)
+                if expected is None:
+                    self.assertTrue(np.isnan(matrix[i, j]))
+                else:
+                    self.assertAlmostEqual(matrix[i, j], expected, places=6)
+
+    def test_university_and_path_distances(self):
+        points = [(11.0, 77.5), (11.1, 77.6), (11.3, 77.7)]
+        self.assertAlmostEqual(
+            distances_to_university(points)[2], calculate_distance(11.3, 77.7, 11.3833, 77.8833), places=6
+        )
+        legs = path_distances(points)
+        self.assertEqual(len(legs), 2)
+        self.assertAlmostEqual(legs[1], calculate_distance(11.1, 77.6, 11.3, 77.7), places=6)
+        self.assertEqual(len(distance_matrix([], points)), 0)
+
+
+class BulkAssignmentTests(TestCase):
+    """Bulk assignment seats students at the least total distance without overfilling a bus"""
+
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', role='ADMIN')
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.admin)
+
+    def brute_force(self, costs, capacities):
+        # Most students seated first, then least total cost
+        best = None
+        for choice in itertools.product(range(-1, costs.shape[1]), repeat=costs.shape[0]):
+            if any(choice.count(bus) > capacity for bus, capacity in enumerate(capacities)):
+                continue
+            if any(bus >= 0 and np.isnan(costs[student, bus]) for student, bus in enumerate(choice)):
+                continue
+            key = (choice.count(-1), sum(costs[student, bus] for student, bus in enumerate(choice) if bus >= 0))
+            best = key if best is None or key < best else best
+        return best
+
+    def test_solver_matches_brute_force(self):
+        rng = np.random.default_rng(3)
+        for _ in range(25):
+            costs = rng.uniform(1, 50, size=(5, 3)).round(1)
+            costs[rng.random(costs.shape) < 0.2] = np.nan
+            capacities = list(rng.integers(0, 3, size=3))
+
+            assigned = solve_capacitated_assignment(costs, capacities)
+            for bus, capacity in enumerate(capacities):
+                self.assertLessEqual(assigned.count(bus), capacity)
+            self.assertFalse(any(bus >= 0 and np.isnan(costs[student, bus]) for student, bus in enumerate(assigned)))
+
+            unseated, cost = self.brute_force(costs, capacities)
+            self.assertEqual(assigned.count(-1), unseated)
+            self.assertAlmostEqual(sum(costs[s, b] for s, b in enumerate(assigned) if b >= 0), cost, places=6)
+
+    def test_bus_plan_seats_girls_front_boys_back(self):
+        bus = BusService.create_bus_with_seats({
+            'bus_number': 4, 'capacity': 9, 'source': 'Erode', 'destination': 'University'
+        })
+        genders = ['FEMALE'] * 3 + ['MALE'] * 5 + ['OTHER']
+        students = [
+            User.objects.create(username=f'student{i}', role='STUDENT', gender=gender, home_location='Erode')
+            for i, gender in enumerate(genders)
+        ]
+        User.objects.create(username='elsewhere', role='STUDENT', gender='FEMALE', home_location='Salem')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            _, assignments = BulkAssignmentService.assign_students_to_bus(bus.id)
+
+        # Seats 2-9 are free: 2-5 are the front half, 6-9 the back half
+        seats = {seat.assigned_user_id: seat.seat_number for seat in Seat.objects.filter(bus=bus, assigned_user__isnull=False)}
+        self.assertEqual(len(assignments), 8)
+        self.assertEqual(len(seats), 8)
+        self.assertEqual(sorted(seats[s.id] for s in students[:3]), [2, 3, 4])
+        self.assertEqual(sorted(seats[s.id] for s in students[3:8] if s.id in seats), [6, 7, 8, 9])
+        self.assertEqual(seats[students[8].id], 5)
+        self.assertTrue(Seat.objects.get(bus=bus, seat_number=1).is_available)
+        self.assertEqual([a['section'] for a in assignments if a['seat'] == 5], ['Mixed'])
+        self.assertEqual(Fee.objects.filter(user_id__in=seats).count(), 8)
+
+        # Every passenger seat is taken, seat 1 is never handed out
+        with self.assertRaises(ValueError):
+            BulkAssignmentService.assign_students_to_bus(bus.id)
+
+    def test_fee_billed_concurrently_is_not_notified_again(self):
+        bus = BusService.create_bus_with_seats({
+            'bus_number': 5, 'capacity': 3, 'source': 'Erode', 'destination': 'University'
+        })
+        first, second = [
+            User.objects.create(username=f'student{i}', role='STUDENT', gender='OTHER', home_location='Erode')
+            for i in range(2)
+        ]
+        month, year, due_date = current_fee_period()
+        read_billed = billed_user_ids
+
+        def concurrent_fee_after_check(*args, **kwargs):
+            billed = read_billed(*args, **kwargs)
+            # Another request bills the first student after the check, before the INSERT
+            if not Fee.objects.filter(user=first).exists():
+                Fee.objects.create(user=first, amount=Decimal('15000'), month=month, year=year, due_date=due_date)
+            return billed
+
+        with patch('myapp.fee_generation.billed_user_ids', side_effect=concurrent_fee_after_check):
+            _, assignments = BulkAssignmentService.assign_students_to_bus(bus.id)
+        self.assertEqual(len(assignments), 2)
+        self.assertEqual(Fee.objects.filter(month=month, year=year).count(), 2)
+        fee_notices = Notification.objects.filter(message__startswith='💰 Bus fee assigned')
+        self.assertEqual(list(fee_notices.values_list('user_id', flat=True)), [second.id])
+        self.assertEqual(fee_balance(second).unpaid_count, 1)
+
+    def test_concurrent_conflict_is_a_409(self):
+        with patch.object(BulkAssignmentService, 'assign_unassigned_students', side_effect=IntegrityError('assigned_seat')):
+            response = self.client.post('/api/admin/bulk-auto-assign/', {}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+
+class ChannelLayerSettingsTests(TestCase):
+    """The channel layer built from the environment gets only the config its backend accepts"""
+
+    def round_trip(self, layers):
+        async def send_and_receive():
+            layer = get_channel_layer()
+            channel = await layer.new_channel()
+            await layer.group_add('driver_locations', channel)
+            await layer.group_send('driver_locations', {'type': 'driver_location_broadcast', 'driver_id': 1})
+            message = await asyncio.wait_for(layer.receive(channel), 5)
+            await layer.group_discard('driver_locations', channel)
+            return layer, message
+
+        with override_settings(CHANNEL_LAYERS=layers):
+            layer, message = async_to_sync(send_and_receive)()
+        self.assertEqual(message['driver_id'], 1)
+        return layer
+
+    def test_config_per_backend(self):
+        self.assertEqual(channel_layers({}), {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+
+        environ = {'CHANNEL_REDIS_URLS': 'redis://a:6379/0, redis://b:6379/0', 'CHANNEL_LAYER_CAPACITY': '50'}
+        core = channel_layers(environ)['default']
+        self.assertEqual(core['BACKEND'], 'channels_redis.core.RedisChannelLayer')
+        self.assertEqual(core['CONFIG'], {
+            'hosts': ['redis://a:6379/0', 'redis://b:6379/0'], 'prefix': 'transport',
+            'capacity': 50, 'expiry': 10, 'group_expiry': 86400,
+        })
+        pubsub = channel_layers({**environ, 'CHANNEL_LAYER_BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer'})
+        self.assertEqual(set(pubsub['default']['CONFIG']), {'hosts', 'prefix'})
+        other = channel_layers({**environ, 'CHANNEL_LAYER_BACKEND': 'somewhere.ShardedLayer'})
+        self.assertEqual(set(other['default']['CONFIG']), {'hosts', 'prefix'})
+
+    def test_layer_builds_from_the_settings(self):
+        layers = channel_layers({
+            'CHANNEL_REDIS_URLS': 'redis://unused:6379/0',
+            'CHANNEL_LAYER_BACKEND': 'channels.layers.InMemoryChannelLayer',
+            'CHANNEL_LAYER_CAPACITY': '5',
+        })
+        layer = self.round_trip(layers)
+        self.assertEqual((layer.capacity, layer.expiry), (5, 10))
+
+    @skipUnless(find_spec('channels_redis') and os.environ.get('CHANNEL_LAYER_TEST_URL'),
+                'needs channels_redis and a Redis-protocol server in CHANNEL_LAYER_TEST_URL')
+    def test_redis_layers_against_a_server(self):
+        for backend in ('channels_redis.core.RedisChannelLayer', 'channels_redis.pubsub.RedisPubSubChannelLayer'):
+            with self.subTest(backend=backend):
+                self.round_trip(channel_layers({
+                    'CHANNEL_REDIS_URLS': os.environ['CHANNEL_LAYER_TEST_URL'],
+                    'CHANNEL_REDIS_PREFIX': 'transport-test',
+                    'CHANNEL_LAYER_BACKEND': backend,
+                }))
+
+
+class LocationBufferTests(TestCase):
+    """Buffered positions are written newest-first in bulk and survive a failed write"""
+
+    def setUp(self):
+        self.bus = BusService.create_bus_with_seats({
+            'bus_number': 1, 'capacity': 10, 'source': 'Tiruchengode', 'destination': 'University'
+        })
+        self.driver = User.objects.create(username='driver', role='DRIVER')
+        self.buffer = LocationBuffer()
+
+    def put(self, latitude):
+        # Without a running event loop put_* would write through
+        with patch.object(self.buffer, '_schedule'):
+            self.buffer.put_bus(self.bus.id, f'{latitude},77.9')
+            self.buffer.put_driver(self.driver.id, latitude, 77.9)
+
+    def test_failed_flush_keeps_positions_newest_wins(self):
+        self.put(11.1)
+        with patch.object(User.objects, 'bulk_update', side_effect=DatabaseError('gone away')), \
+                self.assertLogs('myapp.location_buffer', 'WARNING'):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        # The buses were written, the driver position is kept
+        self.assertEqual(self.buffer.pending(), (0, 1))
+        self.assertEqual(Bus.objects.get(id=self.bus.id).current_location, '11.1,77.9')
+
+        def newer_position_then_fail(*args, **kwargs):
+            self.put(11.2)
+            raise DatabaseError('gone away')
+
+        with patch.object(User.objects, 'bulk_update', side_effect=newer_position_then_fail), \
+                self.assertLogs('myapp.location_buffer', 'WARNING'):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.flush(), (1, 1))
+        self.assertEqual(User.objects.get(id=self.driver.id).current_latitude, Decimal('11.200000'))
+
+
+    def test_failed_history_write_keeps_points(self):
+        location_history.flush()
+        self.put(11.1)
+        with patch.object(BusLocationPoint.objects, 'bulk_create', side_effect=DatabaseError('gone away')), \
+                self.assertLogs('myapp.location_history', 'WARNING'):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.assertEqual(location_history.pending(), 1)
+        self.assertEqual(BusLocationPoint.objects.count(), 0)
+
+        # A driver without a bus adds no history, with one their points count for the bus
+        self.bus.driver = self.driver
+        self.bus.save()
+        self.put(11.2)
+        self.buffer.flush()
+        self.assertEqual(location_history.pending(), 0)
+        self.assertEqual(
+            list(BusLocationPoint.objects.order_by('recorded_at').values_list('latitude', flat=True)), [11.1, 11.2, 11.2]
+        )
+
+    def test_last_socket_to_close_flushes(self):
+        self.buffer.socket_opened()
+        self.buffer.socket_opened()
+        self.put(11.3)
+        async_to_sync(self.buffer.socket_closed)()
+        self.assertEqual(self.buffer.pending(), (1, 1))
+        async_to_sync(self.buffer.socket_closed)()
+        self.assertEqual(self.buffer.pending(), (0, 0))
+        self.assertEqual(Bus.objects.get(id=self.bus.id).current_location, '11.3,77.9')
+
+    def test_exit_flush(self):
+        self.put(11.4)
+        with patch.object(self.buffer, 'flush', side_effect=DatabaseError('gone away')), \
+                self.assertLogs('myapp.location_buffer', 'ERROR'):
+            self.buffer.flush_at_exit()
+        self.buffer.flush_at_exit()
+        self.assertEqual(self.buffer.pending(), (0, 0))
+
+
+class LocationHistoryTests(TestCase):
+    """Trip replay joins written and buffered points in time order and simplifies the trail"""
+
+    def setUp(self):
+        self.driver = User.objects.create(username='driver', role='DRIVER')
+        self.bus = BusService.create_bus_with_seats({
+            'bus_number': 3, 'capacity': 5, 'source': 'Erode', 'destination': 'University', 'driver': self.driver
+        })
+        self.history = LocationHistory(ring_size=5)
+        self.start = timezone.now() - timedelta(minutes=30)
+
+    def at(self, seconds):
+        return self.start + timedelta(seconds=seconds)
+
+    def test_simplify_path(self):
+        # A straight road with sub-metre jitter keeps only its ends
+        line = np.column_stack([np.linspace(11.0, 11.01, 50), 77.0 + np.tile([0, 0.000005], 25)])
+        self.assertEqual(simplify_path(line, tolerance_m=10).tolist(), [0, 49])
+        # An L-shaped trip keeps its corner
+        corner = np.vstack([line, np.column_stack([np.full(20, 11.01), np.linspace(77.001, 77.02, 20)])])
+        self.assertEqual(simplify_path(corner, tolerance_m=10).tolist(), [0, 49, 69])
+        # A zigzag is capped at max_points, the ends always stay
+        zigzag = np.column_stack([np.linspace(11.0, 11.1, 101), 77.0 + np.tile([0, 0.01], 51)[:101]])
+        kept = simplify_path(zigzag, tolerance_m=1, max_points=10)
+        self.assertEqual(len(kept), 10)
+        self.assertEqual((kept[0], kept[-1]), (0, 100))
+        self.assertEqual(simplify_path(line[:2]).tolist(), [0, 1])
+
+    def test_ring_is_bounded_and_in_time_order(self):
+        for second in range(0, 80, 10):
+            self.history.record(self.bus.id, 11.0, 77.0 + second / 1000, timestamp=self.at(second))
+        self.assertEqual([p[0] for p in self.history.recent(self.bus.id)], [self.at(s) for s in range(30, 80, 10)])
+
+        # Driver points reach the ring at flush time, after newer bus points
+        self.history.record_driver(self.driver.id, 11.0, 77.0, timestamp=self.at(45))
+        self.history.record_driver(self.driver.id, 11.0, 77.0, timestamp=self.at(5))
+        self.assertEqual(self.history.flush(), 10)
+        self.assertEqual([p[0] for p in self.history.recent(self.bus.id)], [self.at(s) for s in (40, 45, 50, 60, 70)])
+
+    def test_trip_joins_written_and_buffered_points(self):
+        for second in (0, 10, 20):
+            self.history.record(self.bus.id, 11.0 + second / 1000, 77.0, timestamp=self.at(second))
+        self.history.flush()
+        self.history.record(self.bus.id, 11.04, 77.0, timestamp=self.at(40))
+        self.history.record_driver(self.driver.id, 11.03, 77.0, timestamp=self.at(30))
+        self.history.record(self.bus.id, 11.05, 77.0, timestamp=self.at(50))
+
+        timestamps, lat_lng = self.history.trip(self.bus.id, self.at(-60), self.at(45))
+        self.assertEqual(timestamps, [self.at(s) for s in (0, 10, 20, 40)])
+        self.history.flush()
+        timestamps, lat_lng = self.history.trip(self.bus.id, self.at(-60), self.at(60))
+        self.assertEqual(timestamps, [self.at(s) for s in range(0, 60, 10)])
+        self.assertTrue((np.diff(lat_lng[:, 0]) > 0).all())
+
+    def test_trip_endpoint(self):
+        for second in range(0, 600, 5):
+            self.history.record(self.bus.id, 11.0 + second / 100000, 77.0, timestamp=self.at(second))
+        self.history.flush()
+        admin = User.objects.create(username='admin', role='ADMIN')
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(admin)
+
+        with patch('myapp.views.location_history', self.history):
+            response = client.get(f'/api/buses/{self.bus.id}/trip/', {
+                'start': self.at(0).isoformat(), 'end': self.at(600).isoformat(), 'max_points': 50
+            })
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['total_points'], 120)
+            # A straight trail comes back as its two ends
+            self.assertEqual(response.data['returned_points'], 2)
+            self.assertAlmostEqual(response.data['distance_km'], calculate_distance(11.0, 77.0, 11.00595, 77.0), places=2)
+
+            response = client.get(f'/api/buses/{self.bus.id}/trip/', {'start': self.at(600).isoformat(), 'end': self.at(0).isoformat()})
+            self.assertEqual(response.status_code, 400)
+
+
+class FrameProtocolTests(TestCase):
+    """Binary location frames decode back to the positions that were encoded"""
+
+    def test_absolute_and_delta_records_round_trip(self):
+        encoder = FrameEncoder(KIND_BUS)
+        received = {}
+        ticks = [
+            [(1, 11.341036, 77.717163), (2, 11.0, 77.5)],
+            # Small moves become deltas, a jump past int16 microdegrees is absolute again
+            [(1, 11.341136, 77.717063), (2, 11.5, 77.5), (3, -12.25, -45.125)],
+            [(1, 11.341136, 77.717063), (2, 11.50001, 77.49999)],
+        ]
+        for sequence, updates in enumerate(ticks, start=1):
+            frames = encoder.encode(updates)
+            self.assertEqual(len(frames), 1)
+            kind, decoded_sequence, decoded = decode_frame(frames[0], received)
+            self.assertEqual((kind, decoded_sequence), (KIND_BUS, sequence))
+            self.assertEqual(len(decoded), len(updates))
+            for (object_id, lat, lng), (decoded_id, decoded_lat, decoded_lng) in zip(updates, decoded):
+                self.assertEqual(decoded_id, object_id)
+                self.assertAlmostEqual(decoded_lat, lat, places=6)
+                self.assertAlmostEqual(decoded_lng, lng, places=6)
+
+        # Header 8 bytes, absolute records 13 bytes, delta records 9 bytes
+        self.assertEqual(len(encoder.encode([(1, 11.341236, 77.717063)])[0]), 8 + 9)
+        self.assertEqual(len(encoder.encode([(4, 11.0, 77.0)])[0]), 8 + 13)
+
+    def test_large_batches_split_across_frames(self):
+        updates = [(i, 11.0, 77.0) for i in range(70000)]
+        frames = FrameEncoder(KIND_DRIVER).encode(updates)
+        self.assertEqual(len(frames), 2)
+        decoded = []
+        for frame in frames:
+            decoded += decode_frame(frame)[2]
+        self.assertEqual([object_id for object_id, _, _ in decoded], list(range(70000)))
+
+
+class DriverSubscriptionTests(TestCase):
+    """Live-map sockets only receive the drivers inside their viewport or on their buses"""
+
+    def setUp(self):
+        self.driver = User.objects.create(username='driver', role='DRIVER')
+        self.other_driver = User.objects.create(username='other', role='DRIVER')
+        self.bus = BusService.create_bus_with_seats({
+            'bus_number': 1, 'capacity': 5, 'source': 'Erode', 'destination': 'University', 'driver': self.driver
+        })
+        self.other_bus = BusService.create_bus_with_seats({
+            'bus_number': 2, 'capacity': 5, 'source': 'Salem', 'destination': 'University', 'driver': self.other_driver
+        })
+
+    def run_sockets(self, scenario):
+        async def run():
+            application = URLRouter(websocket_urlpatterns)
+            sockets = []
+
+            async def connect():
+                communicator = WebsocketCommunicator(application, '/ws/drivers/location/')
+                connected, _ = await communicator.connect()
+                self.assertTrue(connected)
+                sockets.append(communicator)
+                return communicator
+
+            try:
+                await scenario(connect)
+            finally:
+                for communicator in sockets:
+                    await communicator.disconnect()
+                task, location_buffer._flush_task = location_buffer._flush_task, None
+                if task is not None:
+                    task.cancel()
+
+        async_to_sync(run)()
+
+    @staticmethod
+    async def move(sender, driver, lat, lng):
+        await sender.send_json_to({'type': 'update_location', 'driver_id': driver.id, 'latitude': lat, 'longitude': lng})
+
+    def test_viewport_receives_only_updates_inside_it(self):
+        async def scenario(connect):
+            sender, viewer, fleet = await connect(), await connect(), await connect()
+            await viewer.send_json_to({'type': 'subscribe', 'bbox': [11.0, 77.0, 11.25, 77.25]})
+            await viewer.receive_nothing(0.1)
+
+            await self.move(sender, self.driver, 11.1, 77.1)
+            update = await viewer.receive_json_from(1)
+            self.assertEqual((update['type'], update['driver_id']), ('driver_location_broadcast', self.driver.id))
+            # Far away, then in a cell the viewport covers but outside the box
+            await self.move(sender, self.other_driver, 13.0, 80.0)
+            await self.move(sender, self.other_driver, 11.28, 77.1)
+            await viewer.receive_nothing(0.1)
+
+            # Driving off screen drops the marker
+            await self.move(sender, self.driver, 12.0, 77.1)
+            self.assertEqual(await viewer.receive_json_from(1), {'type': 'driver_location_left', 'driver_id': self.driver.id})
+            await viewer.receive_nothing(0.1)
+
+            # Without a subscription a socket gets the whole fleet
+            self.assertEqual(
+                [(await fleet.receive_json_from(1))['latitude'] for _ in range(4)], [11.1, 13.0, 11.28, 12.0]
+            )
+
+        self.run_sockets(scenario)
+
+    def test_bus_subscription_and_resubscribe(self):
+        async def scenario(connect):
+            sender, viewer = await connect(), await connect()
+            await viewer.send_json_to({'type': 'subscribe', 'bus_ids': [self.bus.id]})
+            await viewer.receive_nothing(0.1)
+
+            await self.move(sender, self.driver, 13.0, 80.0)
+            await self.move(sender, self.other_driver, 13.0, 80.0)
+            self.assertEqual((await viewer.receive_json_from(1))['driver_id'], self.driver.id)
+            await viewer.receive_nothing(0.1)
+
+            # Switching to a viewport leaves the bus groups; the last known position in it comes first
+            await viewer.send_json_to({'type': 'subscribe', 'bbox': [11.0, 77.0, 11.25, 77.25]})
+            await viewer.receive_nothing(0.1)
+            await self.move(sender, self.driver, 13.1, 80.0)
+            await viewer.receive_nothing(0.1)
+
+            await viewer.send_json_to({'type': 'subscribe', 'bbox': [11.0, 77.0, 11.25]})
+            self.assertEqual((await viewer.receive_json_from(1))['type'], 'error')
+
+        self.run_sockets(scenario)
+
+    def test_reassigned_driver_publishes_to_the_new_bus(self):
+        async def scenario(connect):
+            sender, viewer = await connect(), await connect()
+            await viewer.send_json_to({'type': 'subscribe', 'bus_ids': [self.other_bus.id]})
+            await viewer.receive_nothing(0.1)
+            await self.move(sender, self.driver, 13.0, 80.0)
+            await viewer.receive_nothing(0.1)
+
+            await database_sync_to_async(BusService.assign_driver_to_bus)(self.other_bus.id, self.driver.id)
+            with patch('myapp.consumers.DRIVER_BUS_TTL_SECONDS', 0):
+                await self.move(sender, self.driver, 13.0, 80.1)
+                self.assertEqual((await viewer.receive_json_from(1))['driver_id'], self.driver.id)
+
+        self.run_sockets(scenario)
+
+
+class GeofenceTests(TestCase):
+    """Positions turn into approach, arrival and departure events, each once per visit"""
+
+    def setUp(self):
+        self.bus = BusService.create_bus_with_seats({
+            'bus_number': 7, 'capacity': 5, 'source': 'Erode', 'destination': 'University',
+            'source_latitude': Decimal('11.000000'), 'source_longitude': Decimal('77.000000'),
+        })
+        self.student = User.objects.create(
+            username='student', role='STUDENT', home_latitude=Decimal('11.200000'), home_longitude=Decimal('77.300000')
+        )
+        Seat.objects.filter(bus=self.bus, seat_number=2).update(assigned_user=self.student, is_available=False)
+        self.engine = GeofenceEngine()
+        self.engine.rebuild()
+
+    def drive(self, fence_id, lat, lng, offsets):
+        # Positions north of a point, offsets in degrees of latitude (~111 m per 0.001)
+        return [
+            [event['event'] for event in self.engine.process(self.bus.id, lat + offset, lng) if event['fence_id'] == fence_id]
+            for offset in offsets
+        ]
+
+    def test_pickup_visit_fires_each_event_once(self):
+        fence_id = f'pickup:{self.student.id}'
+        # ~800 m, 45 m, 100 m, 245 m (still inside the departure radius), 500 m, 2.2 km
+        self.assertEqual(
+            self.drive(fence_id, 11.2, 77.3, [0.0072, 0.0004, 0.0009, 0.0022, 0.0045, 0.02]),
+            [['approaching'], ['arrived'], [], [], ['departed'], []]
+        )
+        # Coming back is a new visit
+        self.assertEqual(self.drive(fence_id, 11.2, 77.3, [0.0072, 0.0072]), [['approaching'], []])
+
+    def test_leaving_the_approach_radius_while_arrived_departs(self):
+        self.assertEqual(self.drive(f'source:{self.bus.id}', 11.0, 77.0, [0.0, 0.0, 0.02]), [['arrived'], [], ['departed']])
+
+    def test_events_notify_the_right_students(self):
+        events = self.engine.process(self.bus.id, 11.2072, 77.3)
+        self.assertEqual(self.engine.notify(events), 1)
+        self.assertIn('approaching your pickup point', Notification.objects.get(user=self.student).message)
+
+    def test_seat_changes_reload_only_their_bus(self):
+        other = BusService.create_bus_with_seats({
+            'bus_number': 8, 'capacity': 5, 'source': 'Salem', 'destination': 'University',
+            'source_latitude': Decimal('11.600000'), 'source_longitude': Decimal('78.100000'),
+        })
+        self.engine.invalidate()
+        self.engine.rebuild()
+        other_fence = self.engine._fences[f'source:{other.id}']
+        loads = []
+        load = self.engine._load
+        self.engine._load = lambda bus_ids=None: (loads.append(bus_ids), load(bus_ids))
+
+        with patch('myapp.signals.geofences', self.engine):
+            # Saving a seat with the passenger the fences know changes nothing
+            Seat.objects.get(bus=self.bus, seat_number=2).save()
+            self.assertFalse(self.engine.needs_rebuild())
+
+            newcomer = User.objects.create(
+                username='newcomer', role='STUDENT', home_latitude=Decimal('11.250000'), home_longitude=Decimal('77.350000')
+            )
+            seat = Seat.objects.get(bus=self.bus, seat_number=3)
+            seat.assigned_user = newcomer
+            seat.is_available = False
+            seat.save()
+        self.engine._refreshed_at -= MIN_REBUILD_SECONDS + 1
+        self.assertTrue(self.engine.claim_rebuild())
+        self.engine.rebuild()
+
+        self.assertEqual(loads, [{self.bus.id}])
+        self.assertIn(f'pickup:{newcomer.id}', self.engine._fences)
+        self.assertIn(f'pickup:{self.student.id}', self.engine._fences)
+        self.assertIs(self.engine._fences[f'source:{other.id}'], other_fence)
+        self.assertEqual(sorted(self.engine._buses[self.bus.id][1]), [self.student.id, newcomer.id])
+        self.assertEqual(
+            [e['event'] for e in self.engine.process(self.bus.id, 11.2502, 77.35) if e['fence'] == 'pickup'], ['arrived']
+        )
+
+        # A student moving home only reloads the bus they ride
+        with patch('myapp.signals.geofences', self.engine):
+            newcomer.home_latitude = Decimal('11.260000')
+            newcomer.save()
+            User.objects.create(username='unseated', role='STUDENT', home_latitude=Decimal('11.0'), home_longitude=Decimal('77.0'))
+        self.assertEqual(self.engine._dirty_buses, {self.bus.id})
+        self.assertFalse(self.engine._stale)
+
+    def test_concurrent_positions_share_one_rebuild(self):
+        engine = GeofenceEngine()
+        loads = []
+        engine._load = lambda bus_ids=None: (time.sleep(0.05), loads.append(1))
+
+        async def positions():
+            await asyncio.gather(*[detect_geofence_events(None, 1, 11.0, 77.0) for _ in range(5)])
+
+        with patch('myapp.consumers.geofences', engine):
+            async_to_sync(positions)()
+        self.assertEqual(len(loads), 1)
+        self.assertFalse(engine._rebuilding)
+
+
+@override_settings(NOTIFICATION_DISPATCH_MODE='command')
+class OutboxDispatchTests(TestCase):
+    """Outbox entries are claimed with SKIP LOCKED and expanded into notifications exactly once"""
+
+    def setUp(self):
+        self.students = [User.objects.create(username=f'student{i}', role='STUDENT') for i in range(3)]
+        User.objects.create(username='driver', role='DRIVER')
+
+    def test_entry_is_dispatched_once(self):
+        entry = enqueue('ROLE', 'Holiday tomorrow', role='STUDENT')
+        self.assertEqual(dispatcher.dispatch_pending(), 1)
+        self.assertEqual(dispatcher.dispatch_pending(), 0)
+
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.recipients), ('DISPATCHED', 3))
+        self.assertEqual(
+            sorted(Notification.objects.filter(message='Holiday tomorrow').values_list('user_id', flat=True)),
+            [student.id for student in self.students]
+        )
+
+    def test_entries_are_claimed_skipping_locked_rows(self):
+        enqueue('USERS', 'Fee reminder', user_ids=[self.students[0].id])
+        with patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=QuerySet.select_for_update) as claim:
+            dispatcher.dispatch_pending()
+        self.assertTrue(claim.called)
+        self.assertTrue(all(call.kwargs.get('skip_locked') for call in claim.call_args_list))
+
+    def test_failed_entry_is_retried_then_given_up(self):
+        entry = enqueue('USERS', 'Fee reminder', user_ids=[self.students[0].id])
+        with patch('myapp.outbox.recipient_ids', side_effect=DatabaseError('gone away')), \
+                self.assertLogs('myapp.outbox', 'ERROR'):
+            # One attempt per pass, not a retry loop
+            self.assertEqual(dispatcher.dispatch_pending(), 1)
+            entry.refresh_from_db()
+            self.assertEqual((entry.status, entry.attempts), ('PENDING', 1))
+            for _ in range(MAX_ATTEMPTS - 1):
+                dispatcher.dispatch_pending()
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts), ('FAILED', MAX_ATTEMPTS))
+        self.assertEqual(dispatcher.dispatch_pending(), 0)
+        self.assertFalse(Notification.objects.filter(message='Fee reminder').exists())
+
+
+class UnreadCounterTests(TestCase):
+    """The unread counter follows every way a notification is created, updated, seen or deleted"""
+
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', role='ADMIN')
+        self.student = User.objects.create(username='student', role='STUDENT')
+        self.other = User.objects.create(username='other', role='STUDENT')
+        for i in range(3):
+            NotificationService.send_bulk_notifications([self.student.id], f'Notice {i}', self.admin)
+        self.notifications = list(Notification.objects.filter(user=self.student).order_by('id'))
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.student)
+
+    def assertUnread(self, expected):
+        for user in (self.student, self.other):
+            self.assertEqual(
+                unread_notification_count(user.id), Notification.objects.filter(user=user, is_seen=False).count()
+            )
+        self.assertEqual(self.client.get('/api/notifications/unread_count/').data['unread'], expected)
+
+    def test_update_moves_the_counter_only_on_change(self):
+        self.assertUnread(3)
+        url = f'/api/notifications/{self.notifications[0].id}/'
+        self.client.patch(url, {'is_seen': True}, format='json')
+        self.assertUnread(2)
+        self.client.patch(url, {'is_seen': True}, format='json')
+        self.assertUnread(2)
+        self.client.patch(url, {'is_seen': False}, format='json')
+        self.assertUnread(3)
+
+        # Reassigning an unread notification moves it to the other user's count
+        self.client.patch(url, {'user': self.other.id}, format='json')
+        self.assertUnread(2)
+        self.assertEqual(unread_notification_count(self.other.id), 1)
+
+    def test_seen_and_delete(self):
+        first, second, third = self.notifications
+        self.client.patch(f'/api/notifications/{first.id}/mark_seen/')
+        self.client.patch(f'/api/notifications/{first.id}/mark_seen/')
+        self.assertUnread(2)
+
+        # Deleting a seen notification leaves the count alone, an unseen one lowers it
+        self.client.delete(f'/api/notifications/{first.id}/')
+        self.assertUnread(2)
+        self.client.delete(f'/api/notifications/{second.id}/')
+        self.assertUnread(1)
+
+        self.client.post('/api/notifications/mark_all_seen/')
+        self.assertUnread(0)
+        self.assertEqual(mark_notifications_seen(self.student.id, [third.id]), 0)
+        self.assertUnread(0)
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages walk forwards and backwards without skipping or repeating rows that share created_at"""
+
+    def setUp(self):
+        self.student = User.objects.create(username='student', role='STUDENT')
+        for _ in range(7):
+            NotificationService.send_bulk_notifications([self.student.id], 'Notice', None)
+        ids = list(Notification.objects.order_by('id').values_list('id', flat=True))
+        now = timezone.now().replace(microsecond=0)
+        # Three rows share one timestamp, and the ids do not follow the timestamps
+        for notification_id, hours in zip(ids, [0, 0, 1, 0, -1, 1, -1]):
+            Notification.objects.filter(id=notification_id).update(created_at=now + timedelta(hours=hours))
+        self.expected = list(Notification.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.student)
+
+    def walk(self, url, direction):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row['id'] for row in response.data['results']])
+            url = response.data[direction]
+        return pages, response.data
+
+    def test_forward_then_backward(self):
+        forward, last = self.walk('/api/notifications/?page_size=2', 'next')
+        self.assertEqual([row for page in forward for row in page], self.expected)
+        self.assertEqual([len(page) for page in forward], [2, 2, 2, 1])
+
+        backward, first = self.walk(last['previous'], 'previous')
+        self.assertEqual(backward, forward[-2::-1])
+        self.assertIsNone(first['previous'])
+        self.assertIsNotNone(first['next'])
+
+    def test_rows_inserted_meanwhile_do_not_shift_pages(self):
+        first = self.client.get('/api/notifications/?page_size=3').data
+        NotificationService.send_bulk_notifications([self.student.id], 'Newest', None)
+        second = self.client.get(first['next']).data
+        self.assertEqual([row['id'] for row in second['results']], self.expected[3:6])
+
+    def test_bad_cursor_is_a_404(self):
+        self.assertEqual(self.client.get('/api/notifications/?cursor=not-a-cursor').status_code, 404)
+
+    def test_filtered_pages_keep_the_filter(self):
+        admin = User.objects.create(username='admin', role='ADMIN')
+        driver = User.objects.create(username='driver', role='DRIVER')
+        bus = BusService.create_bus_with_seats({'bus_number': 91, 'source': 'A', 'destination': 'B', 'capacity': 4})
+        for alert_status in ['ACTIVE', 'RESOLVED', 'ACTIVE', 'RESOLVED', 'ACTIVE']:
+            EmergencyAlert.objects.create(driver=driver, bus=bus, message='Stuck', status=alert_status)
+        self.client.force_authenticate(admin)
+
+        pages, _ = self.walk('/api/emergency-alerts/?status=ACTIVE&page_size=2', 'next')
+        active = [row for page in pages for row in page]
+        self.assertEqual(
+            active,
+            list(EmergencyAlert.objects.filter(status='ACTIVE').order_by('-created_at', '-id').values_list('id', flat=True)),
+        )
+
+
+class GetAllStudentsQueryCountTests(TestCase):
+    """get_all_students must cost the same number of queries for any number of students"""
+
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', role='ADMIN')
+        self.bus = BusService.create_bus_with_seats({
+            'bus_number': 1, 'capacity': 60, 'source': 'Tiruchengode', 'destination': 'University'
+        })
+        self.seats = list(Seat.objects.filter(bus=self.bus).order_by('seat_number')[1:])
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.admin)
+
+    def add_students(self, count):
+        for _ in range(count):
+            number = User.objects.filter(role='STUDENT').count()
+            student = User.objects.create(username=f'student{number}', role='STUDENT')
+            seat = self.seats[number]
+            seat.assigned_user = student
+            seat.is_available = False
+            seat.save()
+            Fee.objects.create(
+                user=student, amount=Decimal('15000'), paid_amount=Decimal('5000'),
+                month='January 2026', year=2026, due_date=date(2026, 1, 10)
+            )
+            Fee.objects.create(
+                user=student, amount=Decimal('15000'), paid_amount=Decimal('15000'),
+                month='February 2026', year=2026, due_date=date(2026, 2, 10)
+            )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/admin/students/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data
+
+    def test_query_count_does_not_grow_with_students(self):
+        self.add_students(2)
+        few, _ = self.count_queries()
+        self.add_students(30)
+        many, data = self.count_queries()
+
+        self.assertEqual(few, many)
+        self.assertEqual(len(data['students']), 32)
+
+    def test_total_counts_every_student(self):
+        self.add_students(12)
+        response = self.client.get('/api/admin/students/?page_size=5')
+        self.assertEqual(len(response.data['students']), 5)
+        self.assertEqual(response.data['total'], 12)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_fee_summary_and_seat(self):
+        self.add_students(1)
+        _, data = self.count_queries()
+        student = data['students'][0]
+
+        self.assertTrue(student['has_seat'])
+        self.assertEqual(student['seat_details']['bus_number'], 1)
+        self.assertTrue(student['has_unpaid_fees'])
+        self.assertEqual(len(student['unpaid_fees']), 1)
+        self.assertEqual(Decimal(student['fee_summary']['total_amount']), Decimal('15000'))
+        self.assertEqual(Decimal(student['fee_summary']['paid_amount']), Decimal('5000'))
+        self.assertEqual(Decimal(student['fee_summary']['pending_amount']), Decimal('10000'))
+
+    def test_fee_summary_is_summed_from_fees(self):
+        self.add_students(1)
+        FeeBalance.objects.all().delete()
+        _, data = self.count_queries()
+        student = data['students'][0]
+
+        self.assertTrue(student['has_unpaid_fees'])
+        self.assertEqual(Decimal(student['fee_summary']['pending_amount']), Decimal('10000'))
+
+
+@override_settings(BACKGROUND_JOB_MODE='command')
+class FeeReminderJobTests(TestCase):
+    """A fee reminder job that stops mid-way resumes after its last chunk, reminding every student once"""
+
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', role='ADMIN')
+        self.students = [User.objects.create(username=f'student{i}', role='STUDENT') for i in range(5)]
+        for student in self.students:
+            Fee.objects.create(
+                user=student, amount=Decimal('15000'), month='January 2026', year=2026, due_date=date(2026, 1, 10)
+            )
+        paid = User.objects.create(username='paid', role='STUDENT')
+        Fee.objects.create(
+            user=paid, amount=Decimal('15000'), paid_amount=Decimal('15000'),
+            month='January 2026', year=2026, due_date=date(2026, 1, 10)
+        )
+
+    @patch('myapp.fee_reminders.REMINDER_CHUNK_SIZE', 2)
+    def test_failed_job_resumes_from_checkpoint(self):
+        job = start_fee_reminder_job(self.admin)
+        self.assertEqual(job.total, 5)
+
+        # The second chunk fails after its notifications were written
+        with patch('myapp.fee_reminders.notifications_created', side_effect=[None, DatabaseError('gone away')]), \
+                self.assertLogs('myapp.fee_reminders', 'ERROR'):
+            fee_reminders.run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.sent_count, job.last_student_id), ('FAILED', 2, self.students[1].id))
+        self.assertEqual(Notification.objects.count(), 2)
+
+        call_command('run_background_jobs', resume=job.id, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.sent_count), ('COMPLETED', 5))
+        self.assertEqual(
+            sorted(Notification.objects.values_list('user_id', flat=True)), [student.id for student in self.students]
+        )
+        self.assertEqual(
+            set(Fee.objects.filter(user__in=self.students).values_list('reminder_sent_count', flat=True)), {1}
+        )
+
+    def test_interrupted_job_is_picked_up_where_it_stopped(self):
+        job = start_fee_reminder_job(self.admin)
+        with patch('myapp.fee_reminders.REMINDER_CHUNK_SIZE', 3):
+            # A worker that died after one chunk leaves the job RUNNING
+            self.assertTrue(fee_reminders.run_chunk(job.id))
+            self.assertEqual(fee_reminders.run_pending(), [job.id])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.sent_count), ('COMPLETED', 5))
+        self.assertEqual(Notification.objects.count(), 5)
+
+
+class OverdueFeeSweepTests(TestCase):
+    """The overdue sweep leaves every fee with the status Fee.update_payment_status would give it"""
+
+    def test_sweep_matches_update_payment_status_and_is_idempotent(self):
+        student = User.objects.create(username='student', role='STUDENT')
+        today = date.today()
+        fees = []
+        for i, (due_days, paid) in enumerate([
+            (-30, '0'), (10, '0'), (-5, '5000'), (-1, '15000'), (-3, '0'), (20, '0'), (0, '0'), (-60, '0'),
+        ]):
+            fees.append(Fee.objects.create(
+                user=student, amount=Decimal('15000'), paid_amount=Decimal(paid),
+                month=f'Month {i}', year=2026, due_date=today + timedelta(days=due_days)
+            ))
+        # Due dates moved behind save()'s back leave stale statuses both ways
+        Fee.objects.filter(id__in=[fees[1].id, fees[5].id]).update(due_date=today - timedelta(days=2))
+        Fee.objects.filter(id__in=[fees[0].id, fees[4].id]).update(due_date=today + timedelta(days=2))
+        balance = FeeBalance.objects.get(user=student)
+
+        self.assertEqual(FeeService.sweep_overdue_fees(chunk_size=3), {'overdue': 2, 'pending': 2})
+        for fee in Fee.objects.filter(user=student):
+            status = fee.payment_status
+            fee.update_payment_status()
+            self.assertEqual(status, fee.payment_status, fee.month)
+
+        self.assertEqual(FeeService.sweep_overdue_fees(chunk_size=3), {'overdue': 0, 'pending': 0})
+        refreshed = FeeBalance.objects.get(user=student)
+        self.assertEqual(
+            (refreshed.unpaid_count, refreshed.pending_amount), (balance.unpaid_count, balance.pending_amount)
+        )
+
+
+class FeeBalanceTests(TestCase):
+    """The fee_balances table must always match the student's unpaid fees"""
+
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', role='ADMIN')
+        self.student = User.objects.create(username='student', role='STUDENT')
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.admin)
+
+    def add_fee(self, month, amount='15000', paid='0', due=date(2026, 1, 10)):
+        return Fee.objects.create(
+            user=self.student, amount=Decimal(amount), paid_amount=Decimal(paid),
+            month=month, year=2026, due_date=due
+        )
+
+    def balance(self):
+        return FeeBalance.objects.get(user=self.student)
+
+    def test_follows_saves_payments_and_deletes(self):
+        january = self.add_fee('January 2026')
+        self.add_fee('February 2026', amount='30000', paid='10000', due=date(2026, 2, 10))
+        balance = self.balance()
+        self.assertEqual(balance.unpaid_count, 2)
+        self.assertEqual(balance.total_amount, Decimal('45000'))
+        self.assertEqual(balance.paid_amount, Decimal('10000'))
+        self.assertEqual(balance.pending_amount, Decimal('35000'))
+        self.assertEqual(balance.oldest_due_date, date(2026, 1, 10))
+
+        response = self.client.post('/api/admin/record-partial-payment/', {
+            'fee_id': january.id, 'payment_amount': '15000'
+        })
+        self.assertEqual(response.status_code, 200)
+        balance = self.balance()
+        self.assertEqual(balance.unpaid_count, 1)
+        self.assertEqual(balance.pending_amount, Decimal('20000'))
+        self.assertEqual(balance.oldest_due_date, date(2026, 2, 10))
+
+        Fee.objects.filter(user=self.student, month='February 2026').delete()
+        balance = self.balance()
+        self.assertFalse(balance.has_unpaid_fees)
+        self.assertEqual(balance.pending_amount, 0)
+        self.assertIsNone(balance.oldest_due_date)
+
+    def test_follows_fees_without_upsert_target(self):
+        # MySQL's feature set: ON DUPLICATE KEY UPDATE cannot name the conflicting fields
+        with patch.object(connection.features, 'supports_update_conflicts_with_target', False):
+            fee = self.add_fee('January 2026')
+            fee.paid_amount = Decimal('5000')
+            fee.save()
+        balance = self.balance()
+        self.assertEqual(balance.unpaid_count, 1)
+        self.assertEqual(balance.pending_amount, Decimal('10000'))
+
+    def test_missing_balance_reads_as_zero(self):
+        balance = fee_balance(self.student)
+        self.assertFalse(balance.has_unpaid_fees)
+        self.assertEqual(balance.pending_amount, 0)
+
+    def test_rebuild_fixes_drift(self):
+        self.add_fee('January 2026')
+        FeeBalance.objects.filter(user=self.student).update(unpaid_count=0, pending_amount=0)
+        Fee.objects.bulk_create([Fee(
+            user=self.student, amount=Decimal('15000'), pending_amount=Decimal('15000'),
+            month='February 2026', year=2026, due_date=date(2026, 2, 10)
+        )])
+
+        counts = rebuild_fee_balances()
+        self.assertEqual(counts['fixed'], 1)
+        balance = self.balance()
+        self.assertEqual(balance.unpaid_count, 2)
+        self.assertEqual(balance.pending_amount, Decimal('30000'))
+        self.assertEqual(rebuild_fee_balances()['fixed'], 0)
+
+
+class FeeGenerationTests(TestCase):
+    """Bulk fee generation bills each seated student once, priced by distance"""
+
+    def setUp(self):
+        bus = BusService.create_bus_with_seats({
+            'bus_number': 1, 'capacity': 10, 'source': 'Tiruchengode', 'destination': 'University'
+        })
+        homes = [(Decimal('11.383300'), Decimal('77.883300')), (Decimal('11.700000'), Decimal('77.883300')), (None, None)]
+        self.students = []
+        for index, (seat, (latitude, longitude)) in enumerate(zip(Seat.objects.filter(bus=bus).order_by('seat_number'), homes)):
+            student = User.objects.create(
+                username=f'student{index}', role='STUDENT', semester=3,
+                home_latitude=latitude, home_longitude=longitude
+            )
+            seat.assigned_user = student
+            seat.is_available = False
+            seat.save()
+            self.students.append(student)
+        User.objects.create(username='unseated', role='STUDENT')
+
+    def test_plan_and_apply(self):
+        plan = FeeGenerationService.plan('June', 2026, date(2026, 6, 30), today=date(2026, 6, 1))
+        summary = plan['summary']
+        self.assertEqual(summary['seated_students'], 3)
+        self.assertEqual(summary['to_create'], 3)
+        self.assertEqual(summary['missing_coordinates'], 1)
+        self.assertEqual(summary['tiers'], {'15000': 2, '30000': 1})
+
+        self.assertEqual(FeeGenerationService.apply(plan, notify=False), 3)
+        fee = Fee.objects.get(user=self.students[1], month='June', year=2026)
+        self.assertEqual(fee.amount, Decimal('30000'))
+        self.assertEqual(fee.semester, 3)
+        self.assertEqual(fee_balance(self.students[1]).pending_amount, Decimal('30000'))
+
+        self.assertEqual(FeeGenerationService.plan('June', 2026, date(2026, 6, 30))['summary']['to_create'], 0)
+
+    def test_rerun_skips_and_does_not_renotify(self):
+        plan = FeeGenerationService.plan('June', 2026, date(2026, 6, 30), today=date(2026, 6, 1))
+        self.assertEqual(FeeGenerationService.apply(plan), 3)
+        self.assertEqual(Notification.objects.count(), 3)
+
+        self.assertEqual(FeeGenerationService.apply(plan), 0)
+        self.assertEqual(Notification.objects.count(), 3)
+        self.assertEqual(Fee.objects.count(), 3)
+
+
+class PaymentImportTests(TestCase):
+    """Settlement files apply each transaction once and report what they could not apply"""
+
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', role='ADMIN')
+        self.students = [User.objects.create(username=f'student{i}', role='STUDENT') for i in range(2)]
+        self.fees = [
+            Fee.objects.create(user=student, amount=Decimal('15000'), month='June', year=2026, due_date=date(2030, 6, 30))
+            for student in self.students
+        ]
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.admin)
+
+    def upload(self, name, content):
+        return self.client.post('/api/admin/payments/import/', {
+            'file': SimpleUploadedFile(name, content.encode('utf-8'))
+        }, format='multipart')
+
+    def test_csv_import_is_idempotent(self):
+        content = (
+            'transaction_id,username,month,year,amount\n'
+            'TX1,student0,June,2026,15000\n'
+            'TX2,student1,June,2026,5000\n'
+            'TX2,student1,June,2026,5000\n'
+            'TX3,nobody,June,2026,100\n'
+            'TX4,student1,June,2026,abc\n'
+            'TX5,student1,June,2026,NaN\n'
+        )
+        response = self.upload('settlement.csv', content)
+        self.assertEqual(response.status_code, 200)
+        counts = response.data['counts']
+        self.assertEqual((counts['applied'], counts['duplicate'], counts['unmatched'], counts['invalid']), (2, 1, 1, 2))
+        self.assertEqual({e['reason'] for e in response.data['exceptions']}, {'DUPLICATE', 'UNMATCHED', 'INVALID'})
+
+        paid, partial = (Fee.objects.get(id=fee.id) for fee in self.fees)
+        self.assertEqual(paid.payment_status, 'PAID')
+        self.assertIsNotNone(paid.paid_date)
+        self.assertEqual(partial.payment_status, 'PARTIAL')
+        self.assertEqual(partial.pending_amount, Decimal('10000'))
+        self.assertEqual(FeeBalance.objects.get(user=self.students[1]).pending_amount, Decimal('10000'))
+        self.assertEqual(FeePayment.objects.filter(source='IMPORT').count(), 2)
+
+        response = self.upload('settlement.csv', content)
+        self.assertEqual(response.data['counts']['applied'], 0)
+        self.assertEqual(Fee.objects.get(id=self.fees[1].id).paid_amount, Decimal('5000'))
+
+    def test_json_lines_overpayment(self):
+        student = self.students[0]
+        content = (
+            f'{{"transaction_id": "J1", "student_id": {student.id}, "month": "June 2026", "amount": 10000}}\n'
+            f'{{"transaction_id": "J2", "student_id": {student.id}, "month": "June 2026", "amount": 10000}}\n'
+        )
+        response = self.upload('settlement.jsonl', content)
+        self.assertEqual(response.data['counts']['applied'], 1)
+        self.assertEqual(response.data['exceptions'][0]['reason'], 'OVERPAYMENT')
+
+    def test_rows_match_fees_by_transaction_id(self):
+        Fee.objects.filter(id=self.fees[1].id).update(transaction_id='GW-9')
+        content = 'transaction_id,amount\nGW-9,15000\nGW-9,15000\nGW-10,100\n'
+        response = self.upload('settlement.csv', content)
+        counts = response.data['counts']
+        self.assertEqual((counts['applied'], counts['duplicate'], counts['unmatched']), (1, 1, 1))
+        self.assertEqual(Fee.objects.get(id=self.fees[1].id).payment_status, 'PAID')
+
+        # Once paid under that id, a later file repeating it is a duplicate
+        self.assertEqual(self.upload('settlement.csv', content).data['counts']['duplicate'], 2)
+
+
+class ExportTests(TestCase):
+    """Exports stream the selected columns of the filtered rows"""
+
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', role='ADMIN')
+        students = [User.objects.create(username=f'student{i}', role='STUDENT') for i in range(3)]
+        for student in students:
+            Fee.objects.create(user=student, amount=Decimal('15000'), month='June', year=2026, due_date=date(2030, 6, 30))
+        Fee.objects.filter(user=students[0]).update(payment_status='PAID')
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.admin)
+
+    def test_csv_with_columns_and_filters(self):
+        response = self.client.get('/api/admin/exports/fees/', {'columns': 'username,amount', 'status': 'PENDING'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, ['username,amount', 'student1,15000.00', 'student2,15000.00'])
+
+    def test_rejects_unknown_columns_and_filters(self):
+        self.assertEqual(self.client.get('/api/admin/exports/fees/', {'columns': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/exports/fees/', {'nope': '1'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/exports/fees/', {'due_from': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/exports/passwords/').status_code, 400)
+
+
+class BulkMarkAttendanceTests(TestCase):
+    """Bulk attendance validates and upserts every row in a fixed number of queries"""
+
+    def setUp(self):
+        self.driver = User.objects.create(username='driver', role='DRIVER')
+        self.bus = BusService.create_bus_with_seats({
+            'bus_number': 1, 'capacity': 60, 'source': 'Tiruchengode', 'destination': 'University'
+        })
+        self.bus.driver = self.driver
+        self.bus.save()
+        self.passengers = []
+        for seat in Seat.objects.filter(bus=self.bus).order_by('seat_number')[:50]:
+            student = User.objects.create(username=f'student{seat.seat_number}', role='STUDENT')
+            seat.assigned_user = student
+            seat.is_available = False
+            seat.save()
+            self.passengers.append(student)
+        self.stranger = User.objects.create(username='stranger', role='STUDENT')
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.driver)
+
+    def mark(self, attendances):
+        return self.client.post('/api/driver/bulk-mark-attendance/', {
+            'date': '2026-06-01', 'attendances': attendances
+        }, format='json')
+
+    def test_upserts_with_per_row_errors(self):
+        Attendance.objects.create(user=self.passengers[0], date=date(2026, 6, 1), status='ABSENT')
+        attendances = [{'user_id': student.id, 'status': 'PRESENT'} for student in self.passengers]
+        attendances += [
+            {'user_id': self.stranger.id, 'status': 'PRESENT'},
+            {'user_id': 999999, 'status': 'PRESENT'},
+            {'user_id': self.passengers[1].id, 'status': 'ASLEEP'},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.mark(attendances)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 49)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(len(response.data['errors']), 3)
+        self.assertLess(len(queries), 10)
+        self.assertEqual(Attendance.objects.filter(date=date(2026, 6, 1), status='PRESENT').count(), 50)
+        self.assertFalse(Attendance.objects.filter(user=self.stranger).exists())
+
+    def test_upsert_names_no_conflict_target_on_mysql(self):
+        with patch.object(connection.features, 'supports_update_conflicts_with_target', False), \
+                patch.object(Attendance.objects, 'bulk_create', wraps=Attendance.objects.bulk_create) as bulk_create:
+            response = self.mark([{'user_id': student.id, 'status': 'PRESENT'} for student in self.passengers[:3]])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 3)
+        self.assertTrue(bulk_create.call_args.kwargs['update_conflicts'])
+        self.assertNotIn('unique_fields', bulk_create.call_args.kwargs)
+
+
+class RequestProfilingTests(TestCase):
+    """The profiling middleware aggregates per-endpoint timings and queries, and stays off unless enabled"""
+
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', role='ADMIN')
+        profiler.reset()
+
+    def test_middleware_records_endpoints(self):
+        with override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_DIR=tempfile.mkdtemp()):
+            client = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(self.admin)
+            for _ in range(3):
+                self.assertEqual(client.get('/api/admin/students/').status_code, 200)
+            response = client.get('/api/admin/profiling/', {'sort': 'requests'})
+
+        self.assertEqual(response.status_code, 200)
+        row = response.data['endpoints'][0]
+        self.assertEqual(row['endpoint'], 'get_all_students')
+        self.assertEqual(row['requests'], 3)
+        self.assertGreater(row['avg_queries'], 0)
+        self.assertGreater(row['avg_bytes'], 0)
+
+    def test_disabled_by_default(self):
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(self.admin)
+        client.get('/api/admin/students/')
+        self.assertEqual(profiler.snapshot()['endpoints'], {})
+        self.assertEqual(client.get('/api/admin/profiling/').status_code, 404)
+
+    def test_merges_processes_and_ranks_repeated_queries(self):
+        select = query_signature('SELECT * FROM "fees" WHERE "user_id" IN (%s, %s, %s)')
+        self.assertEqual(select, query_signature('SELECT * FROM "fees" WHERE "user_id" IN (%s)'))
+        first, second = Profiler(), Profiler()
+        first.record('bus_list', 40, 30, 20, {select: 25}, 1000, 200)
+        second.record('bus_list', 4000, 60, 3000, {select: 55}, 3000, 500)
+        second.record('login', 5, 1, 1, {}, 100, 200)
+
+        report = build_report([first.snapshot(), second.snapshot()], sort='avg_queries')
+        bus_list = report['endpoints'][0]
+        self.assertEqual(bus_list['endpoint'], 'bus_list')
+        self.assertEqual((bus_list['requests'], bus_list['errors'], bus_list['max_queries']), (2, 1, 60))
+        self.assertEqual(bus_list['p95_ms'], 5000)
+        self.assertEqual(bus_list['duplicate_queries'], [{'sql': select, 'requests': 2, 'max_repeats': 55}])
+
+
+class SyntheticDataTests(TestCase):
+    """The seeded generator rebuilds the same dataset, and benchmark records flag regressions between runs"""
+
+    def generate(self, seed=7):
+        return SyntheticDataGenerator(
+            seed=seed, buses=3, seats_per_bus=40, students=150, attendance_days=8, fee_months=2, today=date(2026, 6, 15)
+        ).run()
+
+    def test_generates_seeded_fleet_and_history(self):
+        counts = self.generate()
+        homes = list(User.objects.filter(role='STUDENT').order_by('username').values_list('home_latitude', 'home_longitude'))
+
+        self.assertEqual((counts['buses'], counts['seats'], counts['students']), (3, 120, 150))
+        self.assertEqual(counts['seated_students'], Seat.objects.filter(assigned_user__isnull=False).count())
+        self.assertEqual(counts['attendance'], counts['seated_students'] * 6)
+        self.assertEqual(counts['fees'], counts['seated_students'] * 2)
+        self.assertEqual(rebuild_fee_balances()['fixed'], 0)
+        for lat, lng in homes:
+            self.assertTrue(10.8 < lat < 11.8 and 77.4 < lng < 78.4)
+
+        SyntheticDataGenerator.reset()
+        self.assertFalse(User.objects.exists() or Fee.objects.exists() or Seat.objects.exists())
+        self.generate()
+        self.assertEqual(homes, list(User.objects.filter(role='STUDENT').order_by('username').values_list('home_latitude', 'home_longitude')))
+
+    def test_benchmarks_record_and_compare(self):
+        self.generate()
+        record = run_benchmarks(['admin_dashboard', 'send_bulk_fee_reminder'], iterations=1)
+        self.assertEqual(set(record['results']), {'admin_dashboard', 'send_bulk_fee_reminder'}, record['skipped'])
+        self.assertFalse(Notification.objects.exists())
+
+        slower = {'results': {name: dict(result, median_ms=result['median_ms'] * 3 + 10) for name, result in record['results'].items()}}
+        self.assertTrue(all(row['regressed'] for row in compare(slower, record)))
+        self.assertFalse(any(row['regressed'] for row in compare(record, slower)))
+
+
+class LocationLoadTestTests(TestCase):
+    """The websocket load test delivers every update to its watchers and reports the buffered database writes"""
+
+    def test_every_update_reaches_its_watchers(self):
+        SyntheticDataGenerator(buses=3, seats_per_bus=10, students=20, attendance_days=0, fee_months=0).run()
+        report = LocationLoadTest(drivers=3, bus_watchers=3, fleet_watchers=2, rate=10, duration=0.5, drain_seconds=2).run()
+
+        messages = report['messages']
+        self.assertEqual(report['connections']['total'], 11)
+        self.assertGreater(messages['sent'], 0)
+        # Half the updates go to a bus socket (one watcher each), half to the fleet (two watchers)
+        self.assertEqual(messages['expected_deliveries'], messages['sent'] // 2 * 3)
+        self.assertEqual(messages['delivered'], messages['expected_deliveries'])
+        self.assertIsNotNone(report['fanout_latency_ms']['p99'])
+        # Buffered positions go out in a few bulk statements per flush, not one write per update
+        self.assertGreater(report['database']['writes'], 0)
+        self.assertLess(report['database']['writes'], messages['sent'] // 2)
+
+
+class DashboardSnapshotTests(TestCase):
+    """The snapshot must match a full recount after every kind of change"""
+
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', role='ADMIN')
+        self.driver = User.objects.create(username='driver', role='DRIVER')
+        self.bus = BusService.create_bus_with_seats({
+            'bus_number': 1, 'capacity': 10, 'source': 'Tiruchengode', 'destination': 'University', 'driver': self.driver
+        })
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(self.admin)
+        recompute_dashboard()
+
+    def assertInStep(self):
+        snapshot = DashboardSnapshot.objects.get()
+        self.assertEqual({field: getattr(snapshot, field) for field in dashboard_counts()}, dashboard_counts())
+
+    def test_signals_keep_counters_in_step(self):
+        student = User.objects.create(username='student', role='STUDENT')
+        User.objects.create(username='teacher', role='TEACHER')
+        other_driver = User.objects.create(username='driver2', role='DRIVER')
+        self.assertInStep()
+
+        student = User.objects.get(pk=student.pk)
+        student.role = 'DRIVER'
+        student.save()
+        # Saves that leave the role alone cost no lookup, a stale instance is compared with the stored role
+        other_driver = User.objects.get(pk=other_driver.pk)
+        with self.assertNumQueries(1):
+            other_driver.save(update_fields=['username'])
+        stale = User.objects.get(pk=student.pk)
+        User.objects.filter(pk=student.pk).update(role='TEACHER')
+        recompute_dashboard()
+        stale.role = 'DRIVER'
+        stale.save(update_fields=['role'])
+        self.assertInStep()
+
+        # Loading rows runs no dashboard code
+        with patch('myapp.dashboard.remember_state') as remember:
+            list(User.objects.all())
+        remember.assert_not_called()
+
+        self.bus.status = 'BREAKDOWN'
+        self.bus.save()
+        attendance = DriverAttendance.objects.create(driver=self.driver, date=date.today())
+        DriverAttendance.objects.create(driver=other_driver, date=date(2020, 1, 1))
+        self.assertInStep()
+        self.assertEqual(dashboard_snapshot()['pending_attendance'], 2)
+
+        attendance.delete()
+        other_driver.delete()
+        self.bus.delete()
+        self.assertInStep()
+
+    def test_endpoint_reads_one_row_and_reports_age(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/dashboard/admin/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual((response.data['total_buses'], response.data['total_drivers']), (1, 1))
+        self.assertLess(response.data['snapshot']['age_seconds'], 60)
+
+    def test_recompute_fixes_drift_and_stale_snapshots_refresh(self):
+        User.objects.bulk_create([User(username=f'bulk{i}', role='STUDENT') for i in range(3)])
+        self.assertEqual(dashboard_snapshot()['total_students'], 0)
+
+        _, drift = recompute_dashboard()
+        self.assertEqual(drift, {'total_students': (0, 3)})
+
+        DashboardSnapshot.objects.update(total_students=0, recomputed_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(dashboard_snapshot()['total_students'], 3)
@@ -45,7 +45,12 @@ urlpatterns = [
     path('admin/students/', views.get_all_students, name='get_all_students'),
     path('admin/send-fee-reminder/<int:student_id>/', views.send_fee_reminder, name='send_fee_reminder'),
     path('admin/send-bulk-fee-reminder/', views.send_bulk_fee_reminder, name='send_bulk_fee_reminder'),
+    path('admin/fee-reminder-jobs/<int:job_id>/', views.get_fee_reminder_job, name='get_fee_reminder_job'),
     path('admin/record-partial-payment/', views.record_partial_payment, name='record_partial_payment'),
+    path('admin/payments/import/', views.import_payments, name='import_payments'),
+    path('admin/exports/', views.list_exports, name='list_exports'),
+    path('admin/exports/<str:dataset>/', views.export_dataset, name='export_dataset'),
+    path('admin/profiling/', views.request_profile, name='request_profile'),
     path('admin/approve-leave/<int:leave_id>/', views.approve_driver_leave, name='approve_driver_leave'),
     path('admin/reject-leave/<int:leave_id>/', views.reject_driver_leave, name='reject_driver_leave'),
     path('admin/assign-student-to-seat/', views.assign_student_to_seat, name='assign_student_to_seat'),
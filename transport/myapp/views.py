@@ -1,16 +1,22 @@
 from rest_framework import viewsets, status, generics
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, parser_classes, permission_classes
+from rest_framework.exceptions import NotFound
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.contrib.auth import authenticate
-from django.db.models import Q, Sum
-from django.db import models
+from django.http import StreamingHttpResponse
+from django.db.models import Count, Prefetch, Q, Sum
+from django.db import connection, models, transaction, IntegrityError
 from django.utils import timezone
-from datetime import date
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import date, datetime, time
 from decimal import Decimal
+import numpy as np
 
-from .models import User, Bus, Seat, Attendance, Notification, Query, Fee, EmergencyAlert, DriverLeave, StudentQuery, DriverAttendance
+from .models import User, Bus, Seat, Attendance, Notification, Query, Fee, FeePayment, FeeReminderJob, EmergencyAlert, DriverLeave, StudentQuery, DriverAttendance
 from .serializers import (
     UserSerializer, UserProfileSerializer, BusSerializer, SeatSerializer,
     AttendanceSerializer, NotificationSerializer, QuerySerializer, FeeSerializer,
@@ -18,6 +24,25 @@ from .serializers import (
 )
 from .permissions import IsAdmin, IsDriver, IsTeacherOrStudent
 from .services import BusService, NotificationService, AttendanceService
+from .spatial import bus_index
+from .location_history import (
+    location_history, simplify_path, path_length_km,
+    DEFAULT_MAX_POINTS, DEFAULT_TOLERANCE_M, MAX_POINTS_LIMIT
+)
+from .assignment import BulkAssignmentService
+from .notifications import adjust_unread, mark_notifications_seen, unread_notification_count
+from .exports import CONTENT_TYPES, EXPORT_FORMATS, EXPORTS, ExportError, get_dataset, parquet_available, stream_export
+from .pagination import KeysetPagination
+from .profiling import SORT_KEYS, clear_snapshots, current_report, profiler
+from .payment_import import MAX_REPORTED_EXCEPTIONS, PaymentImporter, decode_lines, detect_format, read_rows
+from .fee_balances import fee_balance
+from .fee_reminders import job_progress, start_fee_reminder_job
+from .dashboard import dashboard_snapshot
+from .fees import (
+    DEFAULT_FEE_DISTANCE_KM, UNPAID_FEE_STATUSES, calculate_bus_fee_from_distance, calculate_driver_salary_from_distance,
+    current_fee_period, fee_assigned_message
+)
+from .distance import calculate_distance, distances_to_point, UNIVERSITY_LATITUDE, UNIVERSITY_LONGITUDE
 
 
 # Authentication Views
@@ -33,8 +58,11 @@ def test_db(request):
 @api_view(['GET'])
 @permission_classes([IsAdmin])
 def get_all_users(request):
-    """Debug endpoint to see all users and their roles"""
-    users = User.objects.all()
+    """Debug endpoint to see all users and their roles, one cursor page at a time"""
+    paginator = KeysetPagination(ordering=('id',))
+    users = paginator.paginate_queryset(
+        User.objects.only('id', 'username', 'role', 'first_name', 'last_name', 'is_superuser'), request
+    )
     user_list = []
     for user in users:
         user_list.append({
@@ -45,11 +73,10 @@ def get_all_users(request):
             'last_name': user.last_name,
             'is_superuser': user.is_superuser
         })
-    return Response({
-        'users': user_list,
-        'total': len(user_list),
-        'drivers': [u for u in user_list if u['role'] == 'DRIVER']
-    })
+    data = paginator.get_paginated_data(user_list, results_key='users')
+    data['total'] = User.objects.count()
+    data['drivers'] = [u for u in user_list if u['role'] == 'DRIVER']
+    return Response(data)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -129,11 +156,27 @@ def update_profile(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _parse_moment(value, end_of_day=False):
+    """Parse an ISO datetime or date query param into an aware datetime, None if empty"""
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date: {value}')
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
 # Bus ViewSet
 class BusViewSet(viewsets.ModelViewSet):
     queryset = Bus.objects.all()
     serializer_class = BusSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('bus_number', 'id')
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -184,13 +227,11 @@ class BusViewSet(viewsets.ModelViewSet):
             BusService.notify_admins_of_breakdown(bus)
         else:
             # Regular status update notification
-            admins = User.objects.filter(role='ADMIN')
-            for admin in admins:
-                NotificationService.send_notification(
-                    user=admin,
-                    message=f"Bus {bus.bus_number} status changed to {new_status} by driver {request.user.username}",
-                    created_by=request.user
-                )
+            NotificationService.notify_role(
+                'ADMIN',
+                f"Bus {bus.bus_number} status changed to {new_status} by driver {request.user.username}",
+                created_by=request.user
+            )
         
         return Response(BusSerializer(bus).data)
 
@@ -204,6 +245,44 @@ class BusViewSet(viewsets.ModelViewSet):
         bus.save()
         return Response(BusSerializer(bus).data)
 
+    @action(detail=True, methods=['get'])
+    def trip(self, request, pk=None):
+        """
+        Replay the GPS trail of a bus as a downsampled polyline.
+        Query params: start, end (ISO date or datetime, default today so far),
+        max_points (default 500) and tolerance_m (Douglas-Peucker, default 10).
+        """
+        bus = self.get_object()
+        try:
+            start = _parse_moment(request.query_params.get('start'))
+            end = _parse_moment(request.query_params.get('end'), end_of_day=True)
+            max_points = min(int(request.query_params.get('max_points', DEFAULT_MAX_POINTS)), MAX_POINTS_LIMIT)
+            tolerance_m = max(float(request.query_params.get('tolerance_m', DEFAULT_TOLERANCE_M)), 0.0)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        now = timezone.now()
+        start = start or timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        end = end or now
+        if end < start:
+            return Response({'error': 'end must be after start'}, status=status.HTTP_400_BAD_REQUEST)
+
+        timestamps, lat_lng = location_history.trip(bus.id, start, end)
+        keep = simplify_path(lat_lng, tolerance_m=tolerance_m, max_points=max(max_points, 2))
+
+        return Response({
+            'bus': bus.bus_number,
+            'start': start,
+            'end': end,
+            'total_points': len(timestamps),
+            'returned_points': len(keep),
+            'distance_km': round(path_length_km(lat_lng), 2),
+            'points': [
+                {'latitude': lat_lng[i, 0], 'longitude': lat_lng[i, 1], 'recorded_at': timestamps[i]}
+                for i in keep.tolist()
+            ]
+        })
+
     @action(detail=False, methods=['get'], permission_classes=[IsDriver])
     def my_bus(self, request):
         try:
@@ -218,9 +297,10 @@ class SeatViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Seat.objects.all().order_by('bus', 'seat_number')
     serializer_class = SeatSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('bus_id', 'seat_number')
     
     def get_queryset(self):
-        queryset = Seat.objects.all().order_by('bus', 'seat_number')
+        queryset = Seat.objects.select_related('assigned_user__fee_balance').order_by('bus', 'seat_number')
         bus_id = self.request.query_params.get('bus', None)
         if bus_id is not None:
             queryset = queryset.filter(bus_id=bus_id)
@@ -240,6 +320,7 @@ class AttendanceViewSet(viewsets.ModelViewSet):
     queryset = Attendance.objects.all()
     serializer_class = AttendanceSerializer
     permission_classes = [IsAuthenticated]
+    keyset_ordering = ('-date', '-id')
 
     def get_queryset(self):
         user = self.request.user
@@ -304,18 +385,38 @@ class NotificationViewSet(viewsets.ModelViewSet):
         NotificationService.send_bulk_notifications(user_ids, message, request.user)
         return Response({'message': 'Notifications sent successfully'}, status=status.HTTP_201_CREATED)
 
+    def perform_update(self, serializer):
+        before = (serializer.instance.user_id, serializer.instance.is_seen)
+        with transaction.atomic():
+            notification = serializer.save()
+            if (notification.user_id, notification.is_seen) != before:
+                if not before[1]:
+                    adjust_unread(before[0], -1)
+                if not notification.is_seen:
+                    adjust_unread(notification.user_id, 1)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            if not instance.is_seen:
+                adjust_unread(instance.user_id, -1)
+
     @action(detail=True, methods=['patch'])
     def mark_seen(self, request, pk=None):
         notification = self.get_object()
-        notification.is_seen = True
-        notification.save()
+        if mark_notifications_seen(request.user.id, [notification.id]):
+            notification.is_seen = True
         return Response(NotificationSerializer(notification).data)
 
     @action(detail=False, methods=['post'])
     def mark_all_seen(self, request):
-        Notification.objects.filter(user=request.user, is_seen=False).update(is_seen=True)
+        mark_notifications_seen(request.user.id)
         return Response({'message': 'All notifications marked as seen'})
 
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        return Response({'unread': unread_notification_count(request.user.id)})
+
 
 # Query ViewSet
 class QueryViewSet(viewsets.ModelViewSet):
@@ -351,13 +452,11 @@ class QueryViewSet(viewsets.ModelViewSet):
                 bus_info = "No bus assigned"
             
             # Notify admins with full details
-            admins = User.objects.filter(role='ADMIN')
-            for admin in admins:
-                NotificationService.send_notification(
-                    user=admin,
-                    message=f"📝 New Query from {request.user.role}: {request.user.username} ({request.user.first_name} {request.user.last_name}) | {bus_info} | Subject: {query.subject}",
-                    created_by=request.user
-                )
+            NotificationService.notify_role(
+                'ADMIN',
+                f"📝 New Query from {request.user.role}: {request.user.username} ({request.user.first_name} {request.user.last_name}) | {bus_info} | Subject: {query.subject}",
+                created_by=request.user
+            )
             
             # Notify driver anonymously
             try:
@@ -433,28 +532,8 @@ class FeeViewSet(viewsets.ModelViewSet):
 @api_view(['GET'])
 @permission_classes([IsAdmin])
 def admin_dashboard(request):
-    total_buses = Bus.objects.count()
-    total_drivers = User.objects.filter(role='DRIVER').count()
-    total_students = User.objects.filter(role='STUDENT').count()
-    total_teachers = User.objects.filter(role='TEACHER').count()
-    
-    # Count drivers who haven't marked attendance today
-    drivers_marked_today = DriverAttendance.objects.filter(
-        date=date.today()
-    ).values_list('driver_id', flat=True)
-    
-    pending_attendance = total_drivers - len(set(drivers_marked_today))
-    
-    breakdown_buses = Bus.objects.filter(status='BREAKDOWN').count()
-    
-    return Response({
-        'total_buses': total_buses,
-        'total_drivers': total_drivers,
-        'total_students': total_students,
-        'total_teachers': total_teachers,
-        'pending_attendance': pending_attendance,
-        'breakdown_buses': breakdown_buses,
-    })
+    # Served from the snapshot row kept up to date by signals
+    return Response(dashboard_snapshot())
 
 
 @api_view(['GET'])
@@ -488,7 +567,7 @@ def user_dashboard(request):
     except Seat.DoesNotExist:
         seat_data = None
     
-    unread_notifications = Notification.objects.filter(user=request.user, is_seen=False).count()
+    unread_notifications = unread_notification_count(request.user.id)
     my_queries = Query.objects.filter(user=request.user).count()
     
     return Response({
@@ -508,10 +587,15 @@ class EmergencyAlertViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if user.role == 'ADMIN':
-            return EmergencyAlert.objects.all()
+            queryset = EmergencyAlert.objects.all()
         elif user.role == 'DRIVER':
-            return EmergencyAlert.objects.filter(driver=user)
-        return EmergencyAlert.objects.none()
+            queryset = EmergencyAlert.objects.filter(driver=user)
+        else:
+            return EmergencyAlert.objects.none()
+        alert_status = self.request.query_params.get('status', None)
+        if alert_status is not None:
+            queryset = queryset.filter(status=alert_status)
+        return queryset
 
     def create(self, request, *args, **kwargs):
         if request.user.role != 'DRIVER':
@@ -531,13 +615,11 @@ class EmergencyAlertViewSet(viewsets.ModelViewSet):
             alert = serializer.save()
             
             # Send urgent notification to all admins
-            admins = User.objects.filter(role='ADMIN')
-            for admin in admins:
-                NotificationService.send_notification(
-                    user=admin,
-                    message=f"🚨 EMERGENCY ALERT! Bus {bus.bus_number} - Driver: {request.user.username} - Location: {alert.location or 'Unknown'} - Message: {alert.message}",
-                    created_by=request.user
-                )
+            NotificationService.notify_role(
+                'ADMIN',
+                f"🚨 EMERGENCY ALERT! Bus {bus.bus_number} - Driver: {request.user.username} - Location: {alert.location or 'Unknown'} - Message: {alert.message}",
+                created_by=request.user
+            )
             
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -587,13 +669,11 @@ class DriverLeaveViewSet(viewsets.ModelViewSet):
             leave = serializer.save()
             
             # Notify all admins
-            admins = User.objects.filter(role='ADMIN')
-            for admin in admins:
-                NotificationService.send_notification(
-                    user=admin,
-                    message=f"📅 Leave Request: Driver {request.user.username} requested leave from {leave.start_date} to {leave.end_date}. Reason: {leave.reason}",
-                    created_by=request.user
-                )
+            NotificationService.notify_role(
+                'ADMIN',
+                f"📅 Leave Request: Driver {request.user.username} requested leave from {leave.start_date} to {leave.end_date}. Reason: {leave.reason}",
+                created_by=request.user
+            )
             
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -637,14 +717,11 @@ class DriverLeaveViewSet(viewsets.ModelViewSet):
             )
             
             # Notify all students/teachers in that bus
-            seats = Seat.objects.filter(bus=bus, is_available=False)
-            for seat in seats:
-                if seat.assigned_user:
-                    NotificationService.send_notification(
-                        user=seat.assigned_user,
-                        message=f"🚌 Bus {bus.bus_number} will have a substitute driver ({substitute_driver.username}) from {leave.start_date} to {leave.end_date}",
-                        created_by=request.user
-                    )
+            NotificationService.notify_bus_passengers(
+                bus,
+                f"🚌 Bus {bus.bus_number} will have a substitute driver ({substitute_driver.username}) from {leave.start_date} to {leave.end_date}",
+                created_by=request.user
+            )
         except Bus.DoesNotExist:
             pass
         
@@ -802,32 +879,27 @@ def send_breakdown_alert(request):
         )
         
         # Notify all admins
-        admins = User.objects.filter(role='ADMIN')
-        for admin in admins:
-            NotificationService.send_notification(
-                user=admin,
-                message=f"🚨 BREAKDOWN ALERT! Bus {bus.bus_number} ({bus.source} → {bus.destination})\nDriver: {driver.first_name} {driver.last_name}\nLocation: {location or 'Unknown'}\nMessage: {message}",
-                created_by=driver
-            )
+        NotificationService.notify_role(
+            'ADMIN',
+            f"🚨 BREAKDOWN ALERT! Bus {bus.bus_number} ({bus.source} → {bus.destination})\nDriver: {driver.first_name} {driver.last_name}\nLocation: {location or 'Unknown'}\nMessage: {message}",
+            created_by=driver
+        )
         
         # Notify all students in the bus
-        seats = Seat.objects.filter(bus=bus, is_available=False).select_related('assigned_user')
-        student_count = 0
-        
-        for seat in seats:
-            if seat.assigned_user and seat.assigned_user.role == 'STUDENT':
-                NotificationService.send_notification(
-                    user=seat.assigned_user,
-                    message=f"⚠️ IMPORTANT: Bus {bus.bus_number} has broken down.\nLocation: {location or 'Unknown'}\nPlease make alternative arrangements. We apologize for the inconvenience.",
-                    created_by=None  # System notification
-                )
-                student_count += 1
+        NotificationService.notify_bus_passengers(
+            bus,
+            f"⚠️ IMPORTANT: Bus {bus.bus_number} has broken down.\nLocation: {location or 'Unknown'}\nPlease make alternative arrangements. We apologize for the inconvenience.",
+            created_by=None,  # System notification
+            role='STUDENT'
+        )
         
         return Response({
             'message': 'Breakdown alert sent successfully',
             'alert_id': alert.id,
-            'admins_notified': admins.count(),
-            'students_notified': student_count,
+            'admins_notified': User.objects.filter(role='ADMIN').count(),
+            'students_notified': Seat.objects.filter(
+                bus=bus, is_available=False, assigned_user__role='STUDENT'
+            ).count(),
             'bus_status': 'BREAKDOWN'
         })
         
@@ -851,13 +923,11 @@ def update_driver_status_endpoint(request):
         driver.save()
         
         # Notify admins of status change
-        admins = User.objects.filter(role='ADMIN')
-        for admin in admins:
-            NotificationService.send_notification(
-                user=admin,
-                message=f"Driver {driver.first_name} {driver.last_name} status changed from {old_status} to {new_status}",
-                created_by=driver
-            )
+        NotificationService.notify_role(
+            'ADMIN',
+            f"Driver {driver.first_name} {driver.last_name} status changed from {old_status} to {new_status}",
+            created_by=driver
+        )
         
         return Response({
             'message': 'Status updated successfully',
@@ -875,18 +945,14 @@ def get_my_bus_students_enhanced(request):
     """Get students in driver's bus with enhanced details"""
     try:
         bus = Bus.objects.get(driver=request.user)
-        seats = Seat.objects.filter(bus=bus, is_available=False).select_related('assigned_user').order_by('seat_number')
+        seats = Seat.objects.filter(bus=bus, is_available=False).select_related(
+            'assigned_user__fee_balance'
+        ).order_by('seat_number')
         
         students = []
         for seat in seats:
             if seat.assigned_user:
-                # Get unpaid fees
-                unpaid_fees = Fee.objects.filter(
-                    user=seat.assigned_user,
-                    payment_status__in=['PENDING', 'OVERDUE', 'PARTIAL']
-                )
-                
-                total_pending = sum(fee.pending_amount for fee in unpaid_fees)
+                balance = fee_balance(seat.assigned_user)
                 
                 students.append({
                     'id': seat.assigned_user.id,
@@ -898,8 +964,8 @@ def get_my_bus_students_enhanced(request):
                     'phone': seat.assigned_user.phone,
                     'email': seat.assigned_user.email,
                     'home_location': seat.assigned_user.home_location,
-                    'has_unpaid_fees': unpaid_fees.exists(),
-                    'pending_amount': str(total_pending),
+                    'has_unpaid_fees': balance.has_unpaid_fees,
+                    'pending_amount': str(balance.pending_amount),
                     'gender': seat.assigned_user.gender
                 })
         
@@ -956,44 +1022,74 @@ def get_my_bus_students(request):
 @api_view(['POST'])
 @permission_classes([IsDriver])
 def bulk_mark_attendance(request):
+    """
+    Mark attendance for many passengers of the driver's bus at once: one
+    query validates every user and their seat on this driver's bus, one
+    INSERT ... ON CONFLICT upserts all the rows
+    """
     attendance_data = request.data.get('attendances', [])
-    attendance_date = request.data.get('date', date.today())
+    attendance_date = request.data.get('date') or date.today()
     
     if not attendance_data:
         return Response({'error': 'No attendance data provided'}, status=status.HTTP_400_BAD_REQUEST)
     
-    created_count = 0
-    updated_count = 0
-    errors = []
+    if isinstance(attendance_date, str):
+        try:
+            attendance_date = parse_date(attendance_date)
+        except ValueError:
+            attendance_date = None
+        if attendance_date is None:
+            return Response({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
     
+    errors = []
+    statuses = {}  # user id -> status, the last entry for a user wins
+    valid_statuses = {choice for choice, _ in Attendance.STATUS_CHOICES}
     for item in attendance_data:
+        user_id = item.get('user_id')
+        attendance_status = item.get('status')
         try:
-            user_id = item.get('user_id')
-            attendance_status = item.get('status')
-            
-            user = User.objects.get(id=user_id)
-            
-            # Update or create attendance
-            attendance, created = Attendance.objects.update_or_create(
-                user=user,
-                date=attendance_date,
-                defaults={'status': attendance_status}
-            )
-            
-            if created:
-                created_count += 1
-            else:
-                updated_count += 1
-                
-        except User.DoesNotExist:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
             errors.append(f"User {user_id} not found")
-        except Exception as e:
-            errors.append(f"Error for user {user_id}: {str(e)}")
+            continue
+        if attendance_status not in valid_statuses:
+            errors.append(f"Error for user {user_id}: invalid status '{attendance_status}'")
+            continue
+        statuses[user_id] = attendance_status
+    
+    # Which users exist and whose bus they sit on, in one query
+    seats = {
+        user_id: (driver_id, is_available)
+        for user_id, driver_id, is_available in User.objects.filter(id__in=statuses).values_list(
+            'id', 'assigned_seat__bus__driver_id', 'assigned_seat__is_available'
+        )
+    }
+    rows = []
+    for user_id, attendance_status in statuses.items():
+        if user_id not in seats:
+            errors.append(f"User {user_id} not found")
+        elif seats[user_id] != (request.user.id, False):
+            errors.append(f"Error for user {user_id}: not a passenger of your bus")
+        else:
+            rows.append(Attendance(user_id=user_id, date=attendance_date, status=attendance_status))
+    
+    with transaction.atomic():
+        existing = set(Attendance.objects.filter(
+            date=attendance_date, user_id__in=[row.user_id for row in rows]
+        ).values_list('user_id', flat=True))
+        # MySQL's ON DUPLICATE KEY UPDATE cannot name the key; (user, date) is the only one a new row can hit
+        conflict_target = {'unique_fields': ['user', 'date']} if connection.features.supports_update_conflicts_with_target else {}
+        Attendance.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            update_fields=['status', 'updated_at'],
+            **conflict_target
+        )
     
     return Response({
         'message': 'Attendance marked successfully',
-        'created': created_count,
-        'updated': updated_count,
+        'created': len(rows) - len(existing),
+        'updated': len(existing),
         'errors': errors
     })
 
@@ -1044,57 +1140,6 @@ def get_available_drivers(request):
         'total': len(driver_list)
     })
 
-# Helper for Haversine distance
-import math
-
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two coordinates in kilometers using Haversine formula"""
-    if not all([lat1, lon1, lat2, lon2]):
-        return None
-    
-    R = 6371  # Earth radius in km
-    dlat = math.radians(float(lat2) - float(lat1))
-    dlon = math.radians(float(lon2) - float(lon1))
-    a = math.sin(dlat / 2) * math.sin(dlat / 2) + \
-        math.cos(math.radians(float(lat1))) * math.cos(math.radians(float(lat2))) * \
-        math.sin(dlon / 2) * math.sin(dlon / 2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
-
-def calculate_bus_fee_from_distance(distance_km):
-    """
-    Calculate monthly bus fee based on distance from home to university
-    Distance tiers:
-    - 0-20 km: ₹15000
-    - 21-50 km: ₹30000
-    - 51-60 km: ₹40000
-    - 60+ km: ₹40000 (max)
-    """
-    if distance_km <= 20:
-        return 15000
-    elif distance_km <= 50:
-        return 30000
-    else:
-        return 40000
-
-def calculate_driver_salary_from_distance(distance_km):
-    """
-    Calculate driver salary based on route distance
-    - 0-20 km: ₹15000
-    - 21-50 km: ₹30000
-    - 51-60 km: ₹40000
-    """
-    if distance_km <= 20:
-        return 15000
-    elif distance_km <= 50:
-        return 30000
-    else:
-        return 40000
-
-# University location coordinates (KSR College, Tiruchengode)
-UNIVERSITY_LATITUDE = 11.3833
-UNIVERSITY_LONGITUDE = 77.8833
-
 
 # Auto-Assignment Service
 @api_view(['POST'])
@@ -1125,48 +1170,33 @@ def auto_assign_student_to_nearest_bus(request):
                 'error': f'Student already assigned to Bus {existing_seat.bus.bus_number}, Seat {existing_seat.seat_number}'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Find all buses with available seats
-        buses_with_seats = Bus.objects.filter(
-            seats__is_available=True,
-            status='WORKING'
-        ).distinct()
-        
-        if not buses_with_seats.exists():
-            return Response({'error': 'No buses with available seats'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Calculate distance to each bus source and find nearest
-        nearest_bus = None
-        min_distance = float('inf')
-        
-        for bus in buses_with_seats:
-            if bus.source_latitude and bus.source_longitude:
-                distance = calculate_distance(
-                    student.home_latitude,
-                    student.home_longitude,
-                    bus.source_latitude,
-                    bus.source_longitude
-                )
-                
-                if distance and distance < min_distance:
-                    min_distance = distance
-                    nearest_bus = bus
-        
-        if not nearest_bus:
-            return Response({
-                'error': 'No buses with valid coordinates found'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Get available seat in the nearest bus
-        available_seat = Seat.objects.filter(
-            bus=nearest_bus,
-            is_available=True
-        ).exclude(seat_number=1).order_by('seat_number').first()
-        
+        # Find the nearest working bus with a free seat from the spatial index
+        available_seat = None
+        tried_buses = set()
+
+        while available_seat is None:
+            match = bus_index.nearest(student.home_latitude, student.home_longitude, exclude=tried_buses)
+            if match is None:
+                break
+            bus_id, min_distance = match
+            tried_buses.add(bus_id)
+
+            # The index can lag behind seats taken by another worker, so confirm in the DB
+            available_seat = Seat.objects.filter(
+                bus_id=bus_id,
+                is_available=True
+            ).exclude(seat_number=1).select_related('bus').order_by('seat_number').first()
+
+            if available_seat is None:
+                bus_index.invalidate(bus_id)
+
         if not available_seat:
             return Response({
-                'error': f'No available seats in nearest bus {nearest_bus.bus_number}'
+                'error': 'No buses with available seats and valid coordinates found'
             }, status=status.HTTP_400_BAD_REQUEST)
-        
+
+        nearest_bus = available_seat.bus
+
         # Assign student to seat
         available_seat.assigned_user = student
         available_seat.is_available = False
@@ -1191,26 +1221,27 @@ def auto_assign_student_to_nearest_bus(request):
         
         if not nearest_bus.driver:
             # Find nearest available driver
-            available_drivers = User.objects.filter(
+            available_drivers = list(User.objects.filter(
                 role='DRIVER',
-                driver_status='AVAILABLE'
-            ).exclude(assigned_bus__isnull=False)
+                driver_status='AVAILABLE',
+                home_latitude__isnull=False,
+                home_longitude__isnull=False
+            ).exclude(assigned_bus__isnull=False))
             
             nearest_driver = None
             min_driver_distance = float('inf')
             
-            for driver in available_drivers:
-                if driver.home_latitude and driver.home_longitude and nearest_bus.source_latitude:
-                    distance = calculate_distance(
-                        driver.home_latitude,
-                        driver.home_longitude,
-                        nearest_bus.source_latitude,
-                        nearest_bus.source_longitude
-                    )
-                    
-                    if distance and distance < min_driver_distance:
-                        min_driver_distance = distance
-                        nearest_driver = driver
+            if available_drivers:
+                # One vectorized pass over all candidate drivers
+                driver_distances = distances_to_point(
+                    [(driver.home_latitude, driver.home_longitude) for driver in available_drivers],
+                    nearest_bus.source_latitude,
+                    nearest_bus.source_longitude
+                )
+                if not np.isnan(driver_distances).all():
+                    best = int(np.nanargmin(driver_distances))
+                    nearest_driver = available_drivers[best]
+                    min_driver_distance = float(driver_distances[best])
             
             if nearest_driver:
                 nearest_bus.driver = nearest_driver
@@ -1268,50 +1299,30 @@ def auto_assign_student_to_nearest_bus(request):
 @api_view(['POST'])
 @permission_classes([IsAdmin])
 def bulk_auto_assign_students(request):
-    """Auto-assign all unassigned students to nearest buses"""
+    """
+    Auto-assign all unassigned students to buses in one batch, minimising the
+    total home-to-bus distance across all students (see myapp/assignment.py)
+    """
     try:
-        # Get all unassigned students with coordinates
-        assigned_student_ids = Seat.objects.filter(assigned_user__isnull=False).values_list('assigned_user_id', flat=True)
-        unassigned_students = User.objects.filter(
-            role='STUDENT',
-            home_latitude__isnull=False,
-            home_longitude__isnull=False
-        ).exclude(id__in=assigned_student_ids)
-        
-        if not unassigned_students.exists():
-            return Response({'message': 'No unassigned students with coordinates found'})
+        result = BulkAssignmentService.assign_unassigned_students(created_by=request.user)
         
-        assigned_count = 0
-        failed_count = 0
-        assignments = []
-        
-        for student in unassigned_students:
-            try:
-                # Call the single assignment function
-                result = auto_assign_student_to_nearest_bus(
-                    type('Request', (), {'data': {'student_id': student.id}, 'user': request.user})()
-                )
-                
-                if result.status_code == 200:
-                    assigned_count += 1
-                    assignments.append({
-                        'student': f"{student.first_name} {student.last_name}",
-                        'bus': result.data['bus']['bus_number'],
-                        'seat': result.data['seat']
-                    })
-                else:
-                    failed_count += 1
-            except Exception as e:
-                failed_count += 1
-                continue
+        if not result['assigned'] and not result['failed']:
+            return Response({'message': 'No unassigned students with coordinates found'})
         
         return Response({
-            'message': f'Bulk assignment completed',
-            'assigned': assigned_count,
-            'failed': failed_count,
-            'assignments': assignments
+            'message': 'Bulk assignment completed',
+            'assigned': result['assigned'],
+            'failed': result['failed'],
+            'total_distance_km': result['total_distance_km'],
+            'assignments': result['assignments']
         })
         
+    except IntegrityError:
+        # Another assignment seated one of the same students first
+        return Response(
+            {'error': 'Seats changed while assigning, please try again'},
+            status=status.HTTP_409_CONFLICT
+        )
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -1324,20 +1335,21 @@ def get_available_drivers_with_location(request):
     except ValueError:
         return Response({'error': 'Invalid coordinates'}, status=status.HTTP_400_BAD_REQUEST)
 
-    drivers = User.objects.filter(
+    drivers = list(User.objects.filter(
         role='DRIVER',
         driver_status='AVAILABLE'
-    ).exclude(assigned_bus__isnull=False)
+    ).exclude(assigned_bus__isnull=False))
+    
+    # Distances for every driver in one vectorized pass, 0 where unknown
+    distances = np.zeros(len(drivers))
+    if drivers and source_lat and source_lng:
+        distances = np.nan_to_num(distances_to_point(
+            [(driver.current_latitude, driver.current_longitude) for driver in drivers],
+            source_lat, source_lng
+        ))
     
     driver_list = []
-    for driver in drivers:
-        distance = 0
-        if driver.current_latitude and driver.current_longitude and source_lat and source_lng:
-            distance = calculate_distance(
-                float(source_lat), float(source_lng),
-                float(driver.current_latitude), float(driver.current_longitude)
-            )
-            
+    for driver, distance in zip(drivers, distances.tolist()):
         driver_list.append({
             'id': driver.id,
             'username': driver.username,
@@ -1358,32 +1370,36 @@ def get_available_drivers_with_location(request):
 @api_view(['GET'])
 @permission_classes([IsAdmin])
 def get_all_students(request):
-    students = User.objects.filter(role='STUDENT')
+    # Pending totals summed in the database over the same unpaid fees that are prefetched
+    unpaid = Q(fees__payment_status__in=UNPAID_FEE_STATUSES)
+    students = User.objects.filter(role='STUDENT').select_related(
+        'assigned_seat__bus'
+    ).prefetch_related(
+        Prefetch('fees', queryset=Fee.objects.filter(payment_status__in=UNPAID_FEE_STATUSES), to_attr='unpaid_fees')
+    ).annotate(
+        unpaid_total=Sum('fees__amount', filter=unpaid),
+        unpaid_paid=Sum('fees__paid_amount', filter=unpaid),
+        unpaid_pending=Sum('fees__pending_amount', filter=unpaid),
+        unpaid_count=Count('fees', filter=unpaid),
+    )
+    paginator = KeysetPagination(ordering=('id',))
+    students = paginator.paginate_queryset(students, request)
     student_list = []
     for student in students:
-        # Check if student already has a seat
-        assigned_seat = Seat.objects.filter(assigned_user=student).first()
-        
-        # Get unpaid fees with detailed breakdown
-        unpaid_fees = Fee.objects.filter(user=student, payment_status__in=['PENDING', 'OVERDUE', 'PARTIAL'])
-        fee_list = []
-        total_amount = 0
-        total_paid = 0
-        total_pending = 0
-        
-        for fee in unpaid_fees:
-            fee_list.append({
-                'id': fee.id,
-                'amount': str(fee.amount),
-                'paid_amount': str(fee.paid_amount),
-                'pending_amount': str(fee.pending_amount),
-                'description': f"{fee.month} {fee.year} - Bus Fee",
-                'due_date': fee.due_date.strftime('%Y-%m-%d'),
-                'payment_status': fee.payment_status
-            })
-            total_amount += fee.amount
-            total_paid += fee.paid_amount
-            total_pending += fee.pending_amount
+        try:
+            assigned_seat = student.assigned_seat
+        except Seat.DoesNotExist:
+            assigned_seat = None
+        
+        fee_list = [{
+            'id': fee.id,
+            'amount': str(fee.amount),
+            'paid_amount': str(fee.paid_amount),
+            'pending_amount': str(fee.pending_amount),
+            'description': f"{fee.month} {fee.year} - Bus Fee",
+            'due_date': fee.due_date.strftime('%Y-%m-%d'),
+            'payment_status': fee.payment_status
+        } for fee in student.unpaid_fees]
         
         student_list.append({
             'id': student.id,
@@ -1400,23 +1416,22 @@ def get_all_students(request):
             'gender': student.gender,
             'has_seat': assigned_seat is not None,
             'seat_details': {
-                'bus_number': assigned_seat.bus.bus_number if assigned_seat else None,
-                'seat_number': assigned_seat.seat_number if assigned_seat else None,
-                'route': f"{assigned_seat.bus.source} → {assigned_seat.bus.destination}" if assigned_seat else None
+                'bus_number': assigned_seat.bus.bus_number,
+                'seat_number': assigned_seat.seat_number,
+                'route': f"{assigned_seat.bus.source} → {assigned_seat.bus.destination}"
             } if assigned_seat else None,
-            'has_unpaid_fees': len(fee_list) > 0,
+            'has_unpaid_fees': student.unpaid_count > 0,
             'unpaid_fees': fee_list,
             'fee_summary': {
-                'total_amount': str(total_amount),
-                'paid_amount': str(total_paid),
-                'pending_amount': str(total_pending)
+                'total_amount': str(student.unpaid_total or 0),
+                'paid_amount': str(student.unpaid_paid or 0),
+                'pending_amount': str(student.unpaid_pending or 0)
             }
         })
     
-    return Response({
-        'students': student_list,
-        'total': len(student_list)
-    })
+    data = paginator.get_paginated_data(student_list, results_key='students')
+    data['total'] = User.objects.filter(role='STUDENT').count()
+    return Response(data)
 
 
 @api_view(['GET'])
@@ -1462,9 +1477,8 @@ def send_fee_reminder(request, student_id):
             message = f"⚠️ Fee Payment Reminder: You have an unpaid fee of ₹{fee.amount} for {fee.month} {fee.year}. Due date: {fee.due_date}. Please pay as soon as possible to avoid service interruption."
         else:
             # Send general reminder for all unpaid fees
-            unpaid_fees = Fee.objects.filter(user=student, payment_status__in=['PENDING', 'OVERDUE'])
-            total_amount = sum(fee.amount for fee in unpaid_fees)
-            message = f"⚠️ Fee Payment Reminder: You have {unpaid_fees.count()} unpaid fee(s) totaling ₹{total_amount}. Please clear your dues to continue using transport services."
+            balance = fee_balance(student)
+            message = f"⚠️ Fee Payment Reminder: You have {balance.unpaid_count} unpaid fee(s) totaling ₹{balance.pending_amount}. Please clear your dues to continue using transport services."
         
         NotificationService.send_notification(
             user=student,
@@ -1488,102 +1502,39 @@ def send_bulk_fee_reminder(request):
     - If no student_ids provided: Send to ALL unpaid students
     - If bus_id provided: Send to all unpaid students in that bus
     - If student_ids provided: Send to specific students
+    Runs as a background job, poll get_fee_reminder_job for progress.
     """
     try:
         student_ids = request.data.get('student_ids', [])
         bus_id = request.data.get('bus_id')
-        sender_role = request.user.role  # ADMIN or DRIVER
-        
-        # Determine which students to send reminders to
-        if bus_id:
-            # Get all students in the bus with unpaid fees
-            seats = Seat.objects.filter(bus_id=bus_id, is_available=False).select_related('assigned_user')
-            student_ids = [seat.assigned_user.id for seat in seats if seat.assigned_user]
-            unpaid_students = User.objects.filter(
-                id__in=student_ids,
-                role='STUDENT',
-                fees__payment_status__in=['PENDING', 'OVERDUE', 'PARTIAL']
-            ).distinct()
-        elif student_ids:
-            # Specific students
-            unpaid_students = User.objects.filter(
-                id__in=student_ids,
-                role='STUDENT',
-                fees__payment_status__in=['PENDING', 'OVERDUE', 'PARTIAL']
-            ).distinct()
-        else:
-            # All unpaid students
-            unpaid_students = User.objects.filter(
-                role='STUDENT',
-                fees__payment_status__in=['PENDING', 'OVERDUE', 'PARTIAL']
-            ).distinct()
-        
-        sent_count = 0
-        for student in unpaid_students:
-            # Get student's seat and bus info
-            seat = Seat.objects.filter(assigned_user=student).select_related('bus').first()
-            
-            if seat:
-                bus_info = f"Bus {seat.bus.bus_number} (Seat {seat.seat_number})"
-                route_info = f"{seat.bus.source} → {seat.bus.destination}"
-            else:
-                bus_info = "Not assigned to any bus"
-                route_info = "N/A"
-            
-            # Get unpaid fees
-            unpaid_fees = Fee.objects.filter(
-                user=student,
-                payment_status__in=['PENDING', 'OVERDUE', 'PARTIAL']
-            )
-            
-            total_amount = sum(fee.amount for fee in unpaid_fees)
-            paid_amount = sum(fee.paid_amount for fee in unpaid_fees)
-            pending_amount = sum(fee.pending_amount for fee in unpaid_fees)
-            
-            # Create detailed reminder message
-            sender_text = "Admin" if sender_role == 'ADMIN' else "Driver"
-            message = f"""
-🚨 FEE PAYMENT REMINDER (from {sender_text})
-
-Student: {student.first_name} {student.last_name}
-{bus_info}
-Route: {route_info}
-
-💰 Fee Details:
-Total Amount: ₹{total_amount}
-Paid Amount: ₹{paid_amount}
-Pending Amount: ₹{pending_amount}
-
-📅 Unpaid Fees: {unpaid_fees.count()}
-
-Please clear your pending dues at the earliest to continue using transport services.
-            """.strip()
-            
-            # Send notification
-            NotificationService.send_notification(
-                user=student,
-                message=message,
-                created_by=request.user
-            )
-            
-            # Update reminder tracking
-            for fee in unpaid_fees:
-                fee.reminder_sent_count += 1
-                fee.last_reminder_sent = timezone.now()
-                fee.reminder_sent_by = request.user
-                fee.save()
-            
-            sent_count += 1
+        
+        job = start_fee_reminder_job(request.user, bus_id=bus_id, student_ids=student_ids)
+        job.refresh_from_db()
         
         return Response({
-            'message': f'Fee reminders sent successfully to {sent_count} students',
-            'sent_count': sent_count
-        })
+            'message': f'Fee reminders queued for {job.total} students',
+            **job_progress(job)
+        }, status=status.HTTP_202_ACCEPTED)
         
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_fee_reminder_job(request, job_id):
+    """Progress of a bulk fee reminder job"""
+    try:
+        job = FeeReminderJob.objects.get(id=job_id)
+    except FeeReminderJob.DoesNotExist:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if request.user.role != 'ADMIN' and job.created_by_id != request.user.id:
+        return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+    
+    return Response(job_progress(job))
+
+
 # Partial Payment
 @api_view(['POST'])
 @permission_classes([IsAdmin])
@@ -1608,6 +1559,9 @@ def record_partial_payment(request):
         if fee.paid_amount + payment_amount > fee.amount:
             return Response({'error': 'Payment amount exceeds pending amount'}, status=status.HTTP_400_BAD_REQUEST)
         
+        if transaction_id and FeePayment.objects.filter(transaction_id=transaction_id).exists():
+            return Response({'error': 'This transaction has already been recorded'}, status=status.HTTP_400_BAD_REQUEST)
+        
         # Update fee
         fee.paid_amount += payment_amount
         fee.payment_method = payment_method
@@ -1616,7 +1570,16 @@ def record_partial_payment(request):
         if fee.paid_amount >= fee.amount:
             fee.paid_date = date.today()
         
-        fee.save()  # Auto-calculates pending_amount and updates status
+        with transaction.atomic():
+            fee.save()  # Auto-calculates pending_amount and updates status
+            FeePayment.objects.create(
+                fee=fee,
+                amount=payment_amount,
+                transaction_id=transaction_id or None,
+                payment_method=payment_method,
+                paid_date=date.today(),
+                recorded_by=request.user
+            )
         
         # Send confirmation notification
         NotificationService.send_notification(
@@ -1636,34 +1599,140 @@ def record_partial_payment(request):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['POST'])
+@permission_classes([IsAdmin])
+@parser_classes([MultiPartParser])
+def import_payments(request):
+    """
+    Apply a bank or gateway settlement file (CSV or JSON lines) to fees.
+    Rows need transaction_id and amount. The fee is the unpaid one carrying
+    that transaction_id, else the one of student_id or username and
+    month/year. Returns the counts and the rows that could
+    not be applied.
+    """
+    try:
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            file_format = detect_format(upload.name, request.data.get('format'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        exceptions = []
+        
+        def report(exception):
+            if len(exceptions) < MAX_REPORTED_EXCEPTIONS:
+                exceptions.append(exception)
+        
+        counts = PaymentImporter(recorded_by=request.user, on_exception=report).run(
+            read_rows(decode_lines(upload), file_format)
+        )
+        rejected = counts['rows'] - counts['applied']
+        return Response({
+            'message': f"Applied {counts['applied']} of {counts['rows']} payments",
+            'counts': {**counts, 'amount_applied': str(counts['amount_applied'])},
+            'exceptions': exceptions,
+            'exceptions_truncated': rejected > len(exceptions)
+        })
+    except UnicodeDecodeError:
+        return Response({'error': 'File must be UTF-8 encoded'}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# Query parameters of export requests that are not filters
+EXPORT_PARAMS = {'output', 'columns'}
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def list_exports(request):
+    """The exportable datasets with their columns and filters"""
+    return Response({
+        'exports': [dataset.describe() for dataset in EXPORTS.values()],
+        'formats': EXPORT_FORMATS,
+        'parquet_available': parquet_available()
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdmin])
+def export_dataset(request, dataset):
+    """
+    Stream a dataset as CSV (default) or Parquet (?output=parquet), reading
+    it in chunks straight from the database. ?columns=a,b picks the columns;
+    any other query parameter is one of the dataset's filters.
+    """
+    try:
+        file_format = request.query_params.get('output', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            raise ExportError(f"Unsupported output '{file_format}', use csv or parquet")
+        export = get_dataset(dataset)
+        columns = export.select(request.query_params.get('columns'))
+        rows = export.rows(columns, {
+            name: value for name, value in request.query_params.items() if name not in EXPORT_PARAMS
+        })
+        if file_format == 'parquet' and not parquet_available():
+            raise ExportError('Parquet export needs pyarrow on the server')
+        chunks = stream_export(export, columns, rows, file_format)
+    except ExportError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[file_format])
+    filename = f"{dataset}-{date.today().isoformat()}.{file_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdmin])
+def request_profile(request):
+    """
+    Slowest endpoints recorded by the profiling middleware across all web
+    processes (?sort=p95_ms|total_ms|avg_queries|duplicates|..., ?limit=20).
+    DELETE clears the profile.
+    """
+    if not settings.REQUEST_PROFILING:
+        return Response({'error': 'Request profiling is off, set REQUEST_PROFILING=True'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        if request.method == 'DELETE':
+            profiler.reset()
+            clear_snapshots(settings.REQUEST_PROFILING_DIR)
+            return Response({'message': 'Profile cleared'})
+
+        sort = request.query_params.get('sort', 'p95_ms')
+        if sort not in SORT_KEYS:
+            return Response({'error': f"sort must be one of {', '.join(SORT_KEYS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(current_report(sort, limit))
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 def create_fee_for_student(student, distance_km=None):
     """
     Create a monthly fee for a student based on their home location distance
     If distance is not provided, try to calculate from home_location coordinates
     """
-    from datetime import date, timedelta
     from decimal import Decimal
     
     # Try to parse coordinates from home_location if distance not provided
     if distance_km is None:
         # Assume home_location format: "City Name (lat,lon)" or just use default
         # For now, use a default distance if not calculable
-        distance_km = 15  # Default to mid-range
+        distance_km = DEFAULT_FEE_DISTANCE_KM
     
     # Calculate fee amount based on distance
     fee_amount = calculate_bus_fee_from_distance(distance_km)
     
-    # Get current month and year
-    current_date = date.today()
-    month_name = current_date.strftime('%B')
-    year = current_date.year
-    
-    # Set due date to end of current month
-    if current_date.month == 12:
-        next_month = date(year + 1, 1, 1)
-    else:
-        next_month = date(year, current_date.month + 1, 1)
-    due_date = next_month - timedelta(days=1)
+    # Current month, due at the end of the month
+    month_name, year, due_date = current_fee_period()
     
     # Create or update fee
     fee, created = Fee.objects.get_or_create(
@@ -1681,7 +1750,7 @@ def create_fee_for_student(student, distance_km=None):
         # Send notification to student
         NotificationService.send_notification(
             user=student,
-            message=f"💰 Bus fee assigned: ₹{fee_amount} for {month_name} {year}. Due date: {due_date}. Distance from university: {distance_km:.1f} km",
+            message=fee_assigned_message(fee_amount, month_name, year, due_date, distance_km),
             created_by=None
         )
     
@@ -1855,142 +1924,27 @@ def auto_assign_students_to_bus(request):
         return Response({'error': 'bus_id is required'}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        bus = Bus.objects.get(id=bus_id)
-        
-        # Get all seats for this bus, exclude driver seat (seat 1)
-        all_seats = Seat.objects.filter(bus=bus).exclude(seat_number=1).order_by('seat_number')
-        available_seats = all_seats.filter(is_available=True)
-        
-        if available_seats.count() == 0:
-            return Response({'error': 'No available seats on this bus'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Get unassigned students
-        assigned_student_ids = Seat.objects.filter(assigned_user__isnull=False).values_list('assigned_user_id', flat=True)
-        unassigned_students = User.objects.filter(role='STUDENT').exclude(id__in=assigned_student_ids)
-        
-        # Filter students whose home location matches bus source or is along the route
-        # Match by checking if student's home_location contains bus source or nearby areas
-        matching_students = []
-        for student in unassigned_students:
-            if student.home_location:
-                # Case-insensitive matching
-                home_loc = student.home_location.lower()
-                bus_source = bus.source.lower()
-                bus_dest = bus.destination.lower()
-                
-                # Check if home location matches source or destination
-                if bus_source in home_loc or home_loc in bus_source:
-                    matching_students.append(student)
-        
-        # If no matching students, use all unassigned students
-        if not matching_students:
-            matching_students = list(unassigned_students)
-        
-        # Separate by gender
-        female_students = [s for s in matching_students if s.gender == 'FEMALE']
-        male_students = [s for s in matching_students if s.gender == 'MALE']
-        other_students = [s for s in matching_students if s.gender not in ['MALE', 'FEMALE']]
-        
-        # Split seats into front half (for girls) and back half (for boys)
-        total_available = available_seats.count()
-        half_point = total_available // 2
-        
-        front_seats = list(available_seats[:half_point])  # Girls
-        back_seats = list(available_seats[half_point:])   # Boys
-        
-        assigned_count = 0
-        assignments = []
-        location_matched = 0
-        
-        # Assign females to front seats
-        for i, student in enumerate(female_students):
-            if i >= len(front_seats):
-                break
-            seat = front_seats[i]
-            seat.assigned_user = student
-            seat.is_available = False
-            seat.save()
-            
-            # Create fee for student (use default distance for now)
-            create_fee_for_student(student, distance_km=15)
-            
-            # Check if location matched
-            is_matched = bus.source.lower() in student.home_location.lower() if student.home_location else False
-            if is_matched:
-                location_matched += 1
-            
-            assigned_count += 1
-            assignments.append({
-                'student': f"{student.first_name} {student.last_name}",
-                'seat': seat.seat_number,
-                'section': 'Front (Girls)',
-                'home_location': student.home_location or 'N/A',
-                'location_matched': is_matched
-            })
-        
-        # Assign males to back seats
-        for i, student in enumerate(male_students):
-            if i >= len(back_seats):
-                break
-            seat = back_seats[i]
-            seat.assigned_user = student
-            seat.is_available = False
-            seat.save()
-            
-            # Create fee for student (use default distance for now)
-            create_fee_for_student(student, distance_km=15)
-            
-            # Check if location matched
-            is_matched = bus.source.lower() in student.home_location.lower() if student.home_location else False
-            if is_matched:
-                location_matched += 1
-            
-            assigned_count += 1
-            assignments.append({
-                'student': f"{student.first_name} {student.last_name}",
-                'seat': seat.seat_number,
-                'section': 'Back (Boys)',
-                'home_location': student.home_location or 'N/A',
-                'location_matched': is_matched
-            })
-        
-        # Assign others to remaining seats
-        remaining_seats = [s for s in front_seats[len(female_students):]] + [s for s in back_seats[len(male_students):]]
-        for i, student in enumerate(other_students):
-            if i >= len(remaining_seats):
-                break
-            seat = remaining_seats[i]
-            seat.assigned_user = student
-            seat.is_available = False
-            seat.save()
-            
-            # Create fee for student (use default distance for now)
-            create_fee_for_student(student, distance_km=15)
-            
-            # Check if location matched
-            is_matched = bus.source.lower() in student.home_location.lower() if student.home_location else False
-            if is_matched:
-                location_matched += 1
-            
-            assigned_count += 1
-            assignments.append({
-                'student': f"{student.first_name} {student.last_name}",
-                'seat': seat.seat_number,
-                'section': 'Mixed',
-                'home_location': student.home_location or 'N/A',
-                'location_matched': is_matched
-            })
+        # Seats are planned in memory and written in bulk under row locks
+        bus, assignments = BulkAssignmentService.assign_students_to_bus(bus_id)
         
         return Response({
-            'message': f'Successfully assigned {assigned_count} students and created their bus fees',
+            'message': f'Successfully assigned {len(assignments)} students and created their bus fees',
             'bus': f"Bus {bus.bus_number} ({bus.source} → {bus.destination})",
-            'total_assigned': assigned_count,
-            'location_matched': location_matched,
+            'total_assigned': len(assignments),
+            'location_matched': sum(1 for a in assignments if a['location_matched']),
             'assignments': assignments
         })
         
     except Bus.DoesNotExist:
         return Response({'error': 'Bus not found'}, status=status.HTTP_404_NOT_FOUND)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except IntegrityError:
+        # Another assignment seated one of the same students first
+        return Response(
+            {'error': 'Seats changed while assigning, please try again'},
+            status=status.HTTP_409_CONFLICT
+        )
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -2063,15 +2017,12 @@ def submit_student_query(request):
         )
         
         # Notify all admins
-        admins = User.objects.filter(role='ADMIN')
         student_name = "Anonymous Student" if anonymous else f"{student.first_name} {student.last_name}"
-        
-        for admin in admins:
-            NotificationService.send_notification(
-                user=admin,
-                message=f"📝 New Query from {student_name} | Bus {bus.bus_number} | Seat {seat_number} | Subject: {subject}",
-                created_by=None if anonymous else student
-            )
+        NotificationService.notify_role(
+            'ADMIN',
+            f"📝 New Query from {student_name} | Bus {bus.bus_number} | Seat {seat_number} | Subject: {subject}",
+            created_by=None if anonymous else student
+        )
         
         from .serializers import StudentQuerySerializer
         return Response({
@@ -2091,16 +2042,20 @@ def get_student_queries(request):
         user = request.user
         
         if user.role == 'ADMIN':
-            queries = StudentQuery.objects.all().order_by('-created_at')
+            queries = StudentQuery.objects.all()
         elif user.role == 'STUDENT':
-            queries = StudentQuery.objects.filter(student=user).order_by('-created_at')
+            queries = StudentQuery.objects.filter(student=user)
         else:
             return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
         
         from .serializers import StudentQuerySerializer
-        serializer = StudentQuerySerializer(queries, many=True)
-        return Response(serializer.data)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(queries, request)
+        serializer = StudentQuerySerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
         
+    except NotFound as e:
+        return Response({'error': str(e.detail)}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
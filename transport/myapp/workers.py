@@ -0,0 +1,59 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+logger = logging.getLogger(__name__)
+
+# Worker threads also poll, to pick up work queued by other processes
+POLL_SECONDS = 5
+
+
+class BackgroundWorker:
+    """
+    Runs `run_pending()` off the request path.
+
+    The setting named by `mode_setting` picks how: 'thread' (a daemon thread
+    per process, woken by `wake()` and polling every `poll_seconds`),
+    'inline' (`wake()` runs the work straight away, e.g. in tests) or
+    'command' (`wake()` does nothing and a management command runs it).
+    """
+    mode_setting = None
+    thread_name = 'background-worker'
+    poll_seconds = POLL_SECONDS
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def run_pending(self):
+        raise NotImplementedError
+
+    def wake(self):
+        mode = getattr(settings, self.mode_setting, 'thread')
+        if mode == 'inline':
+            self.run_pending()
+        elif mode == 'thread':
+            self._ensure_thread()
+            self._wakeup.set()
+
+    def _ensure_thread(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+            try:
+                close_old_connections()
+                self.run_pending()
+            except Exception:
+                logger.exception('%s failed', self.thread_name)
+            finally:
+                close_old_connections()
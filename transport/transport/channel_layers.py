@@ -0,0 +1,55 @@
+"""
+CHANNEL_LAYERS built from the environment.
+
+With CHANNEL_REDIS_URLS set (comma-separated redis:// URLs of any
+Redis-protocol server) group broadcasts reach every ASGI worker; several URLs
+shard channels and groups across the servers by consistent hashing. Without
+it the in-memory layer only reaches sockets in the same process.
+
+CHANNEL_LAYER_BACKEND picks the layer class. Each backend is only given the
+config keys it accepts: the pub/sub layer takes no capacity or expiry.
+"""
+import os
+
+
+DEFAULT_BACKEND = 'channels_redis.core.RedisChannelLayer'
+IN_MEMORY_BACKEND = 'channels.layers.InMemoryChannelLayer'
+
+# Config keys each backend accepts; any other backend gets hosts and prefix
+BACKEND_CONFIG_KEYS = {
+    'channels_redis.core.RedisChannelLayer': ('hosts', 'prefix', 'capacity', 'expiry', 'group_expiry'),
+    'channels_redis.pubsub.RedisPubSubChannelLayer': ('hosts', 'prefix'),
+    IN_MEMORY_BACKEND: ('capacity', 'expiry', 'group_expiry'),
+}
+
+
+def redis_urls(environ=os.environ):
+    return [
+        url.strip()
+        for url in environ.get('CHANNEL_REDIS_URLS', environ.get('REDIS_URL', '')).split(',')
+        if url.strip()
+    ]
+
+
+def channel_layers(environ=os.environ):
+    """The CHANNEL_LAYERS setting for an environment mapping"""
+    hosts = redis_urls(environ)
+    if not hosts:
+        return {'default': {'BACKEND': IN_MEMORY_BACKEND}}
+
+    backend = environ.get('CHANNEL_LAYER_BACKEND', DEFAULT_BACKEND)
+    config = {
+        'hosts': hosts,
+        'prefix': environ.get('CHANNEL_REDIS_PREFIX', 'transport'),
+        # Location updates are frequent and short-lived, drop rather than queue
+        'capacity': int(environ.get('CHANNEL_LAYER_CAPACITY', '200')),
+        'expiry': int(environ.get('CHANNEL_LAYER_EXPIRY', '10')),
+        'group_expiry': int(environ.get('CHANNEL_LAYER_GROUP_EXPIRY', '86400')),
+    }
+    accepted = BACKEND_CONFIG_KEYS.get(backend, ('hosts', 'prefix'))
+    return {
+        'default': {
+            'BACKEND': backend,
+            'CONFIG': {key: value for key, value in config.items() if key in accepted},
+        },
+    }
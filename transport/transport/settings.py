@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from pathlib import Path
 
+from transport.channel_layers import channel_layers, redis_urls
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -21,6 +23,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 # SECURITY WARNING: keep the secret key used in production secret!
 import os
+import tempfile
 SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'django-insecure-)f(dhhxmg9o0gbjn8m%t7gj%fbvwmn8%6ufuinyl2gu7rooe%o')
 
 # SECURITY WARNING: don't run with debug turned on in production!
@@ -46,13 +49,32 @@ INSTALLED_APPS = [
 ]
 
 ASGI_APPLICATION = 'transport.asgi.application'
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-    },
-}
+
+# Channel layer: Redis-protocol servers from CHANNEL_REDIS_URLS, in-memory
+# without them (see transport/channel_layers.py)
+CHANNEL_REDIS_URLS = redis_urls()
+CHANNEL_LAYERS = channel_layers()
+
+# How queued notifications are expanded: 'thread' (background thread in every
+# web process), 'inline' (in the request, after commit) or 'command' (only by
+# `manage.py dispatch_notifications --loop`)
+NOTIFICATION_DISPATCH_MODE = os.environ.get('NOTIFICATION_DISPATCH_MODE', 'thread')
+
+# Same choices for long-running jobs such as bulk fee reminders; 'command'
+# leaves them to `manage.py run_background_jobs --loop`
+BACKGROUND_JOB_MODE = os.environ.get('BACKGROUND_JOB_MODE', 'thread')
+
+# Per-endpoint timing, query count and N+1 profiling (myapp.profiling). Off by
+# default, in which case the middleware removes itself at startup
+REQUEST_PROFILING = os.environ.get('REQUEST_PROFILING', 'False') == 'True'
+
+# Where every web process saves its profile for `manage.py profiling_report`
+REQUEST_PROFILING_DIR = os.environ.get(
+    'REQUEST_PROFILING_DIR', os.path.join(tempfile.gettempdir(), 'transport-profiling')
+)
 
 MIDDLEWARE = [
+    'myapp.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -164,6 +186,8 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Cursor pages of 50 (?page_size= up to 200), see myapp/pagination.py
+    'DEFAULT_PAGINATION_CLASS': 'myapp.pagination.KeysetPagination',
 }
 
 # JWT Settings